@@ -171,10 +171,68 @@ AUTH_USER_MODEL = "Filmaffinity.PlatformUsers"
 
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    # The users are authenticated with the token of the 'session' cookie
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'Filmaffinity.authentication.SessionCookieTokenAuthentication',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10  # Default page size
 }
 
+# Maximum page size that the clients can ask for with the page_size param
+MAX_PAGE_SIZE = 100
+
+# Maximum number of ratings of a request to the bulk ratings endpoint
+MAX_BULK_RATINGS = 10000
+
+# Cache of the users of the session tokens (size in entries, ttl in seconds).
+# It is kept in the memory of each process, and a logout or a deleted user
+# only removes the entries of the process that handles it: the other
+# processes may accept the old token for up to SESSION_TOKEN_CACHE_TTL seconds
+SESSION_TOKEN_CACHE_SIZE = 1024
+SESSION_TOKEN_CACHE_TTL = 5
+
+# Cache of the responses of the movies (list pages and details).
+# By default each process keeps its own cache in memory, and a change only
+# invalidates the responses of the process that makes it: with several
+# processes the others may return the old responses for RESPONSE_CACHE_TTL
+# seconds, and a warning is logged. If REDIS_URL is set, the cache is shared
+# by all the processes
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'responses': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'responses',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+if os.environ.get('REDIS_URL'):
+    CACHES['responses'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['REDIS_URL'],
+    }
+RESPONSE_CACHE_ALIAS = 'responses'
+RESPONSE_CACHE_TTL = 300
+
+# Number of threads of each process that generate the variants of the posters.
+# With 0 they are generated in the request that saves the poster
+POSTER_WORKERS = 2
+
+# Internal location of the media files in the front proxy (nginx). If it is set,
+# the posters are sent by the proxy with the X-Accel-Redirect header instead of Django
+MEDIA_ACCEL_REDIRECT = os.environ.get('MEDIA_ACCEL_REDIRECT')
+
+# Number of ratings a movie needs to enter the top charts. It is also the
+# weight of the mean rating in the weighted rating of the movies
+CHART_MIN_RATINGS = 10
+
+# Directory of the recommendation models trained by train_recommendations.
+# The web processes map the current model in memory from it
+RECOMMENDATION_MODEL_DIR = os.environ.get('RECOMMENDATION_MODEL_DIR',
+                                          os.path.join(BASE_DIR, 'recommendations'))
+
 SPECTACULAR_SETTINGS = {
     'TITLE': 'Filmaffinity',
     'DESCRIPTION': 'API for Filmaffinity clone project',
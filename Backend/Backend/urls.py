@@ -16,14 +16,17 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path
-from django.conf.urls.static import static
 from django.conf import settings
 from django.urls import include
 from drf_spectacular.views import SpectacularAPIView, SpectacularRedocView
 
+from Filmaffinity.media import POSTERS_DIRECTORY, serve_media
+
 urlpatterns = [
     path("admin/", admin.site.urls),
     path('schema/', SpectacularAPIView.as_view(), name='schema'),
     path('schema/redoc/', SpectacularRedocView.as_view(url_name='schema'), name='redoc'),
     path("filmaffinity/", include("Filmaffinity.urls")),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    # The posters are served in production too, see serve_media
+    path(f"{settings.MEDIA_URL.lstrip('/')}{POSTERS_DIRECTORY}/<path:path>", serve_media, name='poster-media'),
+]
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class FilmaffinityConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "Filmaffinity"
+
+    def ready(self):
+        # Connect the signals that keep the denormalized data up to date
+        from . import signals  # noqa: F401
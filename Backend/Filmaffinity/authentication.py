@@ -0,0 +1,93 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from rest_framework.authentication import BaseAuthentication
+from rest_framework.authtoken.models import Token
+
+
+class TokenUserCache:
+    """
+    In-process LRU cache of the users of the session tokens.
+    The entries expire after ttl seconds and the oldest entries
+    are evicted when there are more than max_size. The invalidations
+    only reach the process that makes them, so the ttl is the time
+    the other processes may accept a token that has been removed.
+    """
+
+    def __init__(self, max_size=1024, ttl=5):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            user, expires = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+        # Each request gets its own copy, so changes made to the user
+        # while handling a request are not shared with other threads
+        return copy.copy(user)
+
+    def set(self, key, user):
+        with self._lock:
+            self._entries[key] = (user, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            for key in [key for key, (user, _) in self._entries.items() if user.pk == user_id]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+token_user_cache = TokenUserCache(
+    max_size=getattr(settings, 'SESSION_TOKEN_CACHE_SIZE', 1024),
+    ttl=getattr(settings, 'SESSION_TOKEN_CACHE_TTL', 5),
+)
+
+
+class SessionCookieTokenAuthentication(BaseAuthentication):
+    """
+    Authenticates the user with the token stored in the 'session' cookie.
+
+    The token is resolved together with its user in a single query
+    and the result is cached, so the next requests of the same session
+    do not query the database.
+    If there is no cookie or the token does not exist, the request
+    is anonymous and each view decides what to do.
+    """
+    cookie_name = 'session'
+
+    def authenticate(self, request):
+        key = request.COOKIES.get(self.cookie_name)
+        if not key:
+            return None
+
+        user = token_user_cache.get(key)
+        if user is None:
+            token = Token.objects.select_related('user').filter(key=key).first()
+            if token is None or not token.user.is_active:
+                return None
+            user = token.user
+            token_user_cache.set(key, user)
+            user = copy.copy(user)
+
+        return (user, key)
@@ -0,0 +1,244 @@
+import hashlib
+import logging
+import uuid
+import weakref
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.db.models import F, Max
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+from .models import CatalogVersion, Movies
+
+logger = logging.getLogger(__name__)
+
+# Parts of the catalog with their own version. The version of 'ratings' is only
+# increased when every movie is rebuilt, see get_ratings_version
+CATALOG_SCOPES = ('movies', 'actors', 'directors', 'categories', 'ratings', 'similar', 'charts')
+
+# Groups of cached responses of the movies, see invalidate_movie_responses
+MOVIE_LIST_GROUP = 'movies:list'
+MOVIE_ALL_GROUP = 'movies:all'
+# Responses whose movies are chosen by their ratings
+MOVIE_RATINGS_GROUP = 'movies:ratings'
+
+# Fields of the movies that change with their ratings
+MOVIE_RATING_FIELDS = ('rating_count', 'rating_sum', 'average_rating')
+
+# Caches of the responses already reported as local to each process
+_local_caches = weakref.WeakSet()
+
+
+def bump_catalog_version(*scopes):
+    """
+    Increases the version of the parts of the catalog that have changed.
+    It is a single UPDATE, done in the transaction of the change, so the
+    new version is visible at the same time as the new data.
+    """
+    updated = CatalogVersion.objects.filter(scope__in=scopes).update(
+        version=F('version') + 1,
+        updated_at=timezone.now(),
+    )
+
+    # The rows are created by the migrations, but they may have been removed
+    if updated < len(scopes):
+        CatalogVersion.objects.bulk_create(
+            [CatalogVersion(scope=scope, version=1) for scope in scopes],
+            ignore_conflicts=True,
+        )
+
+
+def get_catalog_versions(scopes):
+    """
+    Returns the version and the date of the last change of each scope.
+    """
+    versions = {scope: (0, None) for scope in scopes}
+    for scope, version, updated_at in CatalogVersion.objects.filter(
+            scope__in=scopes).values_list('scope', 'version', 'updated_at'):
+        versions[scope] = (version, updated_at)
+    return versions
+
+
+def get_ratings_version(movie_id=None):
+    """
+    Returns the version and the date of the last change of the ratings of
+    the movie, or of any movie if movie_id is None. The ratings do not share
+    a version row, which every rating would lock: the date is read from the
+    index of the dates of the movies.
+    """
+    movies = Movies.objects.all() if movie_id is None else Movies.objects.filter(pk=movie_id)
+    updated_at = movies.aggregate(updated_at=Max('ratings_updated_at'))['updated_at']
+    return (updated_at.isoformat() if updated_at else 0, updated_at)
+
+
+class ConditionalGetMixin:
+    """
+    Adds an ETag and a Last-Modified header to the GET responses of the view,
+    computed from the versions of the parts of the catalog listed in
+    'catalog_scopes'. If the client already has the current response,
+    a 304 is returned without querying the data or serializing it.
+
+    The response may only depend on the url, on those parts of the catalog
+    and on the ratings versioned by get_movie_ratings_version.
+    """
+    catalog_scopes = CATALOG_SCOPES
+
+    def get_movie_ratings_version(self, request):
+        """
+        Returns the version of the ratings of the movies shown in the response,
+        see get_ratings_version, or None if it does not show any rating.
+        """
+        return None
+
+    def get(self, request, *args, **kwargs):
+        versions = get_catalog_versions(self.catalog_scopes)
+        ratings_version = self.get_movie_ratings_version(request)
+        if ratings_version is not None:
+            versions['movie-ratings'] = ratings_version
+        etag = self.get_etag(request, versions)
+        dates = [updated_at for _, updated_at in versions.values() if updated_at is not None]
+        last_modified = int(max(dates).timestamp()) if dates else None
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+            # Errors are not revalidated
+            if response.status_code != 200:
+                return response
+
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        # The clients must check with us before using what they have
+        patch_cache_control(response, no_cache=True)
+        return response
+
+    def get_etag(self, request, versions):
+        """
+        Returns the strong ETag of the response for the versions of the catalog.
+        """
+        key = request.get_full_path() + ''.join(
+            f'|{scope}:{version}' for scope, (version, _) in sorted(versions.items()))
+        return '"%s"' % hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def get_response_cache():
+    """
+    Returns the cache of the responses, configured in settings.CACHES.
+    A cache in the memory of each process works, but the changes only
+    invalidate the responses of the process that makes them, so the
+    other processes may return the old ones for RESPONSE_CACHE_TTL seconds.
+    """
+    cache = caches[getattr(settings, 'RESPONSE_CACHE_ALIAS', 'default')]
+    if isinstance(cache, LocMemCache) and cache not in _local_caches:
+        _local_caches.add(cache)
+        logger.warning('The responses are cached in the memory of each process: a change only '
+                       'invalidates the responses of the process that makes it. '
+                       'Set REDIS_URL to share the cache between the processes')
+    return cache
+
+
+def get_cache_tokens(groups):
+    """
+    Returns the current token of each group of cached responses.
+    The tokens are part of the keys of the responses, so changing
+    the token of a group invalidates all its responses at once.
+    """
+    cache = get_response_cache()
+    keys = [f'token:{group}' for group in groups]
+    tokens = cache.get_many(keys)
+    for key in keys:
+        if key not in tokens:
+            # If another process has just created the token, we use that one
+            cache.add(key, uuid.uuid4().hex, timeout=None)
+            tokens[key] = cache.get(key)
+    return [tokens[key] for key in keys]
+
+
+def invalidate_movie_responses(movie_ids=None, ratings_only=False):
+    """
+    Invalidates the cached pages of the movie list and the cached details
+    of the movies, or of every movie if movie_ids is None.
+
+    If only the ratings of the movies have changed, the pages of the list
+    are kept, as their ratings are read again when they are returned (see
+    ResponseCacheMixin.update_cached_data), but not the pages whose movies
+    are chosen by their ratings.
+
+    The tokens are changed now and again after the commit: a request
+    that reads the old data before the commit could store it with
+    the token of the first change, but not with the second one.
+    """
+    cache = get_response_cache()
+    groups = [MOVIE_RATINGS_GROUP] if ratings_only else [MOVIE_LIST_GROUP]
+    if movie_ids is None:
+        groups.append(MOVIE_ALL_GROUP)
+    else:
+        groups += [f'movies:detail:{pk}' for pk in movie_ids]
+
+    def rotate():
+        cache.set_many({f'token:{group}': uuid.uuid4().hex for group in groups}, timeout=None)
+
+    rotate()
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(rotate)
+
+
+def refresh_movie_ratings(movies):
+    """
+    Updates the fields that change with the ratings in the serialized
+    movies, from the current aggregates of the movies, in a single query.
+    """
+    ratings = {pk: values for pk, *values in Movies.objects.filter(
+        pk__in=[movie['id'] for movie in movies]).values_list('pk', *MOVIE_RATING_FIELDS)}
+    for movie in movies:
+        if movie['id'] in ratings:
+            movie.update(zip(MOVIE_RATING_FIELDS, ratings[movie['id']]))
+    return movies
+
+
+class ResponseCacheMixin:
+    """
+    Keeps the data of the successful GET responses of the view in the
+    response cache, so the same request is not queried and serialized again.
+
+    The key of a response is made of the tokens of the groups returned by
+    get_response_cache_groups and of the url with its params sorted, without
+    the params that have their default value.
+    """
+    response_cache_defaults = {}
+
+    def get_response_cache_groups(self):
+        raise NotImplementedError('The view must define the groups of its responses')
+
+    def update_cached_data(self, data):
+        """
+        Returns the data of a cached response with the parts that may have
+        changed without invalidating it updated.
+        """
+        return data
+
+    def get_response_cache_key(self, request):
+        params = sorted((key, value) for key, values in request.query_params.lists()
+                        for value in values if self.response_cache_defaults.get(key) != value)
+        url = request.build_absolute_uri(request.path) + '?' + urlencode(params)
+        tokens = get_cache_tokens(self.get_response_cache_groups())
+        return 'response:%s:%s' % (':'.join(tokens), hashlib.sha1(url.encode('utf-8')).hexdigest())
+
+    def get(self, request, *args, **kwargs):
+        cache = get_response_cache()
+        key = self.get_response_cache_key(request)
+        data = cache.get(key)
+        if data is not None:
+            return Response(self.update_cached_data(data))
+
+        response = super().get(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, getattr(settings, 'RESPONSE_CACHE_TTL', 300))
+        return response
@@ -0,0 +1,123 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import FloatField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce
+from rest_framework.exceptions import ValidationError
+
+from .caching import bump_catalog_version
+from .models import ChartEntry, ChartPrior, Movies
+
+
+def min_ratings():
+    """
+    Returns the number of ratings a movie needs to enter the charts, which is
+    also the weight of the mean rating in its weighted rating.
+    """
+    return max(getattr(settings, 'CHART_MIN_RATINGS', 10), 1)
+
+
+def weighted_rating(rating_sum, rating_count, mean_rating, minimum):
+    """
+    Returns the weighted rating of a movie, as in the top charts of IMDb:
+    its average rating pulled towards the mean rating of all the movies,
+    as if it had 'minimum' more ratings with the mean. A movie with a few
+    high ratings does not rank above one with thousands of them.
+    """
+    return (rating_sum + minimum * mean_rating) / (rating_count + minimum)
+
+
+def decade_key(year):
+    return str(year // 10 * 10)
+
+
+def chart_key(chart, value):
+    """
+    Returns the key of the chart of the 'key' param of a request.
+    Raises ValidationError if it is missing or not valid.
+    """
+    if chart == ChartEntry.OVERALL:
+        return ''
+    if not value or not value.strip():
+        raise ValidationError(f'The {chart} of the chart is required')
+    if chart == ChartEntry.DECADE:
+        # Both 1990 and 1990s are the nineties
+        try:
+            return decade_key(int(value.strip().rstrip('s')))
+        except ValueError:
+            raise ValidationError('Decade must be a year')
+    return value.strip().lower()
+
+
+def update_chart_prior():
+    """
+    Computes the mean of all the ratings from the rating aggregates of the
+    movies and stores it. Returns the mean, 0 if there are no ratings.
+    """
+    totals = Movies.objects.aggregate(total=Sum('rating_sum'), count=Sum('rating_count'))
+    mean_rating = totals['total'] / totals['count'] if totals['count'] else 0.0
+    ChartPrior.objects.update_or_create(pk=1, defaults={'mean_rating': mean_rating})
+    return mean_rating
+
+
+def refresh_chart_entries(movie_ids=None):
+    """
+    Rebuilds the chart entries of the movies from their stored rating
+    aggregates: an entry in the overall chart, in the chart of its decade,
+    of its language and of each of its genres, if the movie has enough
+    ratings. If movie_ids is None, all the charts are rebuilt and the mean
+    rating is computed again. Returns the number of entries created.
+    """
+    if movie_ids is None:
+        mean_rating = update_chart_prior()
+    else:
+        mean_rating = ChartPrior.objects.values_list('mean_rating', flat=True).first()
+        if mean_rating is None:
+            mean_rating = update_chart_prior()
+
+    minimum = min_ratings()
+    movies = Movies.objects.filter(rating_count__gte=minimum).order_by()
+    entries = ChartEntry.objects.all()
+    if movie_ids is not None:
+        movies = movies.filter(pk__in=movie_ids)
+        entries = entries.filter(movie_id__in=movie_ids)
+
+    rows = list(movies.values_list('pk', 'rating_sum', 'rating_count', 'release_date', 'language'))
+    genres = {}
+    if rows:
+        for movie_id, genre in (Movies.genres.through.objects.filter(movies__in=movies)
+                                .values_list('movies_id', 'categories__name')):
+            genres.setdefault(movie_id, []).append(genre)
+
+    new_entries = []
+    for movie_id, rating_sum, rating_count, release_date, language in rows:
+        weighted = weighted_rating(rating_sum, rating_count, mean_rating, minimum)
+        keys = [(ChartEntry.OVERALL, ''),
+                (ChartEntry.DECADE, decade_key(release_date.year)),
+                (ChartEntry.LANGUAGE, language.lower())]
+        keys.extend((ChartEntry.GENRE, genre.lower()) for genre in genres.get(movie_id, ()))
+        new_entries.extend(ChartEntry(chart=chart, key=key, movie_id=movie_id, weighted_rating=weighted)
+                           for chart, key in keys)
+
+    with transaction.atomic():
+        entries.delete()
+        ChartEntry.objects.bulk_create(new_entries, batch_size=5000)
+        if movie_ids is None:
+            bump_catalog_version('charts')
+    return len(new_entries)
+
+
+def update_chart_ratings(movie_id):
+    """
+    Updates the weighted rating of the chart entries of a movie from its
+    rating aggregates and the stored mean rating, in a single UPDATE.
+    The charts of the movie stay the same, so its entries are not read or
+    created again. Returns the number of entries updated.
+    """
+    minimum = min_ratings()
+    movie = Movies.objects.filter(pk=OuterRef('movie_id'))
+    mean_rating = Coalesce(Subquery(ChartPrior.objects.filter(pk=1).values('mean_rating')), Value(0.0))
+    rating_sum = Cast(Subquery(movie.values('rating_sum')), FloatField())
+    rating_count = Cast(Subquery(movie.values('rating_count')), FloatField())
+    return ChartEntry.objects.filter(movie_id=movie_id).update(
+        weighted_rating=(rating_sum + minimum * mean_rating) / (rating_count + minimum),
+    )
@@ -0,0 +1,212 @@
+from django.db.models import Count, Q
+from django.db.models.functions import ExtractYear
+from rest_framework.exceptions import ValidationError
+
+from .models import Categories, Movies
+from .normalization import normalize
+from .search import search_movies
+
+# Params of the filters of the movies, shared by the list and the facets
+MOVIE_FILTER_PARAMS = {'q',
+                       'title',
+                       'rating',
+                       'director',
+                       'genre',
+                       'actor',
+                       'synopsis',
+                       'language'}
+
+# Number of genres, languages and directors returned by default in the facets
+FACET_LIMIT = 50
+MAX_FACET_LIMIT = 1000
+
+# Number of names returned by default by the typeahead of the names
+TYPEAHEAD_LIMIT = 10
+MAX_TYPEAHEAD_LIMIT = 50
+
+
+def filter_movies(queryset, params, ranked=True):
+    """
+    Filters the queryset of the movies with the params of the request, see
+    MovieListCreateAPIView.get_queryset. Raises ValidationError if a param
+    is not valid. With the q param the movies are ordered by relevance,
+    unless ranked is False.
+    """
+    # Get the posible params of the request
+    title = params.get('title')
+    director = params.get('director')
+    genre = params.get('genre')
+    actor = params.get('actor')
+    rating = params.get('rating')
+    synopsis = params.get('synopsis')
+    release_date = params.get('release_date')
+    language = params.get('language')
+    search = params.get('q')
+
+    # Validate that the params are valid
+    try:
+        # The rating must be a number
+        if rating is not None:
+            rating = float(rating)
+
+            # The rating must be between 1 and 10
+            if rating < 1 or rating > 10:
+                raise ValidationError('Rating must be between 1 and 10')
+
+    except ValueError:
+        raise ValidationError('Rating must be a float')
+
+    # Filter the queryset with the params
+    if title is not None:
+        queryset = queryset.filter(title__icontains=title)
+
+    # Filter for the movies directed by the director
+    if director is not None:
+        director = director.split()
+
+        # Design the query to filter the movies that contain the director name
+        director_name_query = Q(director__name__icontains=director[0])
+
+        # Check if the director has a name and a surname
+        if len(director) > 1:
+
+            # Design the query to filter the movies that contain the director surname
+            # concating all the words after the name
+            director_surname_query = Q(director__surname__icontains=' '.join(director[1:]))
+
+        else:
+            # Check if the first word is the name or the surname
+            director_surname_query = Q(director__surname__icontains=director[0])
+
+        # Filter the queryset with the director name or surname
+        queryset = queryset.filter(director_name_query | director_surname_query).distinct()
+
+    # Filter for the movies that contain the genre
+    if genre is not None:
+        queryset = queryset.filter(genres__name__icontains=genre).distinct()
+
+    # Filter for the movies that contain the actor
+    if actor is not None:
+        actor = actor.split()
+
+        # Design the query to filter the movies that contain the actor name
+        actor_name_query = Q(actors__name__icontains=actor[0])
+
+        # Check if the actor has a name and a surname
+        if len(actor) > 1:
+
+            # Design the query to filter the movies that contain the actor surname
+            # concating all the words after the name
+            actor_surname_query = Q(actors__surname__icontains=' '.join(actor[1:]))
+
+        else:
+            # Check if the first word is the name or the surname
+            actor_surname_query = Q(actors__surname__icontains=actor[0])
+
+        # Filter the queryset with the actor name or surname
+        queryset = queryset.filter(actor_name_query | actor_surname_query).distinct()
+
+    # Filter for the movies that have a rating greater than the rating
+    if rating is not None:
+        # The mean of the ratings of the movie must be greater than the rating
+        # If the movie has no ratings, the mean is 0
+        # The mean is stored in the movie, so the filter uses its index
+        queryset = queryset.filter(average_rating__gte=rating)
+
+    # Filter for the movies that contain the synopsis
+    if synopsis is not None:
+        queryset = queryset.filter(synopsis__icontains=synopsis).distinct()
+
+    # Filter for the movies that have the release date
+    if release_date is not None:
+        queryset = queryset.filter(release_date__icontains=release_date)
+
+    # Filter for the movies that contain the language
+    if language is not None:
+        queryset = queryset.filter(language__icontains=language).distinct()
+
+    # Full text search, the movies are ordered by relevance
+    if search is not None:
+        queryset = search_movies(queryset, search, ranked)
+
+    return queryset
+
+
+def movie_facets(movies, limit=FACET_LIMIT):
+    """
+    Returns the number of movies of the queryset per genre, language,
+    director and release year, with a grouped query per facet.
+    The queryset is used as a subquery, so it must not be ranked.
+    The genres, languages and directors are ordered by their number of
+    movies and only the first 'limit' are returned. The years are
+    ordered from the newest and all of them are returned.
+    """
+    # The facets group the ids of the movies, so a movie that matches
+    # several actors or genres of the filters is only counted once
+    ids = movies.order_by().values('pk')
+    matching = Movies.objects.filter(pk__in=ids).order_by()
+
+    genres = (Movies.genres.through.objects.filter(movies_id__in=ids)
+              .values('categories_id', 'categories__name')
+              .annotate(count=Count('movies_id'))
+              .order_by('-count', 'categories__name')[:limit])
+    languages = (matching.values('language')
+                 .annotate(count=Count('pk'))
+                 .order_by('-count', 'language')[:limit])
+    directors = (matching.values('director_id', 'director__name', 'director__surname')
+                 .annotate(count=Count('pk'))
+                 .order_by('-count', 'director__surname', 'director__name')[:limit])
+    years = list(matching.annotate(year=ExtractYear('release_date'))
+                 .values('year')
+                 .annotate(count=Count('pk'))
+                 .order_by('-year'))
+
+    return {
+        # Every movie has a release date, so the years count all of them
+        'count': sum(year['count'] for year in years),
+        'genres': [{'id': genre['categories_id'], 'name': genre['categories__name'],
+                    'count': genre['count']} for genre in genres],
+        'languages': [{'name': language['language'], 'count': language['count']}
+                      for language in languages],
+        'directors': [{'id': director['director_id'],
+                       'name': f"{director['director__name']} {director['director__surname']}",
+                       'count': director['count']} for director in directors],
+        'release_years': [{'year': year['year'], 'count': year['count']} for year in years],
+    }
+
+
+def prefix_range(field, prefix):
+    """
+    Returns the condition of the values of the field that start with the
+    prefix, as a range of values. The names are stored normalized, so
+    the range can be answered by a plain index of the field, while
+    startswith (LIKE) can only use it with some collations.
+    """
+    end = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    return Q(**{f'{field}__gte': prefix, f'{field}__lt': end, f'{field}__startswith': prefix})
+
+
+def name_prefix_queries(model, prefix):
+    """
+    Returns the queries of the typeahead of the categories, actors or
+    directors whose name starts with the prefix, as (condition, ordering)
+    pairs in the order their results are shown. The people also match by the
+    start of their full name, like "Christopher No", shown first, and by the
+    start of their surname, shown last. Each query reads an index in the
+    order of its ordering, so it only reads the rows it returns.
+    """
+    prefix = normalize(prefix)
+    if not prefix:
+        return []
+    if model is Categories:
+        return [(prefix_range('name', prefix), ('name',))]
+
+    queries = []
+    # Both the name and the surname may have several words
+    words = prefix.split()
+    for position in range(1, len(words)):
+        queries.append((Q(name=' '.join(words[:position]))
+                        & prefix_range('surname', ' '.join(words[position:])), ('name', 'surname')))
+    queries.append((prefix_range('name', prefix), ('name', 'surname')))
+    queries.append((prefix_range('surname', prefix), ('surname', 'name')))
+    return queries
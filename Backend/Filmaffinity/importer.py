@@ -0,0 +1,355 @@
+import csv
+import json
+import os
+import time
+from datetime import date
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.db import connection, transaction
+
+from .caching import bump_catalog_version, invalidate_movie_responses
+from .models import Actors, Categories, Directors, Movies, PlatformUsers, Rating
+from .normalization import normalize
+from .posters import schedule_poster_variants
+from .ratings import rebuild_rating_aggregates
+from .resolvers import resolve_keys
+
+# Formats of the catalogs, by the extension of the file
+CATALOG_FORMATS = {'.json': 'json', '.csv': 'csv', '.ndjson': 'ndjson', '.jsonl': 'ndjson'}
+
+
+def read_rows(path, catalog_format=None):
+    """
+    Yields the rows of a JSON list, of a JSON file with a row per line
+    (NDJSON) or of a CSV file with a header, as dictionaries.
+    The format is given by the extension of the file if it is not given.
+    """
+    catalog_format = catalog_format or CATALOG_FORMATS.get(os.path.splitext(path)[1].lower())
+    if catalog_format not in CATALOG_FORMATS.values():
+        raise ValueError(f'Unknown format of the file {path}')
+
+    with open(path, encoding='utf-8', newline='') as rows:
+        if catalog_format == 'json':
+            yield from json.load(rows)
+
+        elif catalog_format == 'ndjson':
+            for line in rows:
+                if line.strip():
+                    yield json.loads(line)
+
+        else:
+            yield from csv.DictReader(rows)
+
+
+def read_catalog(path, catalog_format=None):
+    """
+    Yields the movies of a catalog file, see read_rows, one dictionary per
+    movie, with the same fields as the movies of fill_database.py.
+    The CSV files have the columns title, synopsis, duration, release_date,
+    language, director, actors, genres and poster. The people are written
+    as 'Name Surname' and the actors and genres are separated by '|'.
+    """
+    catalog_format = catalog_format or CATALOG_FORMATS.get(os.path.splitext(path)[1].lower())
+    for row in read_rows(path, catalog_format):
+        if catalog_format == 'csv':
+            row['actors'] = [actor for actor in (row.get('actors') or '').split('|') if actor.strip()]
+            row['genres'] = [genre for genre in (row.get('genres') or '').split('|') if genre.strip()]
+        yield row
+
+
+def validate_names(model, value, **names):
+    """
+    Runs the validators of the name fields of the model on the names,
+    as full_clean does, since the bulk insert does not run them.
+    Raises ValueError if a name is not valid.
+    """
+    for field, name in names.items():
+        try:
+            model._meta.get_field(field).run_validators(name)
+        except ValidationError:
+            raise ValueError(f'Invalid {model._meta.verbose_name} {value!r}, '
+                             f'the names can only have letters and spaces')
+
+
+def parse_person(value, model=Actors):
+    """
+    Returns the normalized name and surname of a director or an actor,
+    written as a dictionary or as 'Name Surname'.
+    """
+    if isinstance(value, dict):
+        name, surname = value.get('name') or '', value.get('surname') or ''
+    elif isinstance(value, str) and len(value.split(None, 1)) == 2:
+        name, surname = value.split(None, 1)
+    else:
+        raise ValueError(f'Invalid person {value!r}, it must have a name and a surname')
+
+    name, surname = normalize(name), normalize(surname)
+    if not name or not surname:
+        raise ValueError(f'Invalid person {value!r}, it must have a name and a surname')
+    if len(name) > 256 or len(surname) > 256:
+        raise ValueError(f'Invalid person {value!r}, the name is too long')
+    validate_names(model, value, name=name, surname=surname)
+    return name, surname
+
+
+def parse_movie(row):
+    """
+    Validates a movie of the catalog and returns it with its fields
+    converted and its names normalized. Raises ValueError if it is not valid.
+    """
+    title = normalize(row.get('title') or '')
+    if not title or len(title) > 150:
+        raise ValueError('The title is required and must have at most 150 characters')
+
+    synopsis = row.get('synopsis')
+    if not synopsis:
+        raise ValueError('The synopsis is required')
+
+    language = row.get('language')
+    if not language or len(language) > 50:
+        raise ValueError('The language is required and must have at most 50 characters')
+
+    try:
+        duration = int(row.get('duration'))
+        release_date = date.fromisoformat(str(row.get('release_date')))
+    except (TypeError, ValueError):
+        raise ValueError('The duration must be a number and the release date a YYYY-MM-DD date')
+    if duration < 0:
+        raise ValueError('Duration must be a positive number')
+
+    actors = list(dict.fromkeys(parse_person(actor) for actor in row.get('actors') or []))
+    if not actors:
+        raise ValueError('At least one actor is required')
+
+    genres = list(dict.fromkeys(normalize(genre) for genre in row.get('genres') or []
+                                if isinstance(genre, str)))
+    if not genres or not all(genres) or any(len(genre) > 50 for genre in genres):
+        raise ValueError('At least one genre is required and they must have at most 50 characters')
+    for genre in genres:
+        validate_names(Categories, genre, name=genre)
+
+    return {
+        'title': title,
+        'synopsis': synopsis,
+        'duration': duration,
+        'release_date': release_date,
+        'language': language,
+        'director': parse_person(row.get('director'), Directors),
+        'actors': actors,
+        'genres': genres,
+        'poster': row.get('poster') or None,
+    }
+
+
+class MovieImporter:
+    """
+    Imports the movies of a catalog in batches. For each batch:
+    - The directors, actors and genres are resolved with resolve_keys.
+    - The movies are inserted with a single bulk insert, with their
+      search credits already computed.
+    - The relations with the actors and the genres are inserted
+      with a bulk insert each.
+    Each batch is imported in a transaction. The invalid movies are
+    skipped and kept in 'errors' with their position in the catalog.
+    """
+
+    def __init__(self, batch_size=2000, base_dir=None, stdout=None):
+        self.batch_size = batch_size
+        # Directory of the relative paths of the posters
+        self.base_dir = base_dir
+        self.stdout = stdout
+        self.poster_field = Movies._meta.get_field('poster')
+
+        # Primary keys of the people and genres already resolved
+        self.directors = {}
+        self.actors = {}
+        self.genres = {}
+
+        self.imported = 0
+        self.errors = []
+
+    def import_movies(self, rows):
+        """
+        Imports the movies of the iterable and returns the number of imported movies.
+        """
+        if not connection.features.can_return_rows_from_bulk_insert:
+            raise RuntimeError('The database must return the ids of the rows of a bulk insert')
+
+        start = time.perf_counter()
+        rows = enumerate(rows, 1)
+        while True:
+            batch = list(islice(rows, self.batch_size))
+            if not batch:
+                break
+            self.import_batch(batch)
+            if self.stdout is not None:
+                elapsed = time.perf_counter() - start
+                self.stdout.write(f'{self.imported} movies imported '
+                                  f'({self.imported / elapsed:.0f} movies/s)')
+
+        if self.imported:
+            # The responses of the catalog are not valid anymore
+            bump_catalog_version('movies', 'actors', 'directors', 'categories')
+            invalidate_movie_responses()
+        return self.imported
+
+    def import_batch(self, batch):
+        movies = []
+        for position, row in batch:
+            try:
+                movie = parse_movie(row)
+                if movie['poster']:
+                    movie['poster'] = self.save_poster(movie['poster'])
+            except (ValueError, AttributeError, OSError) as exc:
+                self.errors.append((position, str(exc)))
+            else:
+                movies.append(movie)
+        if not movies:
+            return
+
+        with transaction.atomic():
+            # The versions of the catalog are increased once, after the import
+            resolve_keys(Directors, {movie['director'] for movie in movies}, self.directors, False)
+            resolve_keys(Actors, {actor for movie in movies for actor in movie['actors']}, self.actors, False)
+            resolve_keys(Categories, {genre for movie in movies for genre in movie['genres']}, self.genres, False)
+
+            created = Movies.objects.bulk_create([self.build_movie(movie) for movie in movies])
+
+            Movies.actors.through.objects.bulk_create([
+                Movies.actors.through(movies_id=instance.pk, actors_id=self.actors[actor])
+                for instance, movie in zip(created, movies) for actor in movie['actors']
+            ])
+            Movies.genres.through.objects.bulk_create([
+                Movies.genres.through(movies_id=instance.pk, categories_id=self.genres[genre])
+                for instance, movie in zip(created, movies) for genre in movie['genres']
+            ])
+
+            # The movies with the default poster share its variants, see generate_poster_variants
+            for instance, movie in zip(created, movies):
+                if movie['poster']:
+                    schedule_poster_variants(instance.pk)
+        self.imported += len(created)
+
+    def build_movie(self, movie):
+        """
+        Returns the instance of a movie of the catalog, not saved yet.
+        """
+        instance = Movies(
+            title=movie['title'],
+            synopsis=movie['synopsis'],
+            duration=movie['duration'],
+            release_date=movie['release_date'],
+            language=movie['language'],
+            director_id=self.directors[movie['director']],
+            # Same credits as refresh_search_credits
+            search_credits=' '.join([' '.join(movie['director'])]
+                                    + [' '.join(actor) for actor in movie['actors']]
+                                    + movie['genres']),
+        )
+        if movie['poster']:
+            instance.poster = movie['poster']
+        return instance
+
+    def save_poster(self, path):
+        """
+        Copies a poster to the storage of the posters and returns its name.
+        """
+        if self.base_dir is not None:
+            path = os.path.join(self.base_dir, path)
+        name = self.poster_field.generate_filename(None, os.path.basename(path))
+        with open(path, 'rb') as poster:
+            return self.poster_field.storage.save(name, File(poster))
+
+
+def parse_rating(row):
+    """
+    Validates a rating and returns the email of the user, the id of the movie,
+    the rating and the comment. Raises ValueError if it is not valid.
+    """
+    email = row.get('user')
+    if not email or not isinstance(email, str):
+        raise ValueError('The email of the user is required')
+
+    try:
+        movie_id = int(row.get('movie'))
+        rating = float(row.get('rating'))
+    except (TypeError, ValueError):
+        raise ValueError('The movie must be an id and the rating a number')
+    if not rating.is_integer() or not 1 <= rating <= 10:
+        raise ValueError('Rating must be an integer between 1 and 10')
+
+    comment = row.get('comment') or ''
+    if not isinstance(comment, str):
+        raise ValueError('The comment must be a string')
+    return email, movie_id, int(rating), comment
+
+
+class RatingImporter:
+    """
+    Creates or updates ratings in batches. For each batch:
+    - The users are looked up by email and the movies by id in a query each.
+    - The ratings are inserted with a single statement, and the ones of a user
+      that has already rated the movie replace the existing ones.
+    - The rating aggregates of the movies of the batch are rebuilt once.
+    If a batch has several ratings of a user for the same movie, the last one
+    is kept. Each batch is imported in a transaction. The invalid ratings are
+    skipped and kept in 'errors' with their position.
+    """
+
+    def __init__(self, batch_size=2000):
+        self.batch_size = batch_size
+        self.imported = 0
+        self.errors = []
+
+    def import_ratings(self, rows):
+        """
+        Imports the ratings of the iterable and returns the number of imported ratings.
+        """
+        rows = enumerate(rows, 1)
+        while True:
+            batch = list(islice(rows, self.batch_size))
+            if not batch:
+                break
+            self.import_batch(batch)
+        return self.imported
+
+    def import_batch(self, batch):
+        ratings = {}
+        for position, row in batch:
+            try:
+                email, movie_id, rating, comment = parse_rating(row)
+            except (ValueError, AttributeError) as exc:
+                self.errors.append((position, str(exc)))
+            else:
+                ratings[email, movie_id] = (position, rating, comment)
+        if not ratings:
+            return
+
+        with transaction.atomic():
+            # If several users have the same email, the oldest one is used
+            users = dict(PlatformUsers.objects.filter(
+                email__in={email for email, _ in ratings}).order_by('-pk').values_list('email', 'pk'))
+            movies = set(Movies.objects.filter(
+                pk__in={movie_id for _, movie_id in ratings}).values_list('pk', flat=True))
+
+            instances = []
+            for (email, movie_id), (position, rating, comment) in sorted(
+                    ratings.items(), key=lambda item: item[1][0]):
+                if email not in users:
+                    self.errors.append((position, f'User {email} does not exist'))
+                elif movie_id not in movies:
+                    self.errors.append((position, f'Movie {movie_id} does not exist'))
+                else:
+                    instances.append(Rating(user_id=users[email], movie_id=movie_id,
+                                            rating=rating, comment=comment))
+            if not instances:
+                return
+
+            Rating.objects.bulk_create(instances, update_conflicts=True,
+                                       unique_fields=['user', 'movie'],
+                                       update_fields=['rating', 'comment'])
+            # The ratings are not saved one by one, so the aggregates are rebuilt once
+            rebuild_rating_aggregates({instance.movie_id for instance in instances})
+        self.imported += len(instances)
@@ -0,0 +1,107 @@
+import random
+import statistics
+import time
+from itertools import islice, product
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from Filmaffinity.models import Actors
+from Filmaffinity.normalization import normalize, person_key
+from Filmaffinity.resolvers import resolve_keys
+
+NAMES = ['anna', 'BRUNO', 'carla-maria', 'David', 'élena', 'félix', 'greta', 'hugo', 'irene',
+         'jonas', 'karin', 'luis', 'maría josé', 'nora', 'oskar', 'pía', 'quinn', 'rosa']
+SURNAMES = ['álvarez', 'berger', 'costa', 'du bois', 'eriksen', 'fischer', "o'neill", 'hansen',
+            'ivanova', 'jensen', 'kowalski', 'lindqvist', 'moreau', 'novák', 'olsen', 'petrov']
+
+
+class Command(BaseCommand):
+    """
+    Measures the normalization of the names, comparing:
+    - normalize: the plain normalizer with the memoized one, on the names of
+      a generated import where the same people appear in many movies.
+    - render: the rendering of the names in the lists, computing the
+      capitalization again with title() or using the stored names.
+    - lookup: looking up people by name and surname or by their lookup key.
+    The people of the lookup are created in a transaction that is rolled
+    back at the end, so the database is not modified.
+
+    Usage:
+        python manage.py benchmark_normalization --names 200000 --people 5000
+    """
+    help = "Benchmarks the normalization, rendering and lookup of the names."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--names', type=int, default=200000,
+                            help="Number of names normalized and rendered.")
+        parser.add_argument('--people', type=int, default=5000,
+                            help="Number of different people of the generated import, "
+                                 "at most 5184.")
+        parser.add_argument('--repeat', type=int, default=5,
+                            help="Number of times each measure is run.")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        people = [(f'{name} {middle}', surname) for name, middle, surname
+                  in islice(product(NAMES, NAMES, SURNAMES), options['people'])]
+        # Like in a real import, the same people appear in many movies
+        names = [name for name, surname in rng.choices(people, k=options['names'])
+                 for name in (name, surname)]
+        repeat = options['repeat']
+
+        self.stdout.write(f"{len(names)} names of {len(people)} people, median of {repeat} runs")
+
+        def memoized():
+            normalize.cache_clear()
+            for name in names:
+                normalize(name)
+
+        self.report('normalize', len(names), 'names',
+                    self.measure(lambda: [normalize.__wrapped__(name) for name in names], repeat),
+                    self.measure(memoized, repeat), 'slugify', 'memoized')
+
+        actors = [Actors(name=normalize(name), surname=normalize(surname))
+                  for name, surname in rng.choices(people, k=options['names'])]
+        self.report('render', len(actors), 'names',
+                    self.measure(lambda: [f"{actor.name.title()} {actor.surname.title()}"
+                                          for actor in actors], repeat),
+                    self.measure(lambda: [str(actor) for actor in actors], repeat),
+                    'title()', 'stored')
+
+        with transaction.atomic():
+            keys = list({(normalize(name), normalize(surname)) for name, surname in people})
+            resolve_keys(Actors, keys, {})
+            batch = rng.sample(keys, min(500, len(keys)))
+
+            def by_name():
+                rows = Actors.objects.filter(
+                    name__in={name for name, _ in batch},
+                    surname__in={surname for _, surname in batch},
+                ).values_list('name', 'surname', 'pk')
+                wanted = set(batch)
+                return {(name, surname): pk for name, surname, pk in rows if (name, surname) in wanted}
+
+            def by_lookup_key():
+                return dict(Actors.objects.filter(
+                    lookup_key__in=[person_key(*key) for key in batch]).values_list('lookup_key', 'pk'))
+
+            self.report(f'lookup ({connection.vendor})', len(batch), 'people',
+                        self.measure(by_name, repeat), self.measure(by_lookup_key, repeat),
+                        'name, surname', 'lookup key')
+
+            # The generated people are not kept
+            transaction.set_rollback(True)
+
+    def measure(self, function, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function()
+            timings.append(time.perf_counter() - start)
+        return statistics.median(timings)
+
+    def report(self, name, count, unit, before, after, before_name, after_name):
+        self.stdout.write(f"  {name:<20} {before_name}: {count / before:12.0f} {unit}/s   "
+                          f"{after_name}: {count / after:12.0f} {unit}/s   x{before / after:.1f}")
@@ -0,0 +1,119 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Q
+
+from Filmaffinity.models import Actors, Categories, Directors, Movies
+from Filmaffinity.search import search_movies
+
+WORDS = ['night', 'city', 'love', 'war', 'dream', 'river', 'ghost', 'summer', 'king', 'storm',
+         'silent', 'journey', 'secret', 'shadow', 'golden', 'island', 'winter', 'fire', 'last',
+         'broken', 'empire', 'ocean', 'garden', 'machine', 'heart', 'stranger', 'mountain',
+         'letter', 'crown', 'mirror', 'wolf', 'harbor', 'station', 'desert', 'memory', 'signal']
+NAMES = ['Anna', 'Bruno', 'Carla', 'David', 'Elena', 'Felix', 'Greta', 'Hugo', 'Irene', 'Jonas']
+SURNAMES = ['Alvarez', 'Berger', 'Costa', 'Dubois', 'Eriksen', 'Fischer', 'Garcia', 'Hansen',
+            'Ivanova', 'Jensen', 'Kowalski', 'Lindqvist', 'Moreau', 'Novak', 'Olsen', 'Petrov']
+GENRES = ['Action', 'Comedy', 'Drama', 'Horror', 'Romance', 'Thriller', 'Western', 'Mystery']
+
+
+class Command(BaseCommand):
+    """
+    Measures the latency of the full text search of the movies compared
+    with the icontains filters, on a generated catalog.
+    Everything is done inside a transaction that is rolled back at the end,
+    so the database is not modified.
+
+    Usage:
+        python manage.py benchmark_search --movies 100000
+    """
+    help = "Benchmarks the full text search of the movies on a generated catalog."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--movies', type=int, default=100000,
+                            help="Number of movies of the generated catalog.")
+        parser.add_argument('--repeat', type=int, default=20,
+                            help="Number of times each search is run.")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+
+        with transaction.atomic():
+            self.generate_catalog(rng, options['movies'])
+
+            searches = [
+                ('title', 'ghost', Q(title__icontains='ghost')),
+                ('synopsis', 'harbor storm', Q(synopsis__icontains='harbor')
+                 & Q(synopsis__icontains='storm')),
+                ('actor', 'Lindqvist', Q(actors__surname__icontains='Lindqvist')),
+                ('genre', 'western', Q(genres__name__icontains='western')),
+            ]
+            self.stdout.write(f"{options['movies']} movies on {connection.vendor}, "
+                              f"median of {options['repeat']} runs (first page of 10 results)")
+            for name, text, filters in searches:
+                legacy = Movies.objects.filter(filters).distinct().order_by('title')
+                legacy_ms = self.measure(legacy, options['repeat'])
+                search_ms = self.measure(search_movies(Movies.objects.all(), text),
+                                         options['repeat'])
+                self.stdout.write(f"  {name:<10} icontains: {legacy_ms:8.2f} ms   "
+                                  f"q={text!r}: {search_ms:8.2f} ms")
+
+            # The generated catalog is not kept
+            transaction.set_rollback(True)
+
+    def measure(self, queryset, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            # Same queries as the list endpoint: the count and the first page
+            queryset.count()
+            list(queryset[:10])
+            timings.append((time.perf_counter() - start) * 1000)
+        return statistics.median(timings)
+
+    def generate_catalog(self, rng, total):
+        """
+        Creates the movies in batches, with their credits already computed,
+        as a bulk import would do.
+        """
+        genres = [Categories.get_or_create_normalized(name)[0] for name in GENRES]
+        actors = [Actors.get_or_create_normalized(name, surname)[0]
+                  for name in NAMES for surname in SURNAMES]
+        directors = [Directors.get_or_create_normalized(name, surname)[0]
+                     for name in NAMES for surname in SURNAMES[:8]]
+
+        batch_size = 5000
+        for start in range(0, total, batch_size):
+            movies, credits = [], []
+            for _ in range(min(batch_size, total - start)):
+                director = rng.choice(directors)
+                cast = rng.sample(actors, 3)
+                movie_genres = rng.sample(genres, 2)
+                movies.append(Movies(
+                    title=' '.join(rng.sample(WORDS, 3)).title(),
+                    synopsis=' '.join(rng.choice(WORDS) for _ in range(25)),
+                    director=director,
+                    duration=rng.randint(80, 180),
+                    release_date=f'{rng.randint(1950, 2024)}-01-01',
+                    language='English',
+                    search_credits=' '.join([str(director)] + [str(actor) for actor in cast]
+                                            + [genre.name for genre in movie_genres]),
+                ))
+                credits.append((cast, movie_genres))
+
+            movies = Movies.objects.bulk_create(movies)
+            Movies.actors.through.objects.bulk_create([
+                Movies.actors.through(movies_id=movie.pk, actors_id=actor.pk)
+                for movie, (cast, _) in zip(movies, credits) for actor in cast
+            ])
+            Movies.genres.through.objects.bulk_create([
+                Movies.genres.through(movies_id=movie.pk, categories_id=genre.pk)
+                for movie, (_, movie_genres) in zip(movies, credits) for genre in movie_genres
+            ])
+
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
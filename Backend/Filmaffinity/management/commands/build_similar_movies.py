@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from Filmaffinity.similarity import MIN_COMMON_RATINGS, SIMILAR_MOVIES, build_similar_movies
+
+
+class Command(BaseCommand):
+    """
+    Computes the most similar movies of each movie from the ratings of the
+    users (adjusted cosine) and stores them for the similar movies endpoint.
+
+    With --stale only the movies whose ratings have changed since the last
+    build are computed again, so it can be run often, and a full build
+    now and then updates the lists of the rest of the movies.
+
+    Usage:
+        python manage.py build_similar_movies
+        python manage.py build_similar_movies --stale
+    """
+    help = "Computes the most similar movies of each movie from the ratings."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stale', action='store_true',
+                            help="Only compute the movies whose ratings have changed.")
+        parser.add_argument('--k', type=int, default=SIMILAR_MOVIES,
+                            help="Number of similar movies stored for each movie.")
+        parser.add_argument('--min-common', type=int, default=MIN_COMMON_RATINGS,
+                            help="Minimum number of users that must have rated both movies.")
+
+    def handle(self, *args, **options):
+        if not 1 <= options['k'] <= 100:
+            raise CommandError('The number of similar movies must be between 1 and 100')
+        if options['min_common'] < 1:
+            raise CommandError('The minimum number of common ratings must be greater than 0')
+
+        movies, similar = build_similar_movies(stale_only=options['stale'], neighbors=options['k'],
+                                               min_common=options['min_common'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Similar movies computed for {movies} movies, {similar} similar movies stored.'))
@@ -0,0 +1,73 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from Filmaffinity.models import Movies
+
+
+class Command(BaseCommand):
+    """
+    Deletes the files of the directory of the posters that no movie uses:
+    the posters of deleted movies or replaced by another one and their
+    variants. The default poster is always kept, and so are the files
+    modified in the last --min-age seconds, as they may belong to a movie
+    that is being saved.
+
+    Usage:
+        python manage.py gc_posters --dry-run
+        python manage.py gc_posters --min-age 3600
+    """
+    help = "Deletes the posters and poster variants that no movie uses."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Only list the files that would be deleted.")
+        parser.add_argument('--min-age', type=int, default=3600,
+                            help="Only delete the files modified at least this number of seconds ago.")
+
+    def handle(self, *args, **options):
+        if options['min_age'] < 0:
+            raise CommandError('The minimum age cannot be negative')
+
+        field = Movies._meta.get_field('poster')
+        storage = field.storage
+        directory = field.upload_to.rstrip('/')
+        if not storage.exists(directory):
+            self.stdout.write('There are no posters.')
+            return
+
+        used = {field.get_default()}
+        used.update(Movies.objects.exclude(poster='').exclude(poster__isnull=True)
+                    .values_list('poster', flat=True).distinct())
+        for variants in Movies.objects.values_list('poster_variants', flat=True).iterator():
+            for formats in (variants or {}).values():
+                if isinstance(formats, dict):
+                    used.update(formats.values())
+
+        limit = timezone.now() - timedelta(seconds=options['min_age'])
+        deleted = freed = 0
+        for name in self.list_files(storage, directory):
+            if name in used or storage.get_modified_time(name) > limit:
+                continue
+            size = storage.size(name)
+            if options['dry_run']:
+                self.stdout.write(f'Would delete {name} ({size} bytes)')
+            else:
+                storage.delete(name)
+            deleted += 1
+            freed += size
+
+        action = 'would be deleted' if options['dry_run'] else 'deleted'
+        self.stdout.write(self.style.SUCCESS(
+            f'{deleted} unused poster files {action}, {freed / 1024 / 1024:.1f} MB.'))
+
+    def list_files(self, storage, directory):
+        """
+        Yields the names of the files of the directory and its subdirectories.
+        """
+        directories, files = storage.listdir(directory)
+        for file in files:
+            yield f'{directory}/{file}'
+        for subdirectory in directories:
+            yield from self.list_files(storage, f'{directory}/{subdirectory}')
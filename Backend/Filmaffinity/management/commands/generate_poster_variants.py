@@ -0,0 +1,45 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Filmaffinity.models import Movies
+from Filmaffinity.posters import run_poster_job
+
+
+class Command(BaseCommand):
+    """
+    Generates the variants of the posters of the movies that do not have
+    the variants of their current poster yet, for example the movies created
+    before the variants existed or imported with the default poster.
+
+    Usage:
+        python manage.py generate_poster_variants
+        python manage.py generate_poster_variants --movie 1 --force
+    """
+    help = "Generates the thumbnail and medium variants of the posters of the movies."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--movie', action='append', type=int, dest='movies',
+                            help="Only generate the variants of this movie id. "
+                                 "Can be used several times.")
+        parser.add_argument('--force', action='store_true',
+                            help="Generate the variants again even if they exist.")
+        parser.add_argument('--workers', type=int, default=4,
+                            help="Number of posters generated at the same time.")
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError('The number of workers must be greater than 0')
+
+        movies = Movies.objects.exclude(poster='').exclude(poster__isnull=True)
+        if options['movies']:
+            movies = movies.filter(pk__in=options['movies'])
+        movie_ids = [pk for pk, poster, variants in movies.values_list('pk', 'poster', 'poster_variants')
+                     if options['force'] or (variants or {}).get('source') != poster]
+
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            results = list(executor.map(lambda pk: run_poster_job(pk, options['force']), movie_ids))
+
+        failed = results.count(None)
+        self.stdout.write(self.style.SUCCESS(
+            f"Poster variants generated for {len(movie_ids) - failed} movies, {failed} failed."))
@@ -0,0 +1,46 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Filmaffinity.importer import MovieImporter, read_catalog
+
+
+class Command(BaseCommand):
+    """
+    Imports the movies of a JSON, NDJSON or CSV catalog in batches, see
+    MovieImporter. The movies that are not valid are skipped and reported.
+    The relative paths of the posters are relative to the catalog.
+
+    Usage:
+        python manage.py import_movies catalog.ndjson --batch-size 2000
+    """
+    help = "Imports the movies of a JSON, NDJSON or CSV catalog in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Path of the catalog.")
+        parser.add_argument('--format', choices=['json', 'ndjson', 'csv'],
+                            help="Format of the catalog, by default given by its extension.")
+        parser.add_argument('--batch-size', type=int, default=2000,
+                            help="Number of movies inserted in each transaction.")
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('The batch size must be greater than 0')
+
+        importer = MovieImporter(
+            batch_size=options['batch_size'],
+            base_dir=os.path.dirname(os.path.abspath(options['path'])),
+            stdout=self.stdout if options['verbosity'] > 1 else None,
+        )
+        start = time.perf_counter()
+        try:
+            importer.import_movies(read_catalog(options['path'], options['format']))
+        except (OSError, ValueError) as exc:
+            raise CommandError(f'The catalog could not be read: {exc}')
+        elapsed = time.perf_counter() - start
+
+        for position, error in importer.errors:
+            self.stderr.write(f'Movie {position} skipped: {error}')
+        self.stdout.write(f'{importer.imported} movies imported, {len(importer.errors)} skipped, '
+                          f'in {elapsed:.2f} s ({importer.imported / elapsed:.0f} movies/s)')
@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Filmaffinity.importer import RatingImporter, read_rows
+
+
+class Command(BaseCommand):
+    """
+    Creates or updates the ratings of a JSON, NDJSON or CSV file in batches,
+    see RatingImporter. Each rating has the fields user (email), movie (id),
+    rating and comment (optional). The invalid ratings are skipped and reported.
+
+    Usage:
+        python manage.py import_ratings ratings.csv --batch-size 5000
+    """
+    help = "Creates or updates the ratings of a JSON, NDJSON or CSV file in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Path of the file of ratings.")
+        parser.add_argument('--format', choices=['json', 'ndjson', 'csv'],
+                            help="Format of the file, by default given by its extension.")
+        parser.add_argument('--batch-size', type=int, default=2000,
+                            help="Number of ratings written in each transaction.")
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('The batch size must be greater than 0')
+
+        importer = RatingImporter(batch_size=options['batch_size'])
+        start = time.perf_counter()
+        try:
+            importer.import_ratings(read_rows(options['path'], options['format']))
+        except (OSError, ValueError) as exc:
+            raise CommandError(f'The ratings could not be read: {exc}')
+        elapsed = time.perf_counter() - start
+
+        for position, error in sorted(importer.errors):
+            self.stderr.write(f'Rating {position} skipped: {error}')
+        self.stdout.write(f'{importer.imported} ratings imported, {len(importer.errors)} skipped, '
+                          f'in {elapsed:.2f} s ({importer.imported / elapsed:.0f} ratings/s)')
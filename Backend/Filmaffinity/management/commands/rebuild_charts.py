@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from Filmaffinity.charts import refresh_chart_entries
+
+
+class Command(BaseCommand):
+    """
+    Rebuilds all the top charts from the rating aggregates of the movies and
+    computes again the mean rating of the weighted ratings. The charts are
+    updated with every rating, but the mean rating is only updated by this
+    command, so it can be run now and then (for example, every night).
+
+    Usage:
+        python manage.py rebuild_charts
+    """
+    help = "Rebuilds the top charts of the movies from their ratings."
+
+    def handle(self, *args, **options):
+        entries = refresh_chart_entries()
+        self.stdout.write(self.style.SUCCESS(f"Top charts rebuilt with {entries} entries."))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from Filmaffinity.ratings import rebuild_rating_aggregates
+
+
+class Command(BaseCommand):
+    """
+    Rebuilds the rating aggregates stored in the movies from the ratings,
+    with the number of ratings of each score, to repair them if they
+    do not match the ratings.
+
+    Usage:
+        python manage.py rebuild_rating_aggregates
+        python manage.py rebuild_rating_aggregates --movie 1 --movie 2
+    """
+    help = "Rebuilds the rating count, sum, average and histogram of the movies from the ratings."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--movie', action='append', type=int, dest='movies',
+                            help="Only rebuild the aggregates of this movie id. "
+                                 "Can be used several times.")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            updated = rebuild_rating_aggregates(options['movies'])
+        self.stdout.write(self.style.SUCCESS(f"Rating aggregates rebuilt for {updated} movies."))
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from Filmaffinity.recommendations import FACTORS, ITERATIONS, REGULARIZATION, publish_model, train_model
+
+
+class Command(BaseCommand):
+    """
+    Trains the recommendation model of the users from all the ratings
+    (matrix factorization with alternating least squares) and publishes it
+    for the recommendations endpoint. It runs in its own process, so it can
+    be scheduled (for example, every night with cron) without slowing down
+    the server, which loads the new model in the next request.
+
+    Usage:
+        python manage.py train_recommendations
+        python manage.py train_recommendations --factors 64 --iterations 15
+    """
+    help = "Trains the recommendation model of the users from the ratings."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--factors', type=int, default=FACTORS,
+                            help="Number of latent factors of each user and movie.")
+        parser.add_argument('--iterations', type=int, default=ITERATIONS,
+                            help="Number of alternating least squares steps.")
+        parser.add_argument('--regularization', type=float, default=REGULARIZATION,
+                            help="Weight of the size of the factors in the error.")
+
+    def handle(self, *args, **options):
+        if options['factors'] < 1 or options['iterations'] < 1:
+            raise CommandError('The number of factors and of iterations must be greater than 0')
+        if options['regularization'] <= 0:
+            raise CommandError('The regularization must be greater than 0')
+
+        model = train_model(options['factors'], options['regularization'], options['iterations'])
+        name = publish_model(model)
+        self.stdout.write(self.style.SUCCESS(
+            f'Recommendation model {name} trained for {len(model.user_ids)} users '
+            f'and {len(model.movie_ids)} movies.'))
@@ -0,0 +1,133 @@
+import mimetypes
+import os
+import re
+import stat
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import require_safe
+
+from .models import Movies
+from .storage import IMMUTABLE_MAX_AGE, is_content_addressed
+
+# Not every system knows the types of the variants
+mimetypes.add_type('image/webp', '.webp')
+mimetypes.add_type('image/avif', '.avif')
+
+# Directory of the posters and their variants in the media files
+POSTERS_DIRECTORY = Movies._meta.get_field('poster').upload_to.strip('/')
+
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def poster_etag(name, file_stat):
+    """
+    Returns the ETag of a poster: the hash of its content if it is named by it,
+    and its modification time and size otherwise, like the web servers do.
+    """
+    if is_content_addressed(name):
+        return quote_etag(os.path.splitext(os.path.basename(name))[0])
+    return quote_etag(f'{int(file_stat.st_mtime):x}-{file_stat.st_size:x}')
+
+
+def byte_range(header, size):
+    """
+    Returns the (start, end) of a Range header of a single range of bytes,
+    with end included, or None if it has to be ignored.
+    Raises ValueError if it cannot be satisfied.
+    """
+    match = RANGE.match(header.replace(' ', ''))
+    if not match or match.groups() == ('', ''):
+        return None
+    start, end = match.groups()
+    if not start:
+        # The last bytes of the file
+        start, end = max(size - int(end), 0), size - 1
+    else:
+        start, end = int(start), min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        raise ValueError('Range not satisfiable')
+    return start, end
+
+
+@require_safe
+def serve_media(request, path):
+    """
+    Serves the posters and their variants, in production too.
+
+    The files are sent with FileResponse, which the WSGI servers send with
+    sendfile when they can, without reading them in Python. With the setting
+    MEDIA_ACCEL_REDIRECT, the file is only checked and its sending is
+    delegated to the front proxy (nginx) with the X-Accel-Redirect header,
+    so the workers do not wait for the clients to download the images.
+
+    The responses have an ETag and Last-Modified to answer the conditional
+    requests with 304, support a single range of bytes and can be cached
+    forever if the file is named by its content.
+    """
+    name = f'{POSTERS_DIRECTORY}/{path}'
+    storage = Movies._meta.get_field('poster').storage
+    try:
+        full_path = storage.path(name)
+        file_stat = os.stat(full_path)
+    except (SuspiciousFileOperation, OSError, ValueError):
+        raise Http404('The poster does not exist')
+    if not stat.S_ISREG(file_stat.st_mode):
+        raise Http404('The poster does not exist')
+
+    # The headers shared by all the responses, also the 304 ones
+    headers = HttpResponse()
+    headers['ETag'] = poster_etag(name, file_stat)
+    headers['Last-Modified'] = http_date(file_stat.st_mtime)
+    if is_content_addressed(name):
+        patch_cache_control(headers, public=True, max_age=IMMUTABLE_MAX_AGE, immutable=True)
+    else:
+        # The default poster can be replaced, so it is checked with the ETag
+        patch_cache_control(headers, public=True, no_cache=True)
+
+    conditional = get_conditional_response(request, etag=headers['ETag'],
+                                           last_modified=int(file_stat.st_mtime), response=headers)
+    if conditional is not headers:
+        return conditional
+
+    content_type = mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+    accel_redirect = getattr(settings, 'MEDIA_ACCEL_REDIRECT', None)
+    if accel_redirect:
+        # The proxy sends the file, and also answers the ranges
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = accel_redirect.rstrip('/') + '/' + name
+    else:
+        response = file_response(request, full_path, file_stat.st_size, headers['ETag'], content_type)
+
+    for header in ('ETag', 'Last-Modified', 'Cache-Control'):
+        response[header] = headers[header]
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def file_response(request, full_path, size, etag, content_type):
+    """
+    Returns the response with the file, or with the requested range of it.
+    The range is ignored if If-Range does not match the ETag.
+    """
+    requested = request.headers.get('Range')
+    if requested and request.headers.get('If-Range', etag) == etag:
+        try:
+            limits = byte_range(requested, size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+        if limits is not None:
+            start, end = limits
+            # The posters are small, so the range is read in memory
+            with open(full_path, 'rb') as file:
+                file.seek(start)
+                response = HttpResponse(file.read(end - start + 1), status=206,
+                                        content_type=content_type)
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+            return response
+    return FileResponse(open(full_path, 'rb'), content_type=content_type)
@@ -0,0 +1,42 @@
+# Generated by Django 4.2.11 on 2026-10-17 20:32
+
+from django.db import migrations, models
+from django.db.models import Avg, Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def compute_rating_aggregates(apps, schema_editor):
+    Movies = apps.get_model("Filmaffinity", "Movies")
+    Rating = apps.get_model("Filmaffinity", "Rating")
+
+    ratings = Rating.objects.filter(movie=OuterRef("pk")).order_by().values("movie")
+    Movies.objects.update(
+        rating_count=Coalesce(Subquery(ratings.annotate(count=Count("id")).values("count")), 0),
+        rating_sum=Coalesce(Subquery(ratings.annotate(total=Sum("rating")).values("total")), 0),
+        average_rating=Subquery(ratings.annotate(average=Avg("rating")).values("average")),
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("Filmaffinity", "0004_alter_movies_poster"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="movies",
+            name="average_rating",
+            field=models.FloatField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="movies",
+            name="rating_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="movies",
+            name="rating_sum",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(compute_rating_aggregates, migrations.RunPython.noop),
+    ]
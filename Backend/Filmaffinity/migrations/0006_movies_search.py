@@ -0,0 +1,40 @@
+# Generated by Django 4.2.11 on 2026-10-17 21:05
+
+from django.db import migrations, models
+
+from Filmaffinity.search import install_search_index, uninstall_search_index
+
+
+def compute_search_credits(apps, schema_editor):
+    Movies = apps.get_model("Filmaffinity", "Movies")
+
+    for movie in Movies.objects.select_related("director").prefetch_related("actors", "genres"):
+        names = [f"{movie.director.name} {movie.director.surname}"]
+        names += [f"{actor.name} {actor.surname}" for actor in movie.actors.all()]
+        names += [genre.name for genre in movie.genres.all()]
+        movie.search_credits = " ".join(names)
+        movie.save(update_fields=["search_credits"])
+
+
+def create_search_index(apps, schema_editor):
+    install_search_index(schema_editor.connection, apps.get_model("Filmaffinity", "Movies"))
+
+
+def drop_search_index(apps, schema_editor):
+    uninstall_search_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("Filmaffinity", "0005_movies_rating_aggregates"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="movies",
+            name="search_credits",
+            field=models.TextField(blank=True, default="", editable=False),
+        ),
+        migrations.RunPython(compute_search_credits, migrations.RunPython.noop),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
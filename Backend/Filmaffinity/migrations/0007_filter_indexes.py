@@ -0,0 +1,79 @@
+# Generated by Django 4.2.11 on 2026-10-17 20:38
+
+from django.db import migrations, models
+import django.db.models.functions.text
+
+# Columns filtered with icontains by the movie list. In PostgreSQL
+# icontains is compiled as UPPER(column::text) LIKE UPPER(pattern),
+# so the trigram indexes are built on that same expression
+TRIGRAM_INDEXES = [
+    ("movies_title_trgm_idx", "Filmaffinity_movies", "title"),
+    ("movies_language_trgm_idx", "Filmaffinity_movies", "language"),
+    ("movies_synopsis_trgm_idx", "Filmaffinity_movies", "synopsis"),
+    ("actors_name_trgm_idx", "Filmaffinity_actors", "name"),
+    ("actors_surname_trgm_idx", "Filmaffinity_actors", "surname"),
+    ("directors_name_trgm_idx", "Filmaffinity_directors", "name"),
+    ("directors_surname_trgm_idx", "Filmaffinity_directors", "surname"),
+    ("categories_name_trgm_idx", "Filmaffinity_categories", "name"),
+]
+
+
+def create_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        # Servers built without the contrib modules cannot have these indexes
+        if cursor.fetchone() is None:
+            return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for name, table, column in TRIGRAM_INDEXES:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS "{name}" ON "{table}" '
+            f'USING gin ((UPPER("{column}"::text)) gin_trgm_ops)'
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for name, _, _ in TRIGRAM_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS "{name}"')
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("Filmaffinity", "0006_movies_search"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="actors",
+            index=models.Index(django.db.models.functions.text.Lower("name"), name="actors_name_lower_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="actors",
+            index=models.Index(django.db.models.functions.text.Lower("surname"), name="actors_surname_lower_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="categories",
+            index=models.Index(django.db.models.functions.text.Lower("name"), name="categories_name_lower_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="directors",
+            index=models.Index(django.db.models.functions.text.Lower("name"), name="directors_name_lower_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="directors",
+            index=models.Index(django.db.models.functions.text.Lower("surname"), name="directors_surname_lower_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="movies",
+            index=models.Index(django.db.models.functions.text.Lower("title"), name="movies_title_lower_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="movies",
+            index=models.Index(django.db.models.functions.text.Lower("language"), name="movies_language_lower_idx"),
+        ),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
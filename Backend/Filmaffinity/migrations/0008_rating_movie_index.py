@@ -0,0 +1,17 @@
+# Generated by Django 4.2.11 on 2026-10-17 20:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("Filmaffinity", "0007_filter_indexes"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="rating",
+            index=models.Index(fields=["movie", "id"], name="rating_movie_id_idx"),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.11 on 2026-10-17 20:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("Filmaffinity", "0008_rating_movie_index"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="rating",
+            index=models.Index(fields=["user", "id"], name="rating_user_id_idx"),
+        ),
+    ]
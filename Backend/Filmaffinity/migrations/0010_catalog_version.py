@@ -0,0 +1,36 @@
+# Generated by Django 4.2.11 on 2026-10-17 20:50
+
+from django.db import migrations, models
+from django.utils import timezone
+
+CATALOG_SCOPES = ["movies", "actors", "directors", "categories", "ratings"]
+
+
+def create_catalog_versions(apps, schema_editor):
+    CatalogVersion = apps.get_model("Filmaffinity", "CatalogVersion")
+    CatalogVersion.objects.bulk_create(
+        [CatalogVersion(scope=scope, version=1, updated_at=timezone.now()) for scope in CATALOG_SCOPES],
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("Filmaffinity", "0009_rating_user_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CatalogVersion",
+            fields=[
+                ("scope", models.CharField(max_length=20, primary_key=True, serialize=False)),
+                ("version", models.PositiveBigIntegerField(default=0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "verbose_name": "catalog version",
+                "verbose_name_plural": "catalog versions",
+            },
+        ),
+        migrations.RunPython(create_catalog_versions, migrations.RunPython.noop),
+    ]
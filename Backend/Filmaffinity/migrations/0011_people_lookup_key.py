@@ -0,0 +1,44 @@
+# Generated by Django 4.2.11 on 2026-10-17 22:10
+
+from django.db import migrations, models
+from django.db.models import F, Value
+from django.db.models.functions import Concat
+
+
+def fill_lookup_keys(apps, schema_editor):
+    # The names are already stored normalized, see person_key
+    for model_name in ["Actors", "Directors"]:
+        model = apps.get_model("Filmaffinity", model_name)
+        model.objects.update(
+            lookup_key=Concat(F("name"), Value("|"), F("surname"), output_field=models.CharField())
+        )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("Filmaffinity", "0010_catalog_version"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="actors",
+            name="lookup_key",
+            field=models.CharField(editable=False, max_length=513, null=True),
+        ),
+        migrations.AddField(
+            model_name="directors",
+            name="lookup_key",
+            field=models.CharField(editable=False, max_length=513, null=True),
+        ),
+        migrations.RunPython(fill_lookup_keys, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="actors",
+            name="lookup_key",
+            field=models.CharField(editable=False, max_length=513, unique=True),
+        ),
+        migrations.AlterField(
+            model_name="directors",
+            name="lookup_key",
+            field=models.CharField(editable=False, max_length=513, unique=True),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.11 on 2026-10-17 21:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("Filmaffinity", "0011_people_lookup_key"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="movies",
+            name="poster_variants",
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
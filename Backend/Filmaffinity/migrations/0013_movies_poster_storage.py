@@ -0,0 +1,24 @@
+# Generated by Django 4.2.11 on 2026-10-17 21:22
+
+import Filmaffinity.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("Filmaffinity", "0012_movies_poster_variants"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="movies",
+            name="poster",
+            field=models.ImageField(
+                blank=True,
+                default="posters/default.png",
+                null=True,
+                storage=Filmaffinity.storage.ContentAddressedStorage(),
+                upload_to="posters/",
+            ),
+        ),
+    ]
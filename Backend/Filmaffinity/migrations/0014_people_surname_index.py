@@ -0,0 +1,20 @@
+# Generated by Django 4.2.11 on 2026-10-17 21:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("Filmaffinity", "0013_movies_poster_storage"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="actors",
+            index=models.Index(fields=["surname", "name"], name="actors_surname_name_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="directors",
+            index=models.Index(fields=["surname", "name"], name="directors_surname_name_idx"),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 4.2.11 on 2026-10-17 21:35
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("Filmaffinity", "0014_people_surname_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="movies",
+            name="similar_stale",
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.CreateModel(
+            name="SimilarMovie",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("rank", models.PositiveSmallIntegerField()),
+                ("score", models.FloatField()),
+                (
+                    "movie",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="similar_movies",
+                        to="Filmaffinity.movies",
+                    ),
+                ),
+                (
+                    "similar",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="Filmaffinity.movies",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "similar movie",
+                "verbose_name_plural": "similar movies",
+                "ordering": ("movie", "rank"),
+                "unique_together": {("movie", "rank")},
+            },
+        ),
+    ]
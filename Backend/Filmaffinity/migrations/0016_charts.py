@@ -0,0 +1,79 @@
+# Generated by Django 4.2.11 on 2026-10-17 21:44
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("Filmaffinity", "0015_similar_movies"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ChartPrior",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("mean_rating", models.FloatField()),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "verbose_name": "chart prior",
+                "verbose_name_plural": "chart priors",
+            },
+        ),
+        migrations.CreateModel(
+            name="ChartEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "chart",
+                    models.CharField(
+                        choices=[
+                            ("overall", "Overall"),
+                            ("genre", "Genre"),
+                            ("decade", "Decade"),
+                            ("language", "Language"),
+                        ],
+                        max_length=10,
+                    ),
+                ),
+                ("key", models.CharField(blank=True, default="", max_length=50)),
+                ("weighted_rating", models.FloatField()),
+                (
+                    "movie",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="chart_entries",
+                        to="Filmaffinity.movies",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "chart entry",
+                "verbose_name_plural": "chart entries",
+                "indexes": [
+                    models.Index(
+                        fields=["chart", "key", "-weighted_rating", "movie"],
+                        name="chart_entry_rank_idx",
+                    )
+                ],
+            },
+        ),
+    ]
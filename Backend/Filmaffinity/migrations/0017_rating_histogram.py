@@ -0,0 +1,80 @@
+# Generated by Django 4.2.11 on 2026-10-17 21:49
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def compute_rating_histograms(apps, schema_editor):
+    Movies = apps.get_model("Filmaffinity", "Movies")
+    Rating = apps.get_model("Filmaffinity", "Rating")
+
+    ratings = Rating.objects.filter(movie=OuterRef("pk")).order_by().values("movie")
+    Movies.objects.update(
+        **{
+            f"rating_count_{score}": Coalesce(
+                Subquery(ratings.filter(rating=score).annotate(count=Count("id")).values("count")), 0
+            )
+            for score in range(1, 11)
+        }
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("Filmaffinity", "0016_charts"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="movies",
+            name="rating_count_1",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="movies",
+            name="rating_count_2",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="movies",
+            name="rating_count_3",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="movies",
+            name="rating_count_4",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="movies",
+            name="rating_count_5",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="movies",
+            name="rating_count_6",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="movies",
+            name="rating_count_7",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="movies",
+            name="rating_count_8",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="movies",
+            name="rating_count_9",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="movies",
+            name="rating_count_10",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(compute_rating_histograms, migrations.RunPython.noop),
+    ]
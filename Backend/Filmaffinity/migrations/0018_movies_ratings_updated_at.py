@@ -0,0 +1,19 @@
+# Generated by Django 4.2.11 on 2026-10-17 22:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("Filmaffinity", "0017_rating_histogram"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="movies",
+            name="ratings_updated_at",
+            field=models.DateTimeField(
+                blank=True, db_index=True, editable=False, null=True
+            ),
+        ),
+    ]
@@ -0,0 +1,16 @@
+# Generated by Django 4.2.11 on 2026-10-17 22:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("Filmaffinity", "0018_movies_ratings_updated_at"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="movies",
+            index=models.Index(fields=["title", "id"], name="movies_title_id_idx"),
+        ),
+    ]
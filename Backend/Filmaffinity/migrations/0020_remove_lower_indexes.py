@@ -0,0 +1,40 @@
+# Generated by Django 4.2.11 on 2026-10-17 22:28
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("Filmaffinity", "0019_movies_title_id_index"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="actors",
+            name="actors_name_lower_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="actors",
+            name="actors_surname_lower_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="categories",
+            name="categories_name_lower_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="directors",
+            name="directors_name_lower_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="directors",
+            name="directors_surname_lower_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="movies",
+            name="movies_title_lower_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="movies",
+            name="movies_language_lower_idx",
+        ),
+    ]
@@ -1,10 +1,12 @@
-from django.db import models
+from django.db import models, transaction
 
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import RegexValidator
-from django.utils.text import slugify
 from django.utils.translation import gettext_lazy as _
 
+from .normalization import normalize, person_key
+from .storage import ContentAddressedStorage
+
 
 # Create your models here.
 class PlatformUsers(AbstractUser):
@@ -69,12 +71,12 @@ class Categories(models.Model):
         verbose_name_plural = _("categories")
 
     def __str__(self):
-        # The first letter of each word is capitalized
-        return self.name.title()
+        # The name is stored normalized, with the first letter of each word capitalized
+        return self.name
 
     def save(self, *args, **kwargs):
         # Normalize the name of the category
-        self.name = slugify(self.name, allow_unicode=True).replace('-', ' ').title()
+        self.name = normalize(self.name)
         super().save(*args, **kwargs)
 
     @classmethod
@@ -86,7 +88,7 @@ class Categories(models.Model):
         to avoid trying to create the same category with different cases,
         which would raise an IntegrityError.
         """
-        normalized_name = slugify(name, allow_unicode=True).replace('-', ' ').title()
+        normalized_name = normalize(name)
 
         # Usa get_or_create con los datos normalizados
         return cls.objects.get_or_create(
@@ -110,21 +112,29 @@ class Actors(models.Model):
     surname = models.CharField(max_length=256,
                                validators=[RegexValidator("^[a-zA-Z ]+$")])
 
+    # Normalized name and surname in a single column, see person_key.
+    # It is set when saving and used to look up the actors exactly
+    lookup_key = models.CharField(max_length=513, unique=True, editable=False)
+
     class Meta:
         # We order the actors by name in alphabetical order
         ordering = ('name',)
         unique_together = ('name', 'surname')
+        # The typeahead searches by the name with the index of unique_together
+        # and by the surname with the index of the surname and name
+        indexes = [models.Index(fields=['surname', 'name'], name='actors_surname_name_idx')]
         verbose_name = _("actor")
         verbose_name_plural = _("actors")
 
     def __str__(self):
-        # Return Name + Surame capitalized
-        return f"{self.name.title()} {self.surname.title()}"
+        # Return Name + Surame, they are stored capitalized
+        return f"{self.name} {self.surname}"
 
     def save(self, *args, **kwargs):
         # Normalize the name of the actor
-        self.name = slugify(self.name, allow_unicode=True).replace('-', ' ').title()
-        self.surname = slugify(self.surname, allow_unicode=True).replace('-', ' ').title()
+        self.name = normalize(self.name)
+        self.surname = normalize(self.surname)
+        self.lookup_key = person_key(self.name, self.surname)
         super().save(*args, **kwargs)
 
     @classmethod
@@ -136,13 +146,12 @@ class Actors(models.Model):
         to avoid trying to create the same actor with different cases,
         which would raise an IntegrityError.
         """
-        normalized_name = slugify(name, allow_unicode=True).replace('-', ' ').title()
-        normalized_surname = slugify(surname, allow_unicode=True).replace('-', ' ').title()
+        normalized_name = normalize(name)
+        normalized_surname = normalize(surname)
 
         # Usa get_or_create con los datos normalizados
         return cls.objects.get_or_create(
-            name=normalized_name,
-            surname=normalized_surname,
+            lookup_key=person_key(normalized_name, normalized_surname),
             defaults={'name': normalized_name, 'surname': normalized_surname}
         )
 
@@ -162,21 +171,29 @@ class Directors(models.Model):
     surname = models.CharField(max_length=256,
                                validators=[RegexValidator("^[a-zA-Z ]+$")])
 
+    # Normalized name and surname in a single column, see person_key.
+    # It is set when saving and used to look up the directors exactly
+    lookup_key = models.CharField(max_length=513, unique=True, editable=False)
+
     class Meta:
         # We order the directors by name in alphabetical order
         ordering = ('name',)
         unique_together = ('name', 'surname')
+        # The typeahead searches by the name with the index of unique_together
+        # and by the surname with the index of the surname and name
+        indexes = [models.Index(fields=['surname', 'name'], name='directors_surname_name_idx')]
         verbose_name = _("director")
         verbose_name_plural = _("directors")
 
     def __str__(self):
-        # Return Name + Surame capitalized
-        return f"{self.name.title()} {self.surname.title()}"
+        # Return Name + Surame, they are stored capitalized
+        return f"{self.name} {self.surname}"
 
     def save(self, *args, **kwargs):
         # Normalize the name of the director
-        self.name = slugify(self.name, allow_unicode=True).replace('-', ' ').title()
-        self.surname = slugify(self.surname, allow_unicode=True).replace('-', ' ').title()
+        self.name = normalize(self.name)
+        self.surname = normalize(self.surname)
+        self.lookup_key = person_key(self.name, self.surname)
         super().save(*args, **kwargs)
 
     @classmethod
@@ -188,17 +205,21 @@ class Directors(models.Model):
         to avoid trying to create the same director with different cases,
         which would raise an IntegrityError.
         """
-        normalized_name = slugify(name, allow_unicode=True).replace('-', ' ').title()
-        normalized_surname = slugify(surname, allow_unicode=True).replace('-', ' ').title()
+        normalized_name = normalize(name)
+        normalized_surname = normalize(surname)
 
         # Use get_or_create with normalized data
         return cls.objects.get_or_create(
-            name=normalized_name,
-            surname=normalized_surname,
+            lookup_key=person_key(normalized_name, normalized_surname),
             defaults={'name': normalized_name, 'surname': normalized_surname}
         )
 
 
+# Scores of the ratings, and the fields of the movies with the number of ratings of each score
+RATING_SCORES = range(1, 11)
+RATING_HISTOGRAM_FIELDS = [f'rating_count_{score}' for score in RATING_SCORES]
+
+
 class Movies(models.Model):
     """
     This class defines the movies.
@@ -211,6 +232,13 @@ class Movies(models.Model):
     - duration: duration of the movie
     - release_date: release date of the movie
     - language: language of the movie
+    - rating_count: number of ratings of the movie
+    - rating_sum: sum of the ratings of the movie
+    - average_rating: average rating of the movie
+    - rating_count_1 to rating_count_10: number of ratings of the movie with each score
+    - ratings_updated_at: date of the last change of the ratings of the movie
+    - poster_variants: names of the resized versions of the poster
+    - similar_stale: whether the ratings have changed since its similar movies were computed
     """
 
     # In difference with the user, we allow any character in the title
@@ -232,25 +260,76 @@ class Movies(models.Model):
     release_date = models.DateField()
     language = models.CharField(max_length=50)
 
-    # Poster of the movie
+    # Poster of the movie, named by the hash of its content so the
+    # same image is only stored once, see ContentAddressedStorage
     poster = models.ImageField(upload_to='posters/',
+                               storage=ContentAddressedStorage(),
                                blank=True,
                                null=True,
                                default='posters/default.png')
 
+    # Resized and recompressed versions of the poster, by size and format,
+    # with the name of the poster they come from. They are generated in
+    # the background after the poster is saved, see posters.py
+    poster_variants = models.JSONField(default=dict, blank=True, editable=False)
+
+    # Rating aggregates. They are updated every time a rating is written,
+    # so the average rating can be filtered and ordered using an index
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    average_rating = models.FloatField(blank=True, null=True, db_index=True)
+
+    # Number of ratings of each score, updated with the rating aggregates,
+    # so the distribution of the ratings is known without reading them
+    rating_count_1 = models.PositiveIntegerField(default=0, editable=False)
+    rating_count_2 = models.PositiveIntegerField(default=0, editable=False)
+    rating_count_3 = models.PositiveIntegerField(default=0, editable=False)
+    rating_count_4 = models.PositiveIntegerField(default=0, editable=False)
+    rating_count_5 = models.PositiveIntegerField(default=0, editable=False)
+    rating_count_6 = models.PositiveIntegerField(default=0, editable=False)
+    rating_count_7 = models.PositiveIntegerField(default=0, editable=False)
+    rating_count_8 = models.PositiveIntegerField(default=0, editable=False)
+    rating_count_9 = models.PositiveIntegerField(default=0, editable=False)
+    rating_count_10 = models.PositiveIntegerField(default=0, editable=False)
+
+    # Date of the last change of the ratings of the movie, set with the rating
+    # aggregates. It is the version of its ratings in the ETags of the responses,
+    # and the index gives the last change of any movie without a global row
+    ratings_updated_at = models.DateTimeField(blank=True, null=True, editable=False, db_index=True)
+
+    # Names of the director, actors and genres of the movie, used by the
+    # full text search. It is updated when the credits of the movie change
+    search_credits = models.TextField(blank=True, default='', editable=False)
+
+    # The ratings of the movie have changed since its similar movies were
+    # computed. It is set with the rating aggregates, see build_similar_movies
+    similar_stale = models.BooleanField(default=False, editable=False)
+
     class Meta:
         # Ordenamos las películas por orden alfabético
         ordering = ('title',)
+        # Index of the order of the keyset pagination
+        indexes = [models.Index(fields=['title', 'id'], name='movies_title_id_idx')]
         verbose_name = _("movie")
         verbose_name_plural = _("movies")
 
     def __str__(self):
-        return self.title.title()
+        # The title is stored normalized
+        return self.title
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Keep the director stored in the database, so the search
+        # credits are only rebuilt on save when it has changed
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
 
     def save(self, *args, **kwargs):
         # Title is normalized
-        self.title = slugify(self.title, allow_unicode=True).replace('-', ' ').title()
+        self.title = normalize(self.title)
         super().save(*args, **kwargs)
+        self._loaded_values = {**getattr(self, '_loaded_values', {}), 'director_id': self.director_id}
     
     @classmethod
     def get_or_create_normalized(cls, title):
@@ -261,7 +340,7 @@ class Movies(models.Model):
         to avoid trying to create the same movie with different cases,
         which would raise an IntegrityError.
         """
-        normalized_title = slugify(title, allow_unicode=True).replace('-', ' ').title()
+        normalized_title = normalize(title)
 
         # Use get_or_create with normalized data
         return cls.objects.get_or_create(
@@ -293,8 +372,149 @@ class Rating(models.Model):
 
         # A user cannot rate a movie more than once
         unique_together = ('user', 'movie')
+
+        # The ratings of a movie and of a user are listed by id
+        indexes = [
+            models.Index(fields=['movie', 'id'], name='rating_movie_id_idx'),
+            models.Index(fields=['user', 'id'], name='rating_user_id_idx'),
+        ]
         verbose_name = _("rating")
         verbose_name_plural = _("ratings")
 
     def __str__(self):
         return f"{self.user.email} has rated {self.movie.title} with a {self.rating}."
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Keep the values stored in the database, so the aggregates
+        # of the movie can be updated with the difference on save
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def save(self, *args, **kwargs):
+        # The aggregates of the movie are updated in the post_save signal,
+        # so the rating and the aggregates are written in the same transaction
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+        self._loaded_values = {'movie_id': self.movie_id, 'rating': self.rating}
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            return super().delete(*args, **kwargs)
+
+
+class SimilarMovie(models.Model):
+    """
+    The movies most similar to each movie, by the ratings of the users
+    that have rated both, computed offline by build_similar_movies.
+
+    A similar movie has the following fields:
+    - movie: movie the similar movie is recommended for
+    - similar: recommended movie
+    - rank: position of the recommendation, from 0 (the most similar)
+    - score: similarity of the ratings of both movies, up to 1
+    """
+
+    movie = models.ForeignKey(Movies, on_delete=models.CASCADE, related_name='similar_movies')
+    similar = models.ForeignKey(Movies, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        ordering = ('movie', 'rank')
+        # The similar movies of a movie are read in order with this index
+        unique_together = ('movie', 'rank')
+        verbose_name = _("similar movie")
+        verbose_name_plural = _("similar movies")
+
+    def __str__(self):
+        return f'{self.similar_id} is similar to {self.movie_id} ({self.score:.2f})'
+
+
+class ChartEntry(models.Model):
+    """
+    Position of a movie in a top chart, ranked by its weighted rating.
+    The entries of a movie are rebuilt every time its ratings, genres,
+    release date or language change, see charts.py.
+
+    A chart entry has the following fields:
+    - chart: kind of chart (overall, genre, decade or language)
+    - key: genre, first year of the decade or language of the chart, in
+      lower case, empty in the overall chart
+    - movie: movie of the entry
+    - weighted_rating: average rating of the movie weighted by its number of ratings
+    """
+    OVERALL = 'overall'
+    GENRE = 'genre'
+    DECADE = 'decade'
+    LANGUAGE = 'language'
+    CHARTS = [
+        (OVERALL, _('Overall')),
+        (GENRE, _('Genre')),
+        (DECADE, _('Decade')),
+        (LANGUAGE, _('Language')),
+    ]
+
+    chart = models.CharField(max_length=10, choices=CHARTS)
+    key = models.CharField(max_length=50, blank=True, default='')
+    movie = models.ForeignKey(Movies, on_delete=models.CASCADE, related_name='chart_entries')
+    weighted_rating = models.FloatField()
+
+    class Meta:
+        # The pages of a chart are read in order with this index
+        indexes = [models.Index(fields=['chart', 'key', '-weighted_rating', 'movie'],
+                                name='chart_entry_rank_idx')]
+        verbose_name = _("chart entry")
+        verbose_name_plural = _("chart entries")
+
+    def __str__(self):
+        return f'{self.chart} {self.key}: {self.movie_id} ({self.weighted_rating:.2f})'
+
+
+class ChartPrior(models.Model):
+    """
+    Mean rating of all the movies, towards which the weighted rating of
+    the movies with few ratings is pulled. It changes slowly, so it is
+    only computed again when all the charts are rebuilt. There is a
+    single row.
+
+    A chart prior has the following fields:
+    - mean_rating: mean of all the ratings
+    - updated_at: date of the last computation
+    """
+
+    mean_rating = models.FloatField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = _("chart prior")
+        verbose_name_plural = _("chart priors")
+
+    def __str__(self):
+        return f'{self.mean_rating:.2f}'
+
+
+class CatalogVersion(models.Model):
+    """
+    Version of each part of the catalog, used to know if a response
+    that a client already has is still valid without building it again.
+    The version of a part is increased every time one of its rows
+    is created, updated or deleted.
+
+    A catalog version has the following fields:
+    - scope: part of the catalog (movies, actors, directors, categories or ratings)
+    - version: number of changes of the part
+    - updated_at: date of the last change of the part
+    """
+
+    scope = models.CharField(max_length=20, primary_key=True)
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = _("catalog version")
+        verbose_name_plural = _("catalog versions")
+
+    def __str__(self):
+        return f'{self.scope} v{self.version}'
@@ -0,0 +1,27 @@
+from functools import lru_cache
+
+from django.utils.text import slugify
+
+# Number of different values kept by the normalizer. The names of the
+# people and genres repeat a lot (in an import or in the pages of a list),
+# so the most used ones are normalized only once per process
+NORMALIZE_CACHE_SIZE = 65536
+
+
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def normalize(value):
+    """
+    Normalizes a title or a name: the accents and the letters of other
+    alphabets are kept, the symbols are removed, the hyphens are replaced
+    with spaces and the first letter of each word is capitalized.
+    """
+    return slugify(value, allow_unicode=True).replace('-', ' ').title()
+
+
+def person_key(name, surname):
+    """
+    Returns the lookup key of a director or an actor, a single value
+    with the normalized name and surname that can be compared exactly.
+    The separator can not be part of a normalized name.
+    """
+    return f'{normalize(name)}|{normalize(surname)}'
@@ -0,0 +1,187 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination, CursorPagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class PageSizeMixin:
+    """
+    Reads the page size of each request from the 'page_size' param.
+
+    The size is stored in the paginator instance, which is created for
+    every request, so concurrent requests never see each other's size.
+    The size can not be greater than the MAX_PAGE_SIZE setting.
+    """
+    page_size_query_param = 'page_size'
+    page_size = api_settings.PAGE_SIZE
+
+    def get_page_size(self, request):
+        page_size = request.query_params.get(self.page_size_query_param)
+        if page_size is None:
+            return self.page_size
+
+        try:
+            page_size = int(page_size)
+        except ValueError:
+            raise ValidationError('Page size must be an integer')
+        if page_size < 1:
+            raise ValidationError('Page size must be greater than 0')
+        return min(page_size, getattr(settings, 'MAX_PAGE_SIZE', 100))
+
+
+class MoviePageNumberPagination(PageSizeMixin, PageNumberPagination):
+    """
+    Numbered pages with the total count of the results.
+    """
+
+
+class OptionalPageNumberPagination(PageSizeMixin, PageNumberPagination):
+    """
+    Numbered pages with the total count of the results, only when the
+    'page' or 'page_size' param is sent. Otherwise the whole list is
+    returned, as the clients that do not paginate expect.
+    """
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not {self.page_query_param, self.page_size_query_param} & set(request.query_params):
+            return None
+        return super().paginate_queryset(queryset, request, view)
+
+
+class RatingCursorPagination(PageSizeMixin, CursorPagination):
+    """
+    Cursor pages of the ratings of a movie, in the order they were created.
+    """
+    ordering = 'id'
+
+
+class KeysetPagination(PageSizeMixin, BasePagination):
+    """
+    Pagination that continues from the last row of the previous page
+    instead of counting and skipping the rows of the previous pages.
+
+    The rows are ordered by the fields of 'ordering', which together must be
+    unique, and the cursor is an opaque string with the values of those fields
+    in the first or the last row of the page. Every page costs the same
+    whatever its position, and the total is never counted.
+    """
+    ordering = ('title', 'id')
+    # Type of the value of each field of 'ordering' in the cursors
+    ordering_types = (str, int)
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        position, reverse = self.decode_cursor(request)
+
+        ordering = [f'-{field}' if reverse else field for field in self.ordering]
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self.after(position, reverse))
+
+        # We read one more row to know if there is another page
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+
+        if reverse:
+            # Going back we read the rows in the opposite order
+            rows.reverse()
+            self.has_next = position is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+
+        self.page = rows
+        return rows
+
+    def after(self, position, reverse):
+        """
+        Returns the condition of the rows that come after the position,
+        (a, b) > (x, y) is written as a >= x AND (a > x OR (a = x AND b > y)).
+        The first part is redundant, but it is a range of the first field
+        of the index of the ordering, so the database starts reading the
+        index at the position instead of reading it from the beginning.
+        """
+        lookup = 'lt' if reverse else 'gt'
+        conditions = []
+        for i, field in enumerate(self.ordering):
+            equal = {name: value for name, value in zip(self.ordering[:i], position[:i])}
+            conditions.append(Q(**equal, **{f'{field}__{lookup}': position[i]}))
+        return Q(**{f'{self.ordering[0]}__{lookup}e': position[0]}) & reduce(or_, conditions)
+
+    def decode_cursor(self, request):
+        """
+        Returns the position and the direction of the cursor of the request.
+        """
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor is None:
+            return None, False
+
+        try:
+            data = json.loads(urlsafe_b64decode(cursor.encode('ascii')))
+            position, reverse = data['p'], bool(data.get('r', False))
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        for value, value_type in zip(position, self.ordering_types):
+            # A bool is not an int here, and the ints must fit in a column of the database
+            if type(value) is not value_type or (value_type is int and not -2 ** 63 <= value < 2 ** 63):
+                raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    def encode_cursor(self, row, reverse):
+        """
+        Returns the url of the page that starts after the row, or before it if reverse.
+        """
+        data = {'p': [getattr(row, field) for field in self.ordering]}
+        if reverse:
+            data['r'] = True
+        cursor = urlsafe_b64encode(json.dumps(data).encode('utf-8')).decode('ascii')
+        return replace_query_param(self.request.build_absolute_uri(),
+                                   self.cursor_query_param, cursor)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if not self.page:
+            return remove_query_param(self.request.build_absolute_uri(), self.cursor_query_param)
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.request.build_absolute_uri(), self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
@@ -0,0 +1,128 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from PIL import Image, ImageOps, features
+
+from .caching import bump_catalog_version, invalidate_movie_responses
+from .models import Movies
+
+logger = logging.getLogger(__name__)
+
+# Maximum size (width, height) of each variant, the poster is fit inside it
+POSTER_SIZES = {
+    'thumb': (160, 240),   # Lists
+    'medium': (480, 720),  # Details
+}
+
+# Quality of the compression of each format
+POSTER_QUALITY = {'webp': 80, 'avif': 60}
+
+# Directory of the variants, next to the posters
+VARIANTS_DIRECTORY = 'posters/variants'
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def poster_formats():
+    """
+    Returns the formats of the variants. AVIF is only generated
+    if the installed version of Pillow can write it.
+    """
+    formats = ['webp']
+    if 'avif' in features.modules and features.check_module('avif'):
+        formats.append('avif')
+    return formats
+
+
+def generate_poster_variants(movie_id, force=False):
+    """
+    Generates the variants of the poster of a movie, resized and recompressed,
+    and stores their names in poster_variants with the name of the poster
+    they come from. If another movie has the same poster its variants are
+    reused, unless force is True, so they are only generated once.
+    Returns the variants, or None if the movie does not exist or has no poster.
+    """
+    poster_name = Movies.objects.filter(pk=movie_id).values_list('poster', flat=True).first()
+    if not poster_name:
+        return None
+
+    variants = None
+    if not force:
+        variants = (Movies.objects.filter(poster=poster_name, poster_variants__source=poster_name)
+                    .values_list('poster_variants', flat=True).first())
+    if variants is None:
+        storage = Movies._meta.get_field('poster').storage
+        with storage.open(poster_name, 'rb') as poster:
+            image = Image.open(poster)
+            image.load()
+        # The photos may be rotated with the EXIF orientation
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if image.has_transparency_data else 'RGB')
+
+        variants = {'source': poster_name}
+        for size, max_size in POSTER_SIZES.items():
+            resized = image.copy()
+            resized.thumbnail(max_size, Image.LANCZOS)
+            variants[size] = {}
+            for image_format in poster_formats():
+                buffer = BytesIO()
+                resized.save(buffer, format=image_format.upper(), quality=POSTER_QUALITY[image_format])
+                # The storage names the variant by the hash of its content
+                variants[size][image_format] = storage.save(f'{VARIANTS_DIRECTORY}/{size}.{image_format}',
+                                                            ContentFile(buffer.getvalue()))
+
+    # Only if the poster has not been changed in the meantime
+    if Movies.objects.filter(pk=movie_id, poster=poster_name).update(poster_variants=variants):
+        # The variants are part of the responses of the movie
+        bump_catalog_version('movies')
+        invalidate_movie_responses([movie_id])
+    return variants
+
+
+def run_poster_job(movie_id, force=False):
+    """
+    Generates the variants of a poster in a worker, logging the errors
+    instead of raising them, as there is no request to return them to.
+    """
+    try:
+        return generate_poster_variants(movie_id, force)
+    except Exception:
+        logger.exception('The variants of the poster of the movie %s could not be generated', movie_id)
+    finally:
+        # The workers do not end like the requests, so their connections are closed here
+        if threading.current_thread() is not threading.main_thread():
+            connections.close_all()
+
+
+def get_executor():
+    """
+    Returns the pool of workers of the posters, created on first use.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.POSTER_WORKERS,
+                                           thread_name_prefix='posters')
+    return _executor
+
+
+def schedule_poster_variants(movie_id):
+    """
+    Generates the variants of the poster of a movie once the transaction
+    is committed, in the pool of workers, so the request does not wait for
+    the images. With POSTER_WORKERS = 0 they are generated in the request.
+    """
+    def submit():
+        if getattr(settings, 'POSTER_WORKERS', 2) > 0:
+            get_executor().submit(run_poster_job, movie_id)
+        else:
+            run_poster_job(movie_id)
+
+    transaction.on_commit(submit)
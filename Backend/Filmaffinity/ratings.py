@@ -0,0 +1,130 @@
+from django.db.models import Avg, Case, Count, F, FloatField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce
+from django.utils import timezone
+
+from .caching import bump_catalog_version, invalidate_movie_responses
+from .charts import min_ratings, refresh_chart_entries, update_chart_ratings
+from .models import RATING_HISTOGRAM_FIELDS, RATING_SCORES, Movies, Rating
+
+
+def apply_rating_change(movie_id, old_rating=None, new_rating=None):
+    """
+    Updates the rating aggregates of a movie with the difference
+    produced by a rating write:
+    - create: only new_rating
+    - update: old_rating and new_rating
+    - delete: only old_rating
+
+    Everything is done in a single UPDATE statement, which uses the old
+    values of the row in the right hand side, so concurrent writes
+    cannot lose any change. The counter of the score of each rating is
+    updated with the count and the sum. The similar movies of the movie
+    are marked as stale in the same statement, and the date of the change
+    is the new version of its ratings, so no row shared by every movie is
+    locked. Then the weighted rating of its chart entries is updated, and
+    they are only rebuilt when the movie enters or leaves the charts.
+    Returns the number of movies updated.
+    """
+    counters = {}
+    for rating, delta in ((old_rating, -1), (new_rating, 1)):
+        if rating is not None and int(rating) in RATING_SCORES:
+            field = RATING_HISTOGRAM_FIELDS[RATING_SCORES.index(int(rating))]
+            counters[field] = counters.get(field, 0) + delta
+    count_delta = (new_rating is not None) - (old_rating is not None)
+    sum_delta = int(new_rating or 0) - int(old_rating or 0)
+
+    new_count = F('rating_count') + count_delta
+    new_sum = F('rating_sum') + sum_delta
+
+    updated = Movies.objects.filter(pk=movie_id).update(
+        rating_count=new_count,
+        rating_sum=new_sum,
+        # If the movie has no ratings left, there is no average
+        average_rating=Case(
+            When(rating_count=-count_delta, then=Value(None)),
+            default=Cast(new_sum, FloatField()) / new_count,
+            output_field=FloatField(),
+        ),
+        similar_stale=True,
+        ratings_updated_at=timezone.now(),
+        **{field: F(field) + delta for field, delta in counters.items() if delta},
+    )
+    if not updated:
+        return updated
+
+    if count_delta:
+        minimum = min_ratings()
+        rating_count = Movies.objects.filter(pk=movie_id).values_list('rating_count', flat=True).get()
+        if (rating_count >= minimum) != (rating_count - count_delta >= minimum):
+            refresh_chart_entries([movie_id])
+            return updated
+        if rating_count < minimum:
+            # Neither before nor now in the charts
+            return updated
+    update_chart_ratings(movie_id)
+    return updated
+
+
+def rebuild_rating_aggregates(movie_ids=None):
+    """
+    Recomputes the rating aggregates of the movies, with the number of
+    ratings of each score, from the Rating table.
+    If movie_ids is None, the aggregates of every movie are rebuilt.
+    Otherwise the ratings of those movies have changed, so their similar
+    movies are also marked as stale. The chart entries of the movies are
+    rebuilt too. Returns the number of movies updated.
+
+    The version of the ratings of the whole catalog is only increased when
+    every movie is rebuilt, the other changes are versioned per movie.
+    """
+    ratings = Rating.objects.filter(movie=OuterRef('pk')).order_by().values('movie')
+
+    queryset = Movies.objects.all()
+    changes = {'ratings_updated_at': timezone.now()}
+    if movie_ids is not None:
+        queryset = queryset.filter(pk__in=movie_ids)
+        changes['similar_stale'] = True
+    else:
+        bump_catalog_version('ratings')
+
+    # The averages are part of the responses of the movies
+    invalidate_movie_responses(movie_ids, ratings_only=movie_ids is not None)
+
+    updated = queryset.update(
+        rating_count=Coalesce(Subquery(ratings.annotate(count=Count('id')).values('count')), 0),
+        rating_sum=Coalesce(Subquery(ratings.annotate(total=Sum('rating')).values('total')), 0),
+        average_rating=Subquery(ratings.annotate(average=Avg('rating')).values('average')),
+        **{field: Coalesce(Subquery(ratings.filter(rating=score).annotate(count=Count('id')).values('count')), 0)
+           for score, field in zip(RATING_SCORES, RATING_HISTOGRAM_FIELDS)},
+        **changes,
+    )
+    refresh_chart_entries(movie_ids)
+    return updated
+
+
+def rating_distribution(movie):
+    """
+    Returns the distribution of the ratings of a movie from its counters:
+    the number of ratings of each score, the total, the median and the
+    standard deviation. The median and the deviation are None without ratings.
+    """
+    histogram = {score: getattr(movie, field) for score, field in zip(RATING_SCORES, RATING_HISTOGRAM_FIELDS)}
+    count = sum(histogram.values())
+    if not count:
+        return {'histogram': histogram, 'count': 0, 'median': None, 'stddev': None}
+
+    def nth(position):
+        # The score of the rating at the position, with the ratings in order
+        for score, score_count in histogram.items():
+            if position < score_count:
+                return score
+            position -= score_count
+
+    mean = sum(score * score_count for score, score_count in histogram.items()) / count
+    variance = sum(score_count * (score - mean) ** 2 for score, score_count in histogram.items()) / count
+    return {
+        'histogram': histogram,
+        'count': count,
+        'median': (nth((count - 1) // 2) + nth(count // 2)) / 2,
+        'stddev': variance ** 0.5,
+    }
@@ -0,0 +1,191 @@
+import os
+import shutil
+import threading
+import uuid
+
+import numpy as np
+from django.conf import settings
+from scipy import sparse
+
+from .similarity import BLOCK_CELLS, load_ratings
+
+# Number of latent factors of each user and movie
+FACTORS = 32
+
+# Weight of the size of the factors in the error, per rating of the user or movie
+REGULARIZATION = 0.1
+
+# Number of alternating least squares steps
+ITERATIONS = 10
+
+# Number of movies recommended by default and at most
+RECOMMENDATIONS = 20
+MAX_RECOMMENDATIONS = 100
+
+# Arrays of a model, each one is stored in its own .npy file
+MODEL_ARRAYS = ('user_ids', 'movie_ids', 'user_factors', 'movie_factors')
+
+# File with the name of the directory of the current model
+CURRENT_MODEL = 'current'
+
+_model = (None, None)
+_model_lock = threading.Lock()
+
+
+class FactorModel:
+    """
+    Factors of the users and of the movies, such that the dot product of the
+    factors of a user and a movie predicts how much the user likes the movie
+    with respect to the mean rating. The ids are sorted, and the factors of
+    each id are in the same row of its array.
+    """
+
+    def __init__(self, user_ids, movie_ids, user_factors, movie_factors):
+        self.user_ids = user_ids
+        self.movie_ids = movie_ids
+        self.user_factors = user_factors
+        self.movie_factors = movie_factors
+
+    @classmethod
+    def load(cls, path):
+        """
+        Maps the arrays of the model in memory instead of reading them, so
+        the processes that load the same model share the same memory.
+        """
+        return cls(*(np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r') for name in MODEL_ARRAYS))
+
+    def save(self, path):
+        os.makedirs(path)
+        for name in MODEL_ARRAYS:
+            np.save(os.path.join(path, f'{name}.npy'), getattr(self, name))
+
+    def recommend(self, user_id, exclude=(), count=RECOMMENDATIONS):
+        """
+        Returns the ids and the scores of the 'count' movies with the best
+        score for the user, in order, without the ones in 'exclude'.
+        Returns None if the user had no ratings when the model was trained.
+        """
+        row = np.searchsorted(self.user_ids, user_id)
+        if row == len(self.user_ids) or self.user_ids[row] != user_id:
+            return None
+
+        scores = self.movie_factors @ self.user_factors[row]
+        excluded = np.isin(self.movie_ids, list(exclude))
+        scores[excluded] = -np.inf
+        count = min(count, len(scores) - int(excluded.sum()))
+        if count <= 0:
+            return self.movie_ids[:0], scores[:0]
+
+        best = np.argpartition(-scores, count - 1)[:count]
+        best = best[np.argsort(-scores[best], kind='stable')]
+        return self.movie_ids[best], scores[best]
+
+
+def solve_factors(matrix, fixed, regularization):
+    """
+    Returns the factors of the rows of the sparse matrix that best predict its
+    values from the factors 'fixed' of its columns, a step of alternating least
+    squares. Each row is a small linear system, and the systems of many rows
+    are built and solved at once. The rows without values have zero factors.
+    """
+    rows, factors = matrix.shape[0], fixed.shape[1]
+    result = np.zeros((rows, factors))
+    counts = np.diff(matrix.indptr)
+    # Number of values of each block, so its systems fit in BLOCK_CELLS
+    limit = max(1, BLOCK_CELLS // (factors * factors))
+
+    start = 0
+    while start < rows:
+        end = int(np.searchsorted(matrix.indptr, matrix.indptr[start] + limit, side='right')) - 1
+        end = min(max(end, start + 1), rows)
+        solved = np.flatnonzero(counts[start:end]) + start
+        if len(solved):
+            values = slice(matrix.indptr[start], matrix.indptr[end])
+            neighbors = fixed[matrix.indices[values]]
+            weighted = neighbors * matrix.data[values, None]
+            if len(solved) == 1:
+                # A single row may have too many values to build their products
+                left = (neighbors.T @ neighbors)[None]
+                right = weighted.sum(axis=0)[None]
+            else:
+                offsets = matrix.indptr[solved] - matrix.indptr[start]
+                left = np.add.reduceat(neighbors[:, :, None] * neighbors[:, None, :], offsets, axis=0)
+                right = np.add.reduceat(weighted, offsets, axis=0)
+            left += regularization * counts[solved, None, None] * np.eye(factors)
+            result[solved] = np.linalg.solve(left, right[..., None])[..., 0]
+        start = end
+    return result
+
+
+def train_model(factors=FACTORS, regularization=REGULARIZATION, iterations=ITERATIONS, seed=0):
+    """
+    Trains the factors of the users and the movies from all the ratings with
+    alternating least squares: the factors of the users are solved with the
+    factors of the movies fixed, then the other way round, 'iterations' times.
+    """
+    ratings = load_ratings()
+    user_ids, user_index = np.unique(ratings['user'], return_inverse=True)
+    movie_ids, movie_index = np.unique(ratings['movie'], return_inverse=True)
+
+    # The factors predict the difference with the mean rating
+    values = ratings['rating'] - ratings['rating'].mean() if len(ratings) else ratings['rating']
+    by_user = sparse.csr_matrix((values, (user_index, movie_index)), shape=(len(user_ids), len(movie_ids)))
+    by_movie = by_user.T.tocsr()
+
+    movie_factors = np.random.default_rng(seed).normal(scale=0.1, size=(len(movie_ids), factors))
+    user_factors = np.zeros((len(user_ids), factors))
+    for _ in range(iterations):
+        user_factors = solve_factors(by_user, movie_factors, regularization)
+        movie_factors = solve_factors(by_movie, user_factors, regularization)
+
+    return FactorModel(user_ids, movie_ids, user_factors.astype(np.float32), movie_factors.astype(np.float32))
+
+
+def publish_model(model, directory=None):
+    """
+    Saves the model in a new subdirectory of the models directory and makes
+    it the current one. The name of the current model is replaced at once,
+    so the web processes never load a model that is being written.
+    The older models are deleted, but the previous one is kept for the
+    processes that have just read its name. The processes that have them
+    mapped in memory keep reading them until they load the new one.
+    """
+    directory = directory or settings.RECOMMENDATION_MODEL_DIR
+    name = uuid.uuid4().hex
+    model.save(os.path.join(directory, name))
+
+    current = os.path.join(directory, CURRENT_MODEL)
+    try:
+        with open(current) as file:
+            previous = file.read().strip()
+    except FileNotFoundError:
+        previous = None
+    with open(f'{current}.{name}.part', 'w') as file:
+        file.write(name)
+    os.replace(f'{current}.{name}.part', current)
+
+    for entry in os.listdir(directory):
+        path = os.path.join(directory, entry)
+        if entry not in (name, previous) and os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+    return name
+
+
+def get_model():
+    """
+    Returns the current model, or None if no model has been trained yet.
+    Each process maps it in memory the first time, and again when a new
+    model is published.
+    """
+    global _model
+    directory = settings.RECOMMENDATION_MODEL_DIR
+    try:
+        with open(os.path.join(directory, CURRENT_MODEL)) as file:
+            name = file.read().strip()
+    except FileNotFoundError:
+        return None
+
+    with _model_lock:
+        if _model[0] != (directory, name):
+            _model = ((directory, name), FactorModel.load(os.path.join(directory, name)))
+        return _model[1]
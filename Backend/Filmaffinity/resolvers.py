@@ -0,0 +1,92 @@
+from django.db import transaction
+
+from .caching import bump_catalog_version
+from .models import Actors, Categories, Directors
+from .normalization import normalize, person_key
+
+# Part of the catalog of the rows of each model, see catalog_changed
+CATALOG_SCOPES = {
+    Actors: 'actors',
+    Directors: 'directors',
+    Categories: 'categories',
+}
+
+# Number of names looked up in each query
+LOOKUP_CHUNK_SIZE = 500
+
+
+def resolve_people(model, people, resolved=None):
+    """
+    Returns the primary keys of the directors or actors of the list of
+    (name, surname) pairs, in the same order. The names are normalized and
+    the people that do not exist are created.
+    """
+    keys = [(normalize(name), normalize(surname)) for name, surname in people]
+    resolved = {} if resolved is None else resolved
+    resolve_keys(model, keys, resolved)
+    return [resolved[key] for key in keys]
+
+
+def resolve_genres(names, resolved=None):
+    """
+    Returns the primary keys of the genres of the list of names, in the same
+    order. The names are normalized and the genres that do not exist are created.
+    """
+    keys = [normalize(name) for name in names]
+    resolved = {} if resolved is None else resolved
+    resolve_keys(Categories, keys, resolved)
+    return [resolved[key] for key in keys]
+
+
+def resolve_keys(model, keys, resolved, bump_version=True):
+    """
+    Adds to 'resolved' the primary keys of the directors, actors or genres of
+    the normalized keys, (name, surname) for people and name for genres.
+
+    The existing rows are read in a single query (per chunk of keys) and the
+    missing ones are inserted in a single query and read again, so it takes
+    one query if all of them exist and three otherwise, whatever the number of keys.
+    When rows are created the version of their part of the catalog is increased,
+    unless bump_version is False because the caller increases it once at the end.
+    """
+    missing = {key for key in keys if key not in resolved}
+    if not missing:
+        return
+
+    lookup_keys(model, missing, resolved)
+    missing = [key for key in missing if key not in resolved]
+    if missing:
+        # If another request creates the same row at the same time,
+        # it is not created twice and we read the one it has created.
+        # The bulk insert sends no signals, so we bump the version here.
+        # Inside a transaction (the import) no savepoint is needed
+        with transaction.atomic(savepoint=False):
+            model.objects.bulk_create([model(**key_fields(model, key)) for key in missing],
+                                      ignore_conflicts=True)
+            if bump_version:
+                bump_catalog_version(CATALOG_SCOPES[model])
+        lookup_keys(model, missing, resolved)
+
+
+def lookup_keys(model, keys, resolved):
+    """
+    Adds to 'resolved' the primary keys of the rows of the keys that exist.
+    """
+    keys = list(keys)
+    for start in range(0, len(keys), LOOKUP_CHUNK_SIZE):
+        chunk = keys[start:start + LOOKUP_CHUNK_SIZE]
+        if model is Categories:
+            rows = model.objects.filter(name__in=chunk).values_list('name', 'pk')
+        else:
+            # The people are looked up by their lookup key, a single unique column
+            by_lookup_key = {person_key(*key): key for key in chunk}
+            rows = ((by_lookup_key[lookup_key], pk) for lookup_key, pk in model.objects.filter(
+                lookup_key__in=by_lookup_key).values_list('lookup_key', 'pk'))
+        for key, pk in rows:
+            resolved[key] = pk
+
+
+def key_fields(model, key):
+    if model is Categories:
+        return {'name': key}
+    return {'name': key[0], 'surname': key[1], 'lookup_key': person_key(*key)}
@@ -0,0 +1,191 @@
+import re
+
+from django.db import connection as default_connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import Movies
+
+# Text search configuration of PostgreSQL. The 'simple' configuration
+# does not stem the words, so it works for titles in any language
+SEARCH_CONFIG = 'simple'
+
+# Name of the GIN index of PostgreSQL and of the FTS5 table of SQLite
+SEARCH_INDEX_NAME = 'movies_search_gin'
+FTS_TABLE = 'Filmaffinity_movies_fts'
+
+# Weights of the columns in the relevance of a result:
+# title, credits (director, actors and genres) and synopsis
+FTS_WEIGHTS = (10.0, 5.0, 1.0)
+
+FTS_TRIGGERS = {
+    f'{FTS_TABLE}_ai': f"""
+        CREATE TRIGGER IF NOT EXISTS "{FTS_TABLE}_ai" AFTER INSERT ON "Filmaffinity_movies" BEGIN
+            INSERT INTO "{FTS_TABLE}" (rowid, title, search_credits, synopsis)
+            VALUES (new.id, new.title, new.search_credits, new.synopsis);
+        END
+    """,
+    f'{FTS_TABLE}_ad': f"""
+        CREATE TRIGGER IF NOT EXISTS "{FTS_TABLE}_ad" AFTER DELETE ON "Filmaffinity_movies" BEGIN
+            INSERT INTO "{FTS_TABLE}" ("{FTS_TABLE}", rowid, title, search_credits, synopsis)
+            VALUES ('delete', old.id, old.title, old.search_credits, old.synopsis);
+        END
+    """,
+    f'{FTS_TABLE}_au': f"""
+        CREATE TRIGGER IF NOT EXISTS "{FTS_TABLE}_au"
+        AFTER UPDATE OF title, search_credits, synopsis ON "Filmaffinity_movies" BEGIN
+            INSERT INTO "{FTS_TABLE}" ("{FTS_TABLE}", rowid, title, search_credits, synopsis)
+            VALUES ('delete', old.id, old.title, old.search_credits, old.synopsis);
+            INSERT INTO "{FTS_TABLE}" (rowid, title, search_credits, synopsis)
+            VALUES (new.id, new.title, new.search_credits, new.synopsis);
+        END
+    """,
+}
+
+
+def search_vector():
+    """
+    Returns the weighted tsvector of a movie in PostgreSQL.
+    The GIN index of the movies is built on this same expression,
+    so the searches must use it to be able to use the index.
+    """
+    from django.contrib.postgres.search import SearchVector
+
+    return (SearchVector('title', weight='A', config=SEARCH_CONFIG)
+            + SearchVector('search_credits', weight='B', config=SEARCH_CONFIG)
+            + SearchVector('synopsis', weight='D', config=SEARCH_CONFIG))
+
+
+def install_search_index(connection, model=Movies):
+    """
+    Creates the full text index of the movies for the database in use:
+    - PostgreSQL: a GIN index on the weighted tsvector of the movie.
+    - SQLite: an FTS5 table kept up to date with triggers.
+    In SQLite the triggers are dropped every time Django remakes the movies
+    table in a migration, so this function is also called after every migrate.
+    """
+    if connection.vendor == 'postgresql':
+        from django.contrib.postgres.indexes import GinIndex
+
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_indexes WHERE indexname = %s", [SEARCH_INDEX_NAME])
+            if cursor.fetchone() is not None:
+                return
+        with connection.schema_editor() as schema_editor:
+            schema_editor.add_index(model, GinIndex(search_vector(), name=SEARCH_INDEX_NAME))
+
+    elif connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name IN (%s, %s, %s)",
+                           list(FTS_TRIGGERS))
+            if len(cursor.fetchall()) == len(FTS_TRIGGERS):
+                return
+
+            cursor.execute(f"""
+                CREATE VIRTUAL TABLE IF NOT EXISTS "{FTS_TABLE}" USING fts5(
+                    title, search_credits, synopsis,
+                    content='Filmaffinity_movies', content_rowid='id',
+                    tokenize='unicode61 remove_diacritics 2'
+                )
+            """)
+            for trigger in FTS_TRIGGERS.values():
+                cursor.execute(trigger)
+            # Index the rows written while the triggers did not exist
+            cursor.execute(f"""INSERT INTO "{FTS_TABLE}" ("{FTS_TABLE}") VALUES ('rebuild')""")
+
+
+def uninstall_search_index(connection):
+    """
+    Removes the full text index created by install_search_index.
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(f'DROP INDEX IF EXISTS "{SEARCH_INDEX_NAME}"')
+
+        elif connection.vendor == 'sqlite':
+            for trigger in FTS_TRIGGERS:
+                cursor.execute(f'DROP TRIGGER IF EXISTS "{trigger}"')
+            cursor.execute(f'DROP TABLE IF EXISTS "{FTS_TABLE}"')
+
+
+def search_movies(queryset, text, ranked=True):
+    """
+    Filters the queryset with the movies that match the text in the title,
+    the synopsis, the director, the actors or the genres, and orders them
+    by relevance. The relevance is annotated as 'search_rank'.
+    With ranked=False the movies are only filtered, which is cheaper and
+    can be used in a subquery.
+    """
+    words = re.findall(r'\w+', text)
+
+    # If there is nothing to search, there are no results
+    if not words:
+        return queryset.none()
+
+    if default_connection.vendor == 'postgresql':
+        from django.contrib.postgres.search import SearchQuery, SearchRank
+
+        vector = search_vector()
+        query = SearchQuery(' '.join(words), config=SEARCH_CONFIG, search_type='plain')
+        if not ranked:
+            return queryset.annotate(search_document=vector).filter(search_document=query)
+        return queryset.annotate(
+            search_document=vector,
+            search_rank=SearchRank(vector, query),
+        ).filter(search_document=query).order_by('-search_rank', 'title', 'id')
+
+    if default_connection.vendor == 'sqlite':
+        # Every word is quoted, so the text cannot contain FTS5 syntax
+        match = ' '.join(f'"{word}"' for word in words)
+        if not ranked:
+            # The ranked search joins the FTS5 table by the name of the movies
+            # table, which is renamed inside a subquery
+            return queryset.filter(pk__in=RawSQL(
+                f'SELECT rowid FROM "{FTS_TABLE}" WHERE "{FTS_TABLE}" MATCH %s', [match]))
+        weights = ', '.join(str(weight) for weight in FTS_WEIGHTS)
+        # bm25 is lower for better matches, so we change the sign
+        return queryset.extra(
+            select={'search_rank': f'-bm25("{FTS_TABLE}", {weights})'},
+            tables=[FTS_TABLE],
+            where=[f'"{FTS_TABLE}".rowid = "Filmaffinity_movies"."id"',
+                   f'"{FTS_TABLE}" MATCH %s'],
+            params=[match],
+        ).order_by('-search_rank', 'title', 'id')
+
+    # Other databases have no text index, every word must appear somewhere
+    for word in words:
+        queryset = queryset.filter(Q(title__icontains=word)
+                                   | Q(synopsis__icontains=word)
+                                   | Q(search_credits__icontains=word))
+    return queryset
+
+
+def refresh_search_credits(movie_ids):
+    """
+    Rebuilds the search_credits column of the movies, which contains the
+    names of the director, the actors and the genres of the movie.
+    The names of all the movies are read in three queries.
+    """
+    movie_ids = list(movie_ids)
+    if not movie_ids:
+        return
+
+    credits = {}
+    for pk, name, surname in Movies.objects.filter(pk__in=movie_ids).values_list(
+            'pk', 'director__name', 'director__surname'):
+        credits[pk] = [f'{name} {surname}']
+
+    for pk, name, surname in Movies.actors.through.objects.filter(
+            movies_id__in=movie_ids).order_by('pk').values_list(
+            'movies_id', 'actors__name', 'actors__surname'):
+        credits[pk].append(f'{name} {surname}')
+
+    for pk, name in Movies.genres.through.objects.filter(
+            movies_id__in=movie_ids).order_by('pk').values_list('movies_id', 'categories__name'):
+        credits[pk].append(name)
+
+    Movies.objects.bulk_update(
+        [Movies(pk=pk, search_credits=' '.join(names)) for pk, names in credits.items()],
+        ['search_credits'],
+        batch_size=1000,
+    )
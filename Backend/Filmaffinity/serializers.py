@@ -1,10 +1,14 @@
 import re
+from urllib.parse import urljoin
 from rest_framework import serializers, exceptions
+from rest_framework.relations import MANY_RELATION_KWARGS
 from django.contrib.auth import authenticate
 from . import models
 from django.core.validators import RegexValidator
 from rest_framework.authtoken.models import Token
 from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.utils.encoding import filepath_to_uri
 
 
 class UsersSerializer(serializers.ModelSerializer):
@@ -65,11 +69,101 @@ class CategoriesSerializer(serializers.ModelSerializer):
         return instance
 
 
-class MoviesSerializer(serializers.ModelSerializer):
+class MediaURLMixin:
+    """
+    Builds the urls of the posters and of their variants.
+    """
+
+    def media_base_url(self):
+        """
+        Returns the url of the media files, absolute if there is a request.
+        When listing, the same serializer is used for all the items,
+        so the url is only built once per request.
+        """
+        if not hasattr(self, '_media_base_url'):
+            base_url = models.Movies._meta.get_field('poster').storage.base_url
+            request = self.context.get('request')
+            if request is not None:
+                base_url = request.build_absolute_uri(base_url)
+            self._media_base_url = base_url
+        return self._media_base_url
+
+    def media_url(self, name):
+        return urljoin(self.media_base_url(), filepath_to_uri(name).lstrip('/'))
+
+    def poster_variant_urls(self, movie):
+        """
+        Returns the urls of the variants of the poster of the movie, by size and
+        format. It is empty until the variants of the current poster are generated.
+        """
+        variants = movie.poster_variants or {}
+        if not movie.poster or variants.get('source') != movie.poster.name:
+            return {}
+        return {size: {image_format: self.media_url(name) for image_format, name in formats.items()}
+                for size, formats in variants.items() if size != 'source'}
+
+
+class BulkManyRelatedField(serializers.ManyRelatedField):
+    """
+    List of primary keys that reads all the related objects in a single
+    query, instead of a query per primary key.
+    """
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+
+        child = self.child_relation
+        queryset = child.get_queryset()
+        pks = []
+        for item in data:
+            if isinstance(item, bool):
+                child.fail('incorrect_type', data_type=type(item).__name__)
+            try:
+                pks.append(queryset.model._meta.pk.to_python(item))
+            except (TypeError, ValueError, DjangoValidationError):
+                child.fail('incorrect_type', data_type=type(item).__name__)
+
+        objects = queryset.in_bulk(set(pks))
+        for item, pk in zip(data, pks):
+            if pk not in objects:
+                child.fail('does_not_exist', pk_value=item)
+        return [objects[pk] for pk in pks]
+
+
+class BulkPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    PrimaryKeyRelatedField that uses BulkManyRelatedField when many=True.
+    """
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return BulkManyRelatedField(**list_kwargs)
+
+
+class MoviesSerializer(MediaURLMixin, serializers.ModelSerializer):
+    # The cast of a movie can be long, so the actors and genres are read at once
+    serializer_related_field = BulkPrimaryKeyRelatedField
+    poster_variants = serializers.SerializerMethodField()
 
     class Meta:
         model = models.Movies
-        fields = '__all__'
+        # The search credits are only used to index the movie, and the
+        # stale flag to know which similar movies have to be computed again.
+        # The counters of the scores are returned as a distribution in the detail,
+        # and the date of the last rating is only the version of the ETags
+        exclude = ['search_credits', 'similar_stale', 'ratings_updated_at', *models.RATING_HISTOGRAM_FIELDS]
+        # The rating aggregates are maintained by the rating writes
+        read_only_fields = ['rating_count', 'rating_sum', 'average_rating']
+
+    def get_poster_variants(self, instance):
+        return self.poster_variant_urls(instance)
 
     def validate_duration(self, value):
         if value < 0:
@@ -191,7 +285,7 @@ class RatingCreateListSerializer(serializers.ModelSerializer):
         return models.Rating.objects.create(**validated_data)
 
 
-class UserRatingsSerializer(serializers.ModelSerializer):
+class UserRatingsSerializer(MediaURLMixin, serializers.ModelSerializer):
     class Meta:
         model = models.Rating
         fields = ['rating', 'comment', 'movie']
@@ -206,24 +300,70 @@ class UserRatingsSerializer(serializers.ModelSerializer):
         # as well as the rating and comment
         # We must add an id to the review
         data = super().to_representation(instance)
-        request = self.context.get('request')
 
         data['id'] = instance.id
 
-        if request is not None:
-            if instance.movie.poster:
-                poster_url = request.build_absolute_uri(instance.movie.poster.url)
-            else:
-                poster_url = None
+        if instance.movie.poster:
+            poster_url = self.media_url(instance.movie.poster.name)
         else:
-            if instance.movie.poster:
-                poster_url = instance.movie.poster.url
-            else:
-                poster_url = None
+            poster_url = None
 
         data['movie'] = {
             'id': instance.movie.id,
             'title': instance.movie.title,
-            'poster': poster_url
+            'poster': poster_url,
+            'poster_variants': self.poster_variant_urls(instance.movie),
         }
         return data
+
+
+class SimilarMovieSerializer(MediaURLMixin, serializers.ModelSerializer):
+    class Meta:
+        model = models.SimilarMovie
+        fields = ['score']
+
+    def to_representation(self, instance):
+        # We want the similar movie with its poster and average rating
+        data = super().to_representation(instance)
+        movie = instance.similar
+        data.update({
+            'id': movie.id,
+            'title': movie.title,
+            'poster': self.media_url(movie.poster.name) if movie.poster else None,
+            'poster_variants': self.poster_variant_urls(movie),
+            'average_rating': movie.average_rating,
+        })
+        return data
+
+
+class RecommendedMovieSerializer(MediaURLMixin, serializers.ModelSerializer):
+    class Meta:
+        model = models.Movies
+        fields = ['id', 'title', 'average_rating']
+
+    def to_representation(self, instance):
+        # We want the poster full url, as in the ratings of the user
+        data = super().to_representation(instance)
+        data['poster'] = self.media_url(instance.poster.name) if instance.poster else None
+        data['poster_variants'] = self.poster_variant_urls(instance)
+        return data
+
+
+class ChartEntrySerializer(MediaURLMixin, serializers.ModelSerializer):
+    class Meta:
+        model = models.ChartEntry
+        fields = ['weighted_rating']
+
+    def to_representation(self, instance):
+        # We want the movie with its poster and rating aggregates
+        data = super().to_representation(instance)
+        movie = instance.movie
+        data.update({
+            'id': movie.id,
+            'title': movie.title,
+            'poster': self.media_url(movie.poster.name) if movie.poster else None,
+            'poster_variants': self.poster_variant_urls(movie),
+            'average_rating': movie.average_rating,
+            'rating_count': movie.rating_count,
+        })
+        return data
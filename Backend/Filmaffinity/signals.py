@@ -0,0 +1,248 @@
+from django.db import connections
+from django.db.models.signals import m2m_changed, post_delete, post_migrate, post_save, pre_delete
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import token_user_cache
+from .caching import bump_catalog_version, invalidate_movie_responses
+from .charts import refresh_chart_entries
+from .models import Actors, Categories, ChartEntry, Directors, Movies, PlatformUsers, Rating
+from .posters import schedule_poster_variants
+from .ratings import apply_rating_change, rebuild_rating_aggregates
+from .search import install_search_index, refresh_search_credits
+
+# Part of the catalog of the rows of each model
+CATALOG_SCOPES = {
+    Movies: 'movies',
+    Actors: 'actors',
+    Directors: 'directors',
+    Categories: 'categories',
+}
+
+
+@receiver(post_save, sender=Rating)
+def rating_saved(sender, instance, created, raw=False, **kwargs):
+    """
+    Updates the aggregates of the movie when a rating is created or updated.
+    """
+    if raw:
+        return
+
+    if created:
+        # The foreign key is only checked at the end of the transaction,
+        # but if the movie does not exist there is nothing to update
+        if not apply_rating_change(instance.movie_id, new_rating=instance.rating):
+            raise Movies.DoesNotExist('Movie does not exist')
+        return
+
+    loaded = getattr(instance, '_loaded_values', {})
+    old_movie_id = loaded.get('movie_id')
+    old_rating = loaded.get('rating')
+
+    # If we do not know the previous values we rebuild the aggregates
+    if old_movie_id is None or old_rating is None:
+        rebuild_rating_aggregates([instance.movie_id])
+        return
+
+    if old_movie_id != instance.movie_id:
+        # The rating has been moved to another movie
+        apply_rating_change(old_movie_id, old_rating=old_rating)
+        apply_rating_change(instance.movie_id, new_rating=instance.rating)
+    elif int(old_rating) != int(instance.rating):
+        apply_rating_change(instance.movie_id, old_rating, instance.rating)
+
+
+@receiver(post_delete, sender=Rating)
+def rating_deleted(sender, instance, origin=None, **kwargs):
+    """
+    Updates the aggregates of the movie when a rating is deleted.
+    """
+    # If the movie itself is being deleted there is nothing to update
+    if isinstance(origin, Movies) or getattr(origin, 'model', None) is Movies:
+        return
+
+    loaded = getattr(instance, '_loaded_values', {})
+    rating = loaded.get('rating', instance.rating)
+    apply_rating_change(loaded.get('movie_id', instance.movie_id), old_rating=rating)
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    """
+    Removes the token from the authentication cache on logout
+    and when the account of the user is deleted.
+    """
+    token_user_cache.invalidate(instance.key)
+
+
+@receiver(post_save, sender=PlatformUsers)
+@receiver(post_delete, sender=PlatformUsers)
+def user_changed(sender, instance, **kwargs):
+    """
+    Removes the cached sessions of a user that has been updated or deleted.
+    """
+    token_user_cache.invalidate_user(instance.pk)
+
+
+@receiver(post_save, sender=Movies)
+def movie_saved(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """
+    Updates the search credits of a new movie, or of a movie whose director
+    has changed. The title and the synopsis are indexed from their columns.
+    """
+    if raw or (update_fields is not None and 'director' not in update_fields):
+        return
+    # The director of a movie that was not read from the database is unknown
+    loaded_values = getattr(instance, '_loaded_values', {})
+    if not created and 'director_id' in loaded_values and loaded_values['director_id'] == instance.director_id:
+        return
+    refresh_search_credits([instance.pk])
+
+
+@receiver(post_save, sender=Movies)
+def movie_chart_saved(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """
+    Rebuilds the chart entries of a movie when its release date
+    or language may have changed. A new movie has no ratings yet.
+    """
+    if raw or created or (update_fields is not None
+                          and not {'release_date', 'language'} & set(update_fields)):
+        return
+    refresh_chart_entries([instance.pk])
+
+
+@receiver(post_save, sender=Movies)
+def movie_poster_saved(sender, instance, raw=False, **kwargs):
+    """
+    Generates the variants of the poster of a movie when it changes.
+    """
+    if raw or not instance.poster:
+        return
+    if instance.poster.name != (instance.poster_variants or {}).get('source'):
+        schedule_poster_variants(instance.pk)
+
+
+@receiver(post_save, sender=Movies)
+@receiver(post_delete, sender=Movies)
+def movie_changed(sender, instance, **kwargs):
+    """
+    Removes the cached responses of a created, updated or deleted movie.
+    """
+    invalidate_movie_responses([instance.pk])
+
+
+@receiver(post_save, sender=Rating)
+@receiver(post_delete, sender=Rating)
+def rating_changed(sender, instance, **kwargs):
+    """
+    Removes the cached responses of the movies whose ratings change.
+    """
+    # A rating that is moved to another movie changes both movies
+    old_movie_id = getattr(instance, '_loaded_values', {}).get('movie_id')
+    invalidate_movie_responses({instance.movie_id, old_movie_id or instance.movie_id}, ratings_only=True)
+
+
+@receiver(m2m_changed, sender=Movies.actors.through)
+@receiver(m2m_changed, sender=Movies.genres.through)
+def movie_credits_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Updates the search credits and removes the cached responses
+    of the movies whose actors or genres change, and rebuilds the
+    chart entries of the movies whose genres change.
+    """
+    if action == 'pre_clear' and reverse:
+        # After the clear we cannot know which movies were related
+        instance._cleared_movie_ids = list(instance.movies.values_list('pk', flat=True))
+        return
+    if action in ('post_add', 'post_remove'):
+        movie_ids = list(pk_set) if reverse else [instance.pk]
+    elif action == 'post_clear':
+        movie_ids = getattr(instance, '_cleared_movie_ids', []) if reverse else [instance.pk]
+    else:
+        return
+    refresh_search_credits(movie_ids)
+    invalidate_movie_responses(movie_ids)
+    if sender is Movies.genres.through:
+        refresh_chart_entries(movie_ids)
+
+
+@receiver(post_save, sender=Actors)
+@receiver(post_save, sender=Categories)
+def credit_renamed(sender, instance, created, raw=False, **kwargs):
+    """
+    Updates the search credits and removes the cached responses
+    of the movies of a renamed actor or genre. The chart entries
+    of the movies of a renamed genre are rebuilt.
+    """
+    if not created and not raw:
+        movie_ids = list(instance.movies.values_list('pk', flat=True))
+        refresh_search_credits(movie_ids)
+        invalidate_movie_responses(movie_ids)
+        if sender is Categories:
+            refresh_chart_entries(movie_ids)
+            # The chart of the genre has another key
+            bump_catalog_version('charts')
+
+
+@receiver(pre_delete, sender=Actors)
+@receiver(pre_delete, sender=Categories)
+def credit_deleted(sender, instance, **kwargs):
+    """
+    Removes the cached responses of the movies of a deleted actor or genre,
+    which is removed from them, and the chart of a deleted genre.
+    """
+    invalidate_movie_responses(list(instance.movies.values_list('pk', flat=True)))
+    if sender is Categories:
+        # The chart of the genre is removed with it
+        ChartEntry.objects.filter(chart=ChartEntry.GENRE, key=instance.name.lower()).delete()
+        bump_catalog_version('charts')
+
+
+@receiver(post_save, sender=Directors)
+def director_renamed(sender, instance, created, raw=False, **kwargs):
+    """
+    Updates the search credits and removes the cached responses
+    of the movies of a renamed director.
+    """
+    if not created and not raw:
+        movie_ids = list(instance.movies_set.values_list('pk', flat=True))
+        refresh_search_credits(movie_ids)
+        invalidate_movie_responses(movie_ids)
+
+
+@receiver(post_save, sender=Movies)
+@receiver(post_delete, sender=Movies)
+@receiver(post_save, sender=Actors)
+@receiver(post_delete, sender=Actors)
+@receiver(post_save, sender=Directors)
+@receiver(post_delete, sender=Directors)
+@receiver(post_save, sender=Categories)
+@receiver(post_delete, sender=Categories)
+def catalog_changed(sender, **kwargs):
+    """
+    Increases the version of the part of the catalog of the changed row.
+    The ratings are versioned per movie with their aggregates instead,
+    see apply_rating_change.
+    """
+    bump_catalog_version(CATALOG_SCOPES[sender])
+
+
+@receiver(m2m_changed, sender=Movies.actors.through)
+@receiver(m2m_changed, sender=Movies.genres.through)
+def movie_relations_changed(sender, action, **kwargs):
+    """
+    The actors and the genres of the movies are part of the movies.
+    """
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump_catalog_version('movies')
+
+
+@receiver(post_migrate)
+def search_index_migrated(sender, using, **kwargs):
+    """
+    SQLite drops the triggers of the full text index when a migration
+    remakes the movies table, so we check them after every migrate.
+    """
+    if sender.name != 'Filmaffinity':
+        return
+    install_search_index(connections[using])
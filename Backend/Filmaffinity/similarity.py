@@ -0,0 +1,130 @@
+import numpy as np
+from django.db import transaction
+from scipy import sparse
+
+from .caching import bump_catalog_version
+from .models import Movies, Rating, SimilarMovie
+
+# Number of similar movies kept for each movie
+SIMILAR_MOVIES = 20
+
+# Minimum number of users that must have rated both movies to compare them
+MIN_COMMON_RATINGS = 2
+
+# Maximum number of cells of each block of the similarity matrix, so
+# the memory used does not depend on the size of the catalog (32 MB)
+BLOCK_CELLS = 4 * 1024 * 1024
+
+
+def load_ratings():
+    """
+    Returns all the ratings in an array with the fields 'user', 'movie' and
+    'rating', read in chunks without creating a model instance per rating.
+    """
+    return np.fromiter(
+        Rating.objects.order_by().values_list('user_id', 'movie_id', 'rating').iterator(chunk_size=10000),
+        dtype=[('user', np.int64), ('movie', np.int64), ('rating', np.float64)],
+    )
+
+
+def load_rating_matrix():
+    """
+    Returns the ratings as a sparse users x movies matrix, with the mean
+    rating of each user subtracted from their ratings (adjusted cosine),
+    the matrix of who has rated what and the movie id of each column.
+    """
+    ratings = load_ratings()
+    users, user_index = np.unique(ratings['user'], return_inverse=True)
+    movie_ids, movie_index = np.unique(ratings['movie'], return_inverse=True)
+
+    # Some users rate everything higher than others, so we compare how
+    # much each user liked a movie with respect to their other movies
+    counts = np.bincount(user_index, minlength=len(users))
+    means = np.bincount(user_index, weights=ratings['rating'], minlength=len(users)) / counts
+    adjusted = ratings['rating'] - means[user_index]
+
+    shape = (len(users), len(movie_ids))
+    matrix = sparse.csr_matrix((adjusted, (user_index, movie_index)), shape=shape)
+    rated = sparse.csr_matrix((np.ones(len(ratings)), (user_index, movie_index)), shape=shape)
+    return matrix, rated, movie_ids
+
+
+def similar_movies(matrix, rated, columns, neighbors=SIMILAR_MOVIES, min_common=MIN_COMMON_RATINGS):
+    """
+    Yields (column, similar columns, scores) for each column of the matrix
+    in 'columns', with its 'neighbors' most similar columns in order.
+
+    The similarity is the cosine of the adjusted ratings of both movies,
+    only when at least 'min_common' users have rated both of them. The
+    movies with a score of 0 or less are not similar, and are never returned.
+    """
+    matrix = matrix.tocsc()
+    rated = rated.tocsc()
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=0))).ravel()
+    block_size = max(1, BLOCK_CELLS // max(matrix.shape[1], 1))
+
+    for start in range(0, len(columns), block_size):
+        block = columns[start:start + block_size]
+        # Dot products and common raters of the block with every movie
+        dots = (matrix[:, block].T @ matrix).toarray()
+        common = (rated[:, block].T @ rated).toarray()
+
+        divisor = np.outer(norms[block], norms)
+        scores = np.divide(dots, divisor, out=np.zeros_like(dots), where=divisor > 0)
+        scores[common < min_common] = 0
+        scores[np.arange(len(block)), block] = 0
+
+        count = min(neighbors, scores.shape[1])
+        best = np.argpartition(-scores, count - 1, axis=1)[:, :count]
+        for row, column in enumerate(block):
+            candidates = best[row][scores[row, best[row]] > 0]
+            order = candidates[np.argsort(-scores[row, candidates], kind='stable')]
+            yield column, order, scores[row, order]
+
+
+def build_similar_movies(stale_only=False, neighbors=SIMILAR_MOVIES, min_common=MIN_COMMON_RATINGS):
+    """
+    Computes the most similar movies of each movie from the ratings and
+    stores them in SimilarMovie, replacing the previous ones.
+
+    If stale_only is True, only the movies whose ratings have changed since
+    their similar movies were computed are updated. Their similar movies are
+    compared with the current ratings of every movie, but the lists of the
+    other movies are kept until the next full build.
+    Returns the number of movies updated and of similar movies stored.
+    """
+    stale_ids = list(Movies.objects.filter(similar_stale=True).values_list('pk', flat=True))
+    if stale_only and not stale_ids:
+        return 0, 0
+
+    # The flags are cleared before reading the ratings, so the ratings
+    # created while the movies are computed mark them as stale again
+    Movies.objects.filter(pk__in=stale_ids).update(similar_stale=False)
+
+    try:
+        matrix, rated, movie_ids = load_rating_matrix()
+        if stale_only:
+            columns = np.flatnonzero(np.isin(movie_ids, stale_ids))
+        else:
+            columns = np.arange(len(movie_ids))
+
+        rows = []
+        for column, similar, scores in similar_movies(matrix, rated, columns, neighbors, min_common):
+            movie_id = int(movie_ids[column])
+            rows.extend(SimilarMovie(movie_id=movie_id, similar_id=int(similar_id), rank=rank, score=float(score))
+                        for rank, (similar_id, score) in enumerate(zip(movie_ids[similar], scores)))
+
+        with transaction.atomic():
+            previous = SimilarMovie.objects.all()
+            if stale_only:
+                # The movies without ratings left have no similar movies
+                previous = previous.filter(movie_id__in=stale_ids)
+            previous.delete()
+            SimilarMovie.objects.bulk_create(rows, batch_size=5000)
+            bump_catalog_version('similar')
+    except Exception:
+        Movies.objects.filter(pk__in=stale_ids).update(similar_stale=True)
+        raise
+
+    updated = len(stale_ids) if stale_only else Movies.objects.count()
+    return updated, len(rows)
@@ -0,0 +1,66 @@
+import hashlib
+import os
+import re
+import uuid
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+# Names of the files named by their content: the hash and the extension
+HASHED_NAME = re.compile(r'^[0-9a-f]{64}\.\w+$')
+
+# Time the files named by their content can be cached (one year)
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+
+def is_content_addressed(name):
+    """
+    Returns True if the file is named by the hash of its content, so it
+    never changes and can be cached forever.
+    """
+    return bool(HASHED_NAME.match(os.path.basename(name)))
+
+
+def content_hash(content):
+    """
+    Returns the SHA-256 hash of the content of a file.
+    """
+    digest = hashlib.sha256()
+    for chunk in content.chunks():
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Storage of the posters that names each file by the hash of its content,
+    in the directory of the given name and with its extension. Saving the
+    same image again, in the same or another movie, returns the existing
+    file instead of creating a copy with a random suffix.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        directory, filename = os.path.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        name = os.path.join(directory, content_hash(content) + extension).replace('\\', '/')
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length)
+
+    def get_available_name(self, name, max_length=None):
+        # A file with the same name has the same content, so it is not renamed
+        return name
+
+    def _save(self, name, content):
+        # We write it with a temporary name and move it, so two requests
+        # that save the same image at the same time do not collide and
+        # the file is never read half written
+        temporary = super()._save(f'{name}.{uuid.uuid4().hex}.part', content)
+        os.replace(self.path(temporary), self.path(name))
+        return name
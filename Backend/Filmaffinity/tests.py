@@ -1,9 +1,31 @@
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import IntegrityError, connection
 from django.test import TestCase, Client
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.authtoken.models import Token
-from .models import Movies, Rating, Actors, Directors, Categories, PlatformUsers
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from .caching import get_response_cache
+from .filters import filter_movies, movie_facets, name_prefix_queries
+from .importer import MovieImporter
+from .models import Movies, Rating, Actors, Directors, Categories, CatalogVersion, ChartEntry, PlatformUsers
+from .normalization import person_key
+from .pagination import KeysetPagination, MoviePageNumberPagination
+from .posters import POSTER_SIZES
+from .recommendations import get_model
+from .views import MovieListCreateAPIView
+from base64 import urlsafe_b64encode
+from io import BytesIO
+from PIL import Image
 import json
+import numpy as np
+import os
+import tempfile
+import unittest
+from unittest import mock
 
 
 class UserViewsTestCase(TestCase):
@@ -198,6 +220,58 @@ class UserViewsTestCase(TestCase):
         self.client.cookies['session'] = self.token.key
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['results'][0]['movie'],
+                         {'id': self.movie.id, 'title': 'Movie 1',
+                          'poster': 'http://testserver/posters/default.png',
+                          'poster_variants': {}})
+
+        # The reviews are paginated and the queries do not grow with the page size
+        director = self.movie.director
+        for i in range(2, 8):
+            movie = Movies.objects.create(title=f'Movie {i}', director=director,
+                                          release_date='2021-01-01', duration=100,
+                                          synopsis=f'Movie {i} synopsis', language='English')
+            Rating.objects.create(user=self.user, movie=movie, rating=i)
+        with CaptureQueriesContext(connection) as small_page:
+            response = self.client.get(url, {'page_size': '2'})
+        self.assertEqual(len(response.json()['results']), 2)
+        self.assertIsNotNone(response.json()['next'])
+
+        with CaptureQueriesContext(connection) as big_page:
+            response = self.client.get(url, {'page_size': '7'})
+        self.assertEqual([review['movie']['title'] for review in response.json()['results']],
+                         [f'Movie {i}' for i in range(1, 8)])
+        self.assertEqual(len(small_page), len(big_page))
+
+    def test_session_token_cache(self):
+        """Tests that the session token is resolved once and invalidated on logout."""
+        url = reverse('user-islogged')
+        self.client.cookies['session'] = self.token.key
+
+        # The first request resolves the token, the next ones use the cache
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # After the logout the token is not valid anymore
+        response = self.client.delete(reverse('user-logout'))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.client.cookies['session'] = self.token.key
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        # After deleting the account the token is not valid anymore
+        token = Token.objects.create(user=self.user)
+        self.client.cookies['session'] = token.key
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.delete(reverse('user-info'))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.client.cookies['session'] = token.key
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
 
 
 class MoviesViewsTestCase(TestCase):
@@ -273,6 +347,50 @@ class MoviesViewsTestCase(TestCase):
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_movie_facets(self):
+        """Tests to check the facets of the movies with and without filters."""
+        url = reverse('movie-facets')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        director2 = Directors.objects.get(name='Director2')
+        self.assertEqual(response.json(), {
+            'count': 3,
+            'genres': [{'id': Categories.objects.get(name='Action').pk, 'name': 'Action', 'count': 2},
+                       {'id': Categories.objects.get(name='Drama').pk, 'name': 'Drama', 'count': 2}],
+            'languages': [{'name': 'English', 'count': 2}, {'name': 'Spanish', 'count': 1}],
+            'directors': [{'id': director2.pk, 'name': 'Director2 Surnamed2', 'count': 2},
+                          {'id': self.movie1.director_id, 'name': 'Director1 Surnamed1', 'count': 1}],
+            'release_years': [{'year': 2021, 'count': 3}],
+        })
+
+        # The movies of several matching actors are only counted once
+        response = self.client.get(url, {'actor': 'Actor'})
+        self.assertEqual(response.json()['count'], 3)
+        self.assertEqual(response.json()['genres'][0]['count'], 2)
+
+        # Same filters as the list of movies
+        response = self.client.get(url, {'genre': 'drama', 'facet_limit': 1})
+        data = response.json()
+        self.assertEqual(data['count'], 2)
+        self.assertEqual(data['genres'], [{'id': Categories.objects.get(name='Drama').pk,
+                                           'name': 'Drama', 'count': 2}])
+        self.assertEqual(data['languages'], [{'name': 'English', 'count': 1}])
+
+        # The full text search is a filter too
+        response = self.client.get(url, {'q': 'woman'})
+        self.assertEqual(response.json()['count'], 2)
+        self.assertEqual(response.json()['languages'], [{'name': 'English', 'count': 1},
+                                                        {'name': 'Spanish', 'count': 1}])
+
+        # A grouped query per facet, whatever the number of movies
+        with self.assertNumQueries(4):
+            movie_facets(filter_movies(Movies.objects.all(), {'genre': 'drama', 'q': 'woman'}, ranked=False))
+
+        # Invalid params
+        for params in ({'page': 1}, {'facet_limit': 0}, {'facet_limit': 'a'}, {'rating': 11}):
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_movie_list_standard_filters(self):
         """Tests to check the list endpoint with standard fields filters."""
         url = reverse('movie-list')
@@ -340,6 +458,55 @@ class MoviesViewsTestCase(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.json().get('results', [])), 1)
 
+    def test_movie_list_search(self):
+        """Tests to check the full text search of the list endpoint."""
+        url = reverse('movie-list')
+
+        # Search in the synopsis
+        response = self.client.get(url, {'q': 'woman'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.json().get('results', [])), 2)
+
+        # Search in the actors, the genres and the director at the same time
+        response = self.client.get(url, {'q': 'Surname4 drama director2'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([movie['id'] for movie in response.json()['results']], [self.movie3.id])
+
+        # The results follow the changes of the credits
+        self.movie1.actors.add(Actors.get_or_create_normalized(name='Actor4', surname='Surname4')[0].pk)
+        response = self.client.get(url, {'q': 'surname4'})
+        self.assertEqual(len(response.json().get('results', [])), 2)
+
+        # The credits are only rebuilt when the director of the movie changes
+        movie = Movies.objects.get(pk=self.movie3.id)
+        movie.duration = 100
+        with CaptureQueriesContext(connection) as queries:
+            movie.save()
+        self.assertFalse([query for query in queries if 'movies_actors' in query['sql']])
+        response = self.client.get(url, {'q': 'director1'})
+        self.assertNotIn(self.movie3.id, [movie['id'] for movie in response.json()['results']])
+        movie.director = self.movie1.director
+        movie.save()
+        response = self.client.get(url, {'q': 'director1'})
+        self.assertIn(self.movie3.id, [movie['id'] for movie in response.json()['results']])
+
+        # The search can be combined with the other filters
+        response = self.client.get(url, {'q': 'surname4', 'genre': 'Drama'})
+        self.assertEqual([movie['id'] for movie in response.json()['results']], [self.movie3.id])
+
+        # The title is more relevant than the synopsis
+        Movies.objects.create(title='Dog Day', director=self.movie1.director,
+                              release_date='2021-01-01', duration=90,
+                              synopsis='A day', language='English')
+        response = self.client.get(url, {'q': 'dog'})
+        self.assertEqual([movie['title'] for movie in response.json()['results']],
+                         ['Dog Day', 'Movie 3'])
+
+        # No results
+        response = self.client.get(url, {'q': 'spaceship'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.json().get('results', [])), 0)
+
     def test_movie_list_pagination_filters(self):
         """Tests to check the list endpoint with pagination filters."""
         url = reverse('movie-list')
@@ -396,6 +563,316 @@ class MoviesViewsTestCase(TestCase):
         response = self.client.get(url, filters)
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
+        # The page size of a request is not shared with the others
+        self.assertEqual(MoviePageNumberPagination.page_size, 10)
+
+        # The page size can not be greater than the maximum
+        with self.settings(MAX_PAGE_SIZE=2):
+            response = self.client.get(url, {'page_size': '50'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.json().get('results', [])), 2)
+        self.assertIn('page_size=50', response.json()['next'])
+
+    def test_movie_list_query_count(self):
+        """Tests that the number of queries of the list does not grow with the page size."""
+        url = reverse('movie-list')
+
+        # Add more movies so that the bigger page has more rows
+        for i in range(4, 10):
+            movie = Movies.objects.create(title=f'Movie {i}',
+                                          director=self.movie1.director,
+                                          release_date='2021-01-01',
+                                          duration=100,
+                                          synopsis=f'Movie {i} synopsis',
+                                          language='English')
+            movie.genres.add(Categories.get_or_create_normalized(name='Action')[0].pk)
+            movie.actors.add(Actors.get_or_create_normalized(name='Actor1', surname='Surname1')[0].pk)
+
+        with CaptureQueriesContext(connection) as small_page:
+            response = self.client.get(url, {'page_size': '1'})
+        self.assertEqual(len(response.json().get('results', [])), 1)
+
+        with CaptureQueriesContext(connection) as big_page:
+            response = self.client.get(url, {'page_size': '9'})
+        self.assertEqual(len(response.json().get('results', [])), 9)
+        self.assertEqual(len(small_page), len(big_page))
+
+        # The average rating is still returned for every movie
+        movie1 = [movie for movie in response.json()['results'] if movie['id'] == self.movie1.id][0]
+        self.assertEqual(movie1['average_rating'], 6.5)
+        self.assertEqual(movie1['actors'], ['Actor1 Surname1', 'Actor2 Surname2'])
+
+    def test_movie_list_cursor_pagination(self):
+        """Tests to check the list endpoint with the cursor pagination."""
+        url = reverse('movie-list')
+
+        # Movies with the same title must not be skipped nor repeated
+        for i in range(4):
+            Movies.objects.create(title='Same Title', director=self.movie1.director,
+                                  release_date='2021-01-01', duration=100,
+                                  synopsis=f'Copy {i}', language='English')
+        expected = list(Movies.objects.order_by('title', 'id').values_list('id', flat=True))
+
+        # Go forward through all the pages
+        seen, previous_links = [], []
+        response = self.client.get(url, {'pagination': 'cursor', 'page_size': '2'})
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn('count', response.json())
+            seen += [movie['id'] for movie in response.json()['results']]
+            previous_links.append(response.json()['previous'])
+            if response.json()['next'] is None:
+                break
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(response.json()['next'])
+            self.assertFalse(any('COUNT(' in query['sql'] for query in queries))
+        self.assertEqual(seen, expected)
+        self.assertIsNone(previous_links[0])
+
+        # Go back from the last page
+        response = self.client.get(response.json()['previous'])
+        self.assertEqual([movie['id'] for movie in response.json()['results']], expected[-3:-1])
+
+        # The filters are applied
+        response = self.client.get(url, {'pagination': 'cursor', 'title': 'same'})
+        self.assertEqual(len(response.json()['results']), 4)
+        self.assertIsNone(response.json()['next'])
+
+        # Invalid cursor and pagination mode
+        response = self.client.get(url, {'pagination': 'cursor', 'cursor': 'abc'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        for position in ([{}, []], [1, 'Movie 1'], ['Movie 1', True], ['Movie 1', 2 ** 64], ['Movie 1', 1.5]):
+            cursor = urlsafe_b64encode(json.dumps({'p': position}).encode('utf-8')).decode('ascii')
+            response = self.client.get(url, {'pagination': 'cursor', 'cursor': cursor})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(url, {'pagination': 'offset'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_movie_list_cursor_pagination_plan(self):
+        """Tests that the pages of the cursor pagination are read in order from an index."""
+        paginator = KeysetPagination()
+        for reverse in (False, True):
+            ordering = [f'-{field}' if reverse else field for field in paginator.ordering]
+            queryset = Movies.objects.order_by(*ordering).filter(
+                paginator.after(['Movie 2', self.movie2.id], reverse))[:21]
+            with connection.cursor() as cursor:
+                if connection.vendor == 'postgresql':
+                    # The table is small, so reading it all would be cheaper without this
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+                    cursor.execute('SET LOCAL enable_bitmapscan = off')
+            plan = queryset.explain()
+            self.assertIn('movies_title_id_idx', plan)
+            # The rows are not sorted after reading them
+            self.assertNotIn('TEMP B-TREE', plan)
+            self.assertNotIn('Sort', plan)
+
+    def test_catalog_conditional_get(self):
+        """Tests to check the revalidation of the catalog responses with ETags."""
+        url = reverse('movie-list')
+        response = self.client.get(url, {'genre': 'Drama'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+
+        # The same response is not built again
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'genre': 'Drama'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+        # The versions of the catalog and the date of the last rating
+        self.assertEqual(len(queries), 2)
+
+        # Other filters have other ETags
+        response = self.client.get(url, {'genre': 'Action'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # A new rating changes the average of the movies, but only the detail of its movie
+        detail_etags = {movie.id: self.client.get(reverse('movie-detail', kwargs={'pk': movie.id}))['ETag']
+                        for movie in (self.movie1, self.movie2)}
+        ratings_version = CatalogVersion.objects.get(scope='ratings').version
+        Rating.objects.create(user=PlatformUsers.objects.create(email='other@example.com'),
+                              movie=self.movie2, rating=1)
+        response = self.client.get(url, {'genre': 'Drama'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+        response = self.client.get(reverse('movie-detail', kwargs={'pk': self.movie1.id}),
+                                   HTTP_IF_NONE_MATCH=detail_etags[self.movie1.id])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        response = self.client.get(reverse('movie-detail', kwargs={'pk': self.movie2.id}),
+                                   HTTP_IF_NONE_MATCH=detail_etags[self.movie2.id])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # The rating writes do not lock the version of all the ratings
+        self.assertEqual(CatalogVersion.objects.get(scope='ratings').version, ratings_version)
+
+        # The detail of a movie changes when its actors change
+        url = reverse('movie-detail', kwargs={'pk': self.movie1.id})
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code,
+                         status.HTTP_304_NOT_MODIFIED)
+        self.movie1.actors.add(Actors.get_or_create_normalized(name='Actor9', surname='Surname9')[0].pk)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code,
+                         status.HTTP_200_OK)
+
+        # The lists of actors, directors and categories only depend on their own table
+        actors_etag = self.client.get(reverse('actor-list'))['ETag']
+        directors_etag = self.client.get(reverse('director-list'))['ETag']
+        Actors.get_or_create_normalized(name='Actor10', surname='Surname10')
+        self.assertEqual(self.client.get(reverse('actor-list'), HTTP_IF_NONE_MATCH=actors_etag).status_code,
+                         status.HTTP_200_OK)
+        self.assertEqual(self.client.get(reverse('director-list'),
+                                         HTTP_IF_NONE_MATCH=directors_etag).status_code,
+                         status.HTTP_304_NOT_MODIFIED)
+
+        # The actors, directors and genres created with a movie change their lists
+        etags = {name: self.client.get(reverse(name))['ETag']
+                 for name in ('actor-list', 'director-list', 'rating-list')}
+        self.client.cookies['session'] = self.admin_token.key
+        data = {'title': 'Movie 4',
+                'director_data': {'name': 'Director9', 'surname': 'SurnameD9'},
+                'release_date': '2021-01-01',
+                'duration': 120,
+                'synopsis': 'Movie 4 synopsis',
+                'language': 'English',
+                'genres_data': ['Western'],
+                'actors_data': [{'name': 'Actor11', 'surname': 'Surname11'}]}
+        response = self.client.post(reverse('movie-list'), json.dumps(data), content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        for name, etag in etags.items():
+            response = self.client.get(reverse(name), HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('Actor11', [actor['name'] for actor in self.client.get(reverse('actor-list')).json()])
+
+    def test_name_lists(self):
+        """Tests to check the pages and the typeahead of the actors, directors and categories."""
+        # Without params, the whole list
+        response = self.client.get(reverse('actor-list'))
+        self.assertEqual([actor['name'] for actor in response.json()],
+                         ['Actor1', 'Actor2', 'Actor3', 'Actor4'])
+
+        # In pages
+        response = self.client.get(reverse('actor-list'), {'page_size': 3, 'page': 2})
+        self.assertEqual(response.json()['count'], 4)
+        self.assertEqual([actor['name'] for actor in response.json()['results']], ['Actor4'])
+
+        # Typeahead by the start of the name, the surname or the full name
+        url = reverse('actor-list')
+        response = self.client.get(url, {'prefix': 'act', 'limit': 2})
+        self.assertEqual([actor['name'] for actor in response.json()], ['Actor1', 'Actor2'])
+        response = self.client.get(url, {'prefix': 'SURNAME3'})
+        self.assertEqual([actor['name'] for actor in response.json()], ['Actor3'])
+        response = self.client.get(url, {'prefix': 'actor4 surn'})
+        self.assertEqual([actor['surname'] for actor in response.json()], ['Surname4'])
+        response = self.client.get(url, {'prefix': 'other'})
+        self.assertEqual(response.json(), [])
+        response = self.client.get(reverse('director-list'), {'prefix': 'surnamed2'})
+        self.assertEqual([director['name'] for director in response.json()], ['Director2'])
+        response = self.client.get(reverse('rating-list'), {'prefix': 'dr'})
+        self.assertEqual([genre['name'] for genre in response.json()], ['Drama'])
+
+        # Invalid limits
+        for limit in ('a', 0, 51):
+            response = self.client.get(url, {'prefix': 'act', 'limit': limit})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_name_indexes(self):
+        """Tests that the typeahead reads the indexes of the columns and that there are no unused indexes."""
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                # The tables are small, so reading them all would be cheaper without this
+                cursor.execute('SET LOCAL enable_seqscan = off')
+            for model, prefix in ((Actors, 'actor 1'), (Actors, 'actor1 surn'), (Directors, 'surnamed'),
+                                  (Categories, 'dr')):
+                for query, ordering in name_prefix_queries(model, prefix):
+                    plan = model.objects.filter(query).order_by(*ordering)[:10].explain()
+                    self.assertIn('Index', plan.title(), f'The typeahead of {prefix} scans the table:\n{plan}')
+                    self.assertNotIn('TEMP B-TREE', plan)
+                    self.assertNotIn('Seq Scan', plan)
+
+            # The filters are substring matches and the typeahead uses ranges of
+            # the columns, so no query could use an index of the lower case values
+            if connection.vendor == 'postgresql':
+                cursor.execute("SELECT indexname FROM pg_indexes WHERE indexdef ILIKE '%lower(%'")
+            else:
+                cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND sql LIKE '%lower(%'")
+            self.assertEqual(cursor.fetchall(), [])
+
+    def test_movie_response_cache(self):
+        """Tests to check the cache of the responses of the movie list and detail."""
+        # A cache outside of the process, like Redis, that stores the responses pickled
+        with tempfile.TemporaryDirectory() as cache_dir, self.settings(CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+            'responses': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                          'LOCATION': cache_dir},
+        }):
+            url = reverse('movie-list')
+            response = self.client.get(url, {'genre': 'Drama', 'page': '1'})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+            # The same params in another order only read the versions of the catalog
+            # and of the ratings, and the current ratings of the movies of the page
+            with CaptureQueriesContext(connection) as queries:
+                cached = self.client.get(url + '?pagination=page&genre=Drama')
+            self.assertEqual(len(queries), 3)
+            self.assertEqual(cached.json(), response.json())
+
+            # A new rating changes the detail of its movie only, and the
+            # pages of the list are kept with the new ratings of their movies
+            detail_url = reverse('movie-detail', kwargs={'pk': self.movie2.id})
+            other_url = reverse('movie-detail', kwargs={'pk': self.movie1.id})
+            self.client.get(detail_url)
+            self.client.get(other_url)
+            rated = self.client.get(url, {'genre': 'Drama', 'rating': 6}).json()['results']
+            self.assertNotIn(self.movie2.id, [movie['id'] for movie in rated])
+            Rating.objects.create(user=self.admin, movie=self.movie2, rating=10)
+
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, {'genre': 'Drama'})
+            self.assertEqual(len(queries), 3)
+            movie2 = [movie for movie in response.json()['results'] if movie['id'] == self.movie2.id][0]
+            self.assertEqual(movie2['average_rating'], 6.5)
+            # The pages whose movies are chosen by their ratings change
+            rated = self.client.get(url, {'genre': 'Drama', 'rating': 6}).json()['results']
+            self.assertIn(self.movie2.id, [movie['id'] for movie in rated])
+            self.assertEqual(self.client.get(detail_url).json()['average_rating'], 6.5)
+            # The other movie is still cached, only the versions are read
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(other_url)
+            self.assertEqual(len(queries), 2)
+
+            # The update of a movie by an admin changes its detail
+            self.client.cookies['session'] = self.admin_token.key
+            response = self.client.put(detail_url, {'title': 'New Title'}, content_type='application/json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            del self.client.cookies['session']
+            self.assertEqual(self.client.get(detail_url).json()['title'], 'New Title')
+
+            # The rename of an actor changes the movies where it appears
+            actor = Actors.objects.get(name='Actor1')
+            actor.surname = 'Renamed'
+            actor.save()
+            self.assertIn('Actor1 Renamed', self.client.get(other_url).json()['actors'])
+
+            # A deleted movie is not in the list anymore
+            self.movie2.delete()
+            self.assertEqual(self.client.get(detail_url).status_code, status.HTTP_404_NOT_FOUND)
+            response = self.client.get(url, {'genre': 'Drama'})
+            self.assertNotIn(self.movie2.id, [movie['id'] for movie in response.json()['results']])
+
+        # The cache in the memory of each process is used, with a warning
+        with self.settings(CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+            'responses': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                          'LOCATION': 'local-responses'},
+        }):
+            with self.assertLogs('Filmaffinity.caching', 'WARNING'):
+                get_response_cache()
+            url = reverse('movie-detail', kwargs={'pk': self.movie1.id})
+            with CaptureQueriesContext(connection) as first:
+                self.client.get(url)
+            with CaptureQueriesContext(connection) as second:
+                self.client.get(url)
+            self.assertLess(len(second), len(first))
+
     def test_movie_detail(self):
         """Tests to check the detail endpoint."""
         # Valid detail with existing movie
@@ -408,6 +885,140 @@ class MoviesViewsTestCase(TestCase):
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
+    def test_poster_variants(self):
+        """Tests to check the variants of the posters"""
+        poster = BytesIO()
+        Image.new('RGB', (1000, 1500), 'red').save(poster, format='JPEG')
+
+        with tempfile.TemporaryDirectory() as media_root, self.settings(MEDIA_ROOT=media_root,
+                                                                          POSTER_WORKERS=0):
+            # The variants are generated after the commit
+            with self.captureOnCommitCallbacks(execute=True):
+                self.movie1.poster.save('red.jpg', ContentFile(poster.getvalue()))
+                self.assertEqual(Movies.objects.get(pk=self.movie1.pk).poster_variants, {})
+
+            self.movie1.refresh_from_db()
+            variants = self.movie1.poster_variants
+            self.assertEqual(variants['source'], self.movie1.poster.name)
+            storage = self.movie1.poster.storage
+            for size, (width, height) in POSTER_SIZES.items():
+                with storage.open(variants[size]['webp']) as variant:
+                    image = Image.open(variant)
+                    self.assertEqual(image.format, 'WEBP')
+                    self.assertLessEqual(image.width, width)
+                    self.assertLessEqual(image.height, height)
+                self.assertLess(storage.size(variants[size]['webp']), storage.size(self.movie1.poster.name))
+
+            # The movie and the reviews return the urls of the variants
+            response = self.client.get(reverse('movie-detail', kwargs={'pk': self.movie1.id}))
+            self.assertTrue(response.json()['poster_variants']['thumb']['webp'].endswith(
+                variants['thumb']['webp']))
+            self.client.cookies['session'] = self.token1.key
+            response = self.client.get(reverse('user-ratings'))
+            review = next(review for review in response.json()['results']
+                          if review['movie']['id'] == self.movie1.id)
+            self.assertEqual(review['movie']['poster_variants']['medium']['webp'],
+                             'http://testserver/' + variants['medium']['webp'])
+
+            # Until the variants of a new poster are generated, none are returned
+            self.movie1.poster = 'posters/other.jpg'
+            self.movie1.save()
+            response = self.client.get(reverse('movie-detail', kwargs={'pk': self.movie1.id}))
+            self.assertEqual(response.json()['poster_variants'], {})
+
+    def test_poster_storage(self):
+        """Tests to check the posters are named by their content and the unused ones deleted"""
+        poster = BytesIO()
+        Image.new('RGB', (300, 450), 'blue').save(poster, format='JPEG')
+
+        with tempfile.TemporaryDirectory() as media_root, self.settings(MEDIA_ROOT=media_root,
+                                                                          POSTER_WORKERS=0):
+            # The same image is stored once, whatever its name
+            with self.captureOnCommitCallbacks(execute=True):
+                self.movie1.poster.save('blue.JPG', ContentFile(poster.getvalue()))
+                self.movie2.poster.save('other name.jpg', ContentFile(poster.getvalue()))
+            self.assertEqual(self.movie1.poster.name, self.movie2.poster.name)
+            self.assertRegex(self.movie1.poster.name, r'^posters/[0-9a-f]{64}\.jpg$')
+            self.assertEqual(sorted(os.listdir(os.path.join(media_root, 'posters'))),
+                             [os.path.basename(self.movie1.poster.name), 'variants'])
+
+            # The movies with the same poster share the variants
+            self.movie1.refresh_from_db()
+            self.movie2.refresh_from_db()
+            self.assertEqual(self.movie1.poster_variants, self.movie2.poster_variants)
+            variant = self.movie1.poster_variants['thumb']['webp']
+
+            # The posters and the variants can be cached forever
+            response = self.client.get('/' + variant)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertIn('immutable', response['Cache-Control'])
+            self.assertIn('max-age=31536000', response['Cache-Control'])
+
+            # The files of a poster that is not used anymore are deleted, the default one is kept
+            default = os.path.join(media_root, 'posters', 'default.png')
+            with open(default, 'wb') as file:
+                file.write(b'default')
+            Movies.objects.filter(pk__in=[self.movie1.pk, self.movie2.pk]).update(
+                poster='posters/default.png', poster_variants={})
+            call_command('gc_posters', '--min-age', '0', stdout=open(os.devnull, 'w'))
+            self.assertEqual(os.listdir(os.path.join(media_root, 'posters', 'variants')), [])
+            self.assertEqual(os.listdir(os.path.join(media_root, 'posters')), ['default.png', 'variants'])
+
+    def test_poster_media(self):
+        """Tests to check the posters are served with conditional and range requests"""
+        content = bytes(range(256)) * 4
+        with tempfile.TemporaryDirectory() as media_root, self.settings(MEDIA_ROOT=media_root):
+            name = Movies._meta.get_field('poster').storage.save('posters/poster.jpg',
+                                                                 ContentFile(content))
+            url = '/' + name
+
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(b''.join(response.streaming_content), content)
+            self.assertEqual(response['Content-Type'], 'image/jpeg')
+            self.assertEqual(response['Accept-Ranges'], 'bytes')
+            self.assertIn('immutable', response['Cache-Control'])
+            etag = response['ETag']
+            self.assertIn(os.path.splitext(os.path.basename(name))[0], etag)
+
+            # Conditional requests
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+            self.assertEqual(response['ETag'], etag)
+            self.assertIn('immutable', response['Cache-Control'])
+
+            # Ranges of bytes
+            response = self.client.get(url, HTTP_RANGE='bytes=10-19')
+            self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+            self.assertEqual(response.content, content[10:20])
+            self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(content)}')
+            response = self.client.get(url, HTTP_RANGE='bytes=-5')
+            self.assertEqual(response.content, content[-5:])
+            response = self.client.get(url, HTTP_RANGE=f'bytes={len(content)}-')
+            self.assertEqual(response.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+            # If the file has changed, the whole file is sent
+            response = self.client.get(url, HTTP_RANGE='bytes=10-19', HTTP_IF_RANGE='"other"')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+            # The proxy sends the file
+            with self.settings(MEDIA_ACCEL_REDIRECT='/protected/'):
+                response = self.client.get(url)
+                self.assertEqual(response['X-Accel-Redirect'], '/protected/' + name)
+                self.assertEqual(response.content, b'')
+                self.assertEqual(response['ETag'], etag)
+
+            # The files that are not named by their content are checked every time
+            with open(os.path.join(media_root, 'posters', 'default.png'), 'wb') as file:
+                file.write(b'default')
+            response = self.client.get('/posters/default.png')
+            self.assertIn('no-cache', response['Cache-Control'])
+
+            # Only the files of the posters are served
+            for url in ('/posters/missing.jpg', '/posters/../settings.py', '/posters/variants'):
+                self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+            self.assertEqual(self.client.post('/' + name).status_code,
+                             status.HTTP_405_METHOD_NOT_ALLOWED)
+
     def test_movie_create_invalid_basic(self):
         """Tests to check the create endpoint with invalid data."""
         url = reverse('movie-list')
@@ -521,6 +1132,41 @@ class MoviesViewsTestCase(TestCase):
         response = self.client.post(url, json.dumps(data), content_type='application/json')
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
 
+    def test_movie_create_large_cast(self):
+        """Tests to check that the actors of a movie are resolved at once."""
+        url = reverse('movie-list')
+        self.client.cookies['session'] = self.admin_token.key
+
+        # Two existing actors, one of them repeated, and 58 new ones
+        actors = [{'name': 'actor1', 'surname': 'Surname1'}, {'name': 'Actor2', 'surname': 'surname2'}]
+        actors += [{'name': f'Actor{chr(65 + i // 26)}{chr(65 + i % 26)}', 'surname': 'Cast'}
+                   for i in range(58)]
+        actors.append({'name': 'Actor1', 'surname': 'Surname1'})
+        data = {'title': 'Movie 4',
+                'director_data': {'name': 'Director1', 'surname': 'SurnameD1'},
+                'release_date': '2021-01-01',
+                'duration': 120,
+                'synopsis': 'Movie 4 synopsis',
+                'language': 'English',
+                'genres_data': ['Action', 'drama', 'Western'],
+                'actors_data': actors}
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, json.dumps(data), content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        # A select, an insert of the missing ones and a select again to resolve
+        # the names, and a select to validate the ids, whatever the size of the cast
+        table = Actors._meta.db_table
+        self.assertEqual(len([query for query in queries.captured_queries
+                              if f'INTO "{table}"' in query['sql']
+                              or f'FROM "{table}" WHERE' in query['sql']]), 4)
+
+        movie = Movies.objects.get(pk=response.json()['id'])
+        self.assertEqual(movie.actors.count(), 60)
+        self.assertEqual(Actors.objects.filter(name='Actor1', surname='Surname1').count(), 1)
+        self.assertEqual(movie.director.pk, self.movie1.director.pk)
+        self.assertEqual(sorted(movie.genres.values_list('name', flat=True)), ['Action', 'Drama', 'Western'])
+
     def test_movie_create_using_pk_option(self):
         """Tests to check the create endpoint using the pk option."""
         url = reverse('movie-list')
@@ -613,6 +1259,86 @@ class MoviesViewsTestCase(TestCase):
         response = self.client.post(url, data)
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
 
+    def test_movie_import(self):
+        """Tests to check the bulk import of a catalog"""
+        url = reverse('movie-list')
+        # The names of the imported people can only have letters and spaces
+        director = Directors.get_or_create_normalized(name='Director', surname='Uno')[0]
+        self.movie1.actors.add(Actors.get_or_create_normalized(name='Actor', surname='Uno')[0].pk)
+        # The list is cached before the import
+        self.client.get(url)
+
+        with tempfile.TemporaryDirectory() as directory:
+            catalog = os.path.join(directory, 'catalog.ndjson')
+            with open(catalog, 'w', encoding='utf-8') as f:
+                f.write(json.dumps({'title': 'Movie 4', 'synopsis': 'Movie 4 synopsis',
+                                    'duration': 100, 'release_date': '2022-01-01',
+                                    'language': 'English',
+                                    'director': {'name': 'director', 'surname': 'UNO'},
+                                    'actors': [{'name': 'actor', 'surname': 'uno'},
+                                               {'name': 'Actor', 'surname': 'Cinco'}],
+                                    'genres': ['drama', 'Western']}) + '\n')
+                # Not valid, without actors
+                f.write(json.dumps({'title': 'Movie 5', 'synopsis': 'Movie 5 synopsis',
+                                    'duration': 100, 'release_date': '2022-01-01',
+                                    'language': 'English',
+                                    'director': {'name': 'Director', 'surname': 'Cinco'},
+                                    'actors': [], 'genres': ['Drama']}) + '\n')
+
+            stderr = open(os.devnull, 'w')
+            call_command('import_movies', catalog, stdout=open(os.devnull, 'w'), stderr=stderr)
+
+            csv_catalog = os.path.join(directory, 'catalog.csv')
+            with open(csv_catalog, 'w', encoding='utf-8') as f:
+                f.write('title,synopsis,duration,release_date,language,director,actors,genres\n')
+                for i in range(6, 16):
+                    f.write(f'Movie {i},Synopsis {i},90,2023-01-01,Spanish,Director Seis,'
+                            f'Actor Cinco|Actor Surname{chr(ord("a") + i)},Western|Comedy\n')
+
+            # The queries do not depend on the number of movies
+            with CaptureQueriesContext(connection) as queries:
+                call_command('import_movies', csv_catalog, '--batch-size', '20',
+                             stdout=open(os.devnull, 'w'), stderr=stderr)
+            self.assertLessEqual(len(queries), 20)
+
+        self.assertEqual(Movies.objects.count(), 3 + 1 + 10)
+        self.assertFalse(Movies.objects.filter(title='Movie 5').exists())
+
+        # The people and the genres are not duplicated
+        movie = Movies.objects.get(title='Movie 4')
+        self.assertEqual(movie.director.pk, director.pk)
+        self.assertEqual(Actors.objects.filter(name='Actor', surname='Uno').count(), 1)
+        self.assertEqual(Actors.objects.filter(name='Actor', surname='Cinco').count(), 1)
+        self.assertEqual(Categories.objects.filter(name='Western').count(), 1)
+        self.assertEqual(sorted(movie.genres.values_list('name', flat=True)), ['Drama', 'Western'])
+        self.assertEqual(movie.search_credits, 'Director Uno Actor Uno Actor Cinco Drama Western')
+        self.assertEqual(Movies.objects.get(title='Movie 15').actors.count(), 2)
+
+        # The cached list is not returned anymore
+        response = self.client.get(url, {'title': 'Movie 4'})
+        self.assertEqual(response.json()['count'], 1)
+        response = self.client.get(url)
+        self.assertEqual(response.json()['count'], 14)
+
+        # The names are validated as in the models, the movies are
+        # skipped and the people and the genres are not created
+        importer = MovieImporter()
+        row = {'title': 'Movie 16', 'synopsis': 'Movie 16 synopsis', 'duration': 100,
+               'release_date': '2022-01-01', 'language': 'English',
+               'director': 'Director Uno', 'actors': ['Actor Uno'], 'genres': ['Drama']}
+        importer.import_movies([
+            {**row, 'director': 'Dir3ctor Uno'},
+            {**row, 'actors': ['Actor Uno', {'name': 'José', 'surname': 'Uno'}]},
+            {**row, 'genres': ['Drama', 'Sci-Fi 2']},
+        ])
+        self.assertEqual(importer.imported, 0)
+        self.assertEqual([position for position, error in importer.errors], [1, 2, 3])
+        self.assertIn('letters and spaces', importer.errors[0][1])
+        self.assertFalse(Directors.objects.filter(name='Dir3ctor').exists())
+        self.assertFalse(Actors.objects.filter(name='José').exists())
+        self.assertFalse(Categories.objects.filter(name='Sci Fi 2').exists())
+        self.assertFalse(Movies.objects.filter(title='Movie 16').exists())
+
 
 class RatingsViewsTestCase(TestCase):
     def setUp(self):
@@ -747,6 +1473,108 @@ class RatingsViewsTestCase(TestCase):
         response = self.client.post(url, data)
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
 
+    def test_rating_create_single_insert(self):
+        """Tests to check that a rating is created with a single insert."""
+        url = reverse('rating-create', kwargs={'pk': self.movie2.id})
+        self.client.cookies['session'] = self.token2.key
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, {'rating': 9})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        rating_queries = [query['sql'] for query in queries.captured_queries
+                          if '"Filmaffinity_rating"' in query['sql']]
+        self.assertEqual(len(rating_queries), 1)
+        self.assertTrue(rating_queries[0].startswith('INSERT'))
+
+        # The second rating is rejected by the unique constraint
+        response = self.client.post(url, {'rating': 2})
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(Rating.objects.get(user=self.user2, movie=self.movie2).rating, 9)
+
+        # The rating of a movie that does not exist is not written
+        url = reverse('rating-create', kwargs={'pk': 197516347})
+        response = self.client.post(url, {'rating': 9})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertFalse(Rating.objects.filter(movie=197516347).exists())
+
+    def test_rating_put_upsert(self):
+        """Tests to check that a rating can be created or replaced with PUT."""
+        url = reverse('rating-create', kwargs={'pk': self.movie3.id})
+
+        # Invalid put (not logged in)
+        response = self.client.put(url, {'rating': 7}, content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self.client.cookies['session'] = self.token2.key
+        response = self.client.put(url, {'rating': 7}, content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        # Repeating it replaces the rating
+        for _ in range(2):
+            response = self.client.put(url, {'rating': 4, 'comment': 'Changed my mind'},
+                                       content_type='application/json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.json()['rating'], 4)
+        self.assertEqual(Rating.objects.filter(user=self.user2, movie=self.movie3).count(), 1)
+        self.movie3.refresh_from_db()
+        self.assertEqual((self.movie3.rating_count, self.movie3.rating_sum), (1, 4))
+
+        # Invalid put (wrong rating)
+        response = self.client.put(url, {'rating': 11}, content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        # Invalid put (movie does not exist)
+        url = reverse('rating-create', kwargs={'pk': 197516347})
+        response = self.client.put(url, {'rating': 7}, content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        # The rating is deleted every time after the insert fails, so the retries run out
+        url = reverse('rating-create', kwargs={'pk': self.movie2.id})
+        with mock.patch.object(Rating.objects, 'create', side_effect=IntegrityError):
+            response = self.client.put(url, {'rating': 7}, content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response['Retry-After'], '1')
+
+    def test_rating_list(self):
+        """Tests to check the list of the ratings of a movie."""
+        url = reverse('rating-create', kwargs={'pk': self.movie1.id})
+        for i in range(3, 8):
+            user = PlatformUsers.objects.create(first_name='testUserName', last_name='testUserSurname',
+                                                email=f'test{i}@example.com')
+            Rating.objects.create(user=user, movie=self.movie1, rating=i)
+        expected = list(Rating.objects.filter(movie=self.movie1).values_list('id', flat=True))
+
+        # The pages are followed with the cursors, with the same queries for any page size
+        with CaptureQueriesContext(connection) as small_page:
+            response = self.client.get(url, {'page_size': '2'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['results'][0]['user'], 'test@example.com')
+        seen = [rating['id'] for rating in response.json()['results']]
+        while response.json()['next'] is not None:
+            response = self.client.get(response.json()['next'])
+            seen += [rating['id'] for rating in response.json()['results']]
+        self.assertEqual(seen, expected)
+
+        with CaptureQueriesContext(connection) as big_page:
+            response = self.client.get(url, {'page_size': '7'})
+        self.assertEqual(len(response.json()['results']), 7)
+        self.assertEqual(len(small_page), len(big_page))
+
+        # Export of all the ratings, one per line
+        response = self.client.get(url, {'export': 'ndjson'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([line['id'] for line in lines], expected)
+        self.assertEqual(lines[0], {'id': expected[0], 'rating': 8, 'comment': 'Good movie',
+                                    'user': 'test@example.com'})
+
+        # Invalid export format and cursor
+        response = self.client.get(url, {'export': 'xml'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(url, {'cursor': 'abc'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
     def test_get_rating_user_movie(self):
         """Tests to check the rating endpoint."""
         url = reverse('rating-user-movie', kwargs={'pk': 197516347})
@@ -823,3 +1651,430 @@ class RatingsViewsTestCase(TestCase):
         # Valid delete
         response = self.client.delete(url)
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+    def test_rating_aggregates(self):
+        """Tests that the rating aggregates of the movie follow the rating writes."""
+        self.movie1.refresh_from_db()
+        self.assertEqual(self.movie1.rating_count, 2)
+        self.assertEqual(self.movie1.rating_sum, 13)
+        self.assertEqual(self.movie1.average_rating, 6.5)
+
+        # Create a rating
+        self.client.cookies['session'] = self.token2.key
+        url = reverse('rating-create', kwargs={'pk': self.movie2.id})
+        response = self.client.post(url, {'rating': 9})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.movie2.refresh_from_db()
+        self.assertEqual((self.movie2.rating_count, self.movie2.rating_sum), (2, 12))
+        self.assertEqual(self.movie2.average_rating, 6)
+
+        # Update a rating
+        url = reverse('rating-user-movie', kwargs={'pk': self.movie1.id})
+        response = self.client.put(url, {'rating': 9}, content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.movie1.refresh_from_db()
+        self.assertEqual((self.movie1.rating_count, self.movie1.rating_sum), (2, 17))
+        self.assertEqual(self.movie1.average_rating, 8.5)
+
+        # Delete the ratings of the movie
+        response = self.client.delete(url)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.client.cookies['session'] = self.token1.key
+        response = self.client.delete(url)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.movie1.refresh_from_db()
+        self.assertEqual((self.movie1.rating_count, self.movie1.rating_sum), (0, 0))
+        self.assertIsNone(self.movie1.average_rating)
+
+        # The aggregates can be rebuilt from the ratings
+        Movies.objects.update(rating_count=0, rating_sum=0, average_rating=None)
+        call_command('rebuild_rating_aggregates', stdout=open(os.devnull, 'w'))
+        self.movie2.refresh_from_db()
+        self.assertEqual((self.movie2.rating_count, self.movie2.rating_sum), (2, 12))
+        self.assertEqual(self.movie2.average_rating, 6)
+
+    def test_rating_distribution(self):
+        """Tests to check the distribution of the ratings in the detail of the movie."""
+        url = reverse('movie-detail', kwargs={'pk': self.movie1.id})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        distribution = response.data['rating_distribution']
+        self.assertEqual(distribution['histogram'], {1: 0, 2: 0, 3: 0, 4: 0, 5: 1, 6: 0, 7: 0, 8: 1, 9: 0, 10: 0})
+        self.assertEqual((distribution['count'], distribution['median'], distribution['stddev']), (2, 6.5, 1.5))
+        self.assertNotIn('rating_count_8', response.data)
+
+        # The counters follow the rating writes
+        Rating.objects.create(user=self.admin, movie=self.movie1, rating=10)
+        self.client.cookies['session'] = self.token2.key
+        response = self.client.put(reverse('rating-user-movie', kwargs={'pk': self.movie1.id}),
+                                   {'rating': 9}, content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        Rating.objects.filter(user=self.user1, movie=self.movie2).delete()
+        response = self.client.get(url)
+        distribution = response.data['rating_distribution']
+        self.assertEqual({score: count for score, count in distribution['histogram'].items() if count},
+                         {8: 1, 9: 1, 10: 1})
+        self.assertEqual((distribution['count'], distribution['median']), (3, 9))
+        self.assertAlmostEqual(distribution['stddev'], (2 / 3) ** 0.5)
+        response = self.client.get(reverse('movie-detail', kwargs={'pk': self.movie2.id}))
+        distribution = response.data['rating_distribution']
+        self.assertEqual((distribution['count'], distribution['median'], distribution['stddev']), (0, None, None))
+
+        # The counters can be rebuilt from the ratings
+        Movies.objects.update(rating_count_8=0, rating_count_9=5)
+        call_command('rebuild_rating_aggregates', stdout=open(os.devnull, 'w'))
+        movie = Movies.objects.get(pk=self.movie1.id)
+        self.assertEqual((movie.rating_count_8, movie.rating_count_9, movie.rating_count_10), (1, 1, 1))
+
+    def test_similar_movies(self):
+        """Tests to check the similar movies computed from the ratings."""
+        Rating.objects.create(user=self.user1, movie=self.movie3, rating=7)
+        Rating.objects.create(user=self.user2, movie=self.movie2, rating=2)
+        Rating.objects.create(user=self.user2, movie=self.movie3, rating=6)
+        Rating.objects.create(user=self.admin, movie=self.movie1, rating=9)
+        Rating.objects.create(user=self.admin, movie=self.movie2, rating=1)
+        Rating.objects.create(user=self.admin, movie=self.movie3, rating=8)
+        self.assertTrue(Movies.objects.get(pk=self.movie3.id).similar_stale)
+
+        call_command('build_similar_movies', stdout=open(os.devnull, 'w'))
+        self.assertFalse(Movies.objects.filter(similar_stale=True).exists())
+
+        # The users like the first and the third movies and dislike the second one
+        url = reverse('movie-similar', kwargs={'pk': self.movie1.id})
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([movie['id'] for movie in response.data], [self.movie3.id])
+        self.assertEqual(response.data[0]['title'], 'Movie 3')
+        self.assertEqual(response.data[0]['average_rating'], 7)
+        self.assertTrue(0 < response.data[0]['score'] <= 1)
+        response = self.client.get(reverse('movie-similar', kwargs={'pk': self.movie2.id}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, [])
+        response = self.client.get(reverse('movie-similar', kwargs={'pk': 197516347}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        # Without two common ratings the movies are not compared
+        Rating.objects.filter(user=self.user2, movie=self.movie3).delete()
+        Rating.objects.filter(user=self.admin, movie=self.movie3).delete()
+        self.assertEqual(list(Movies.objects.filter(similar_stale=True).values_list('pk', flat=True)),
+                         [self.movie3.id])
+
+        # Only the lists of the stale movies are computed again
+        call_command('build_similar_movies', '--stale', stdout=open(os.devnull, 'w'))
+        self.assertFalse(Movies.objects.filter(similar_stale=True).exists())
+        response = self.client.get(reverse('movie-similar', kwargs={'pk': self.movie3.id}))
+        self.assertEqual(response.data, [])
+        response = self.client.get(url)
+        self.assertEqual([movie['id'] for movie in response.data], [self.movie3.id])
+
+        call_command('build_similar_movies', stdout=open(os.devnull, 'w'))
+        response = self.client.get(url)
+        self.assertEqual(response.data, [])
+
+    def test_user_recommendations(self):
+        """Tests to check the recommendations of the users from the trained model."""
+        url = reverse('user-recommendations')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        Rating.objects.create(user=self.user2, movie=self.movie3, rating=6)
+        Rating.objects.create(user=self.admin, movie=self.movie1, rating=9)
+        Rating.objects.create(user=self.admin, movie=self.movie3, rating=8)
+        with tempfile.TemporaryDirectory() as directory, self.settings(RECOMMENDATION_MODEL_DIR=directory):
+            # Without a model the most rated movies are recommended
+            self.client.cookies['session'] = self.token1.key
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual([movie['id'] for movie in response.data], [self.movie3.id])
+
+            call_command('train_recommendations', '--factors', '4', stdout=open(os.devnull, 'w'))
+            model = get_model()
+            self.assertIsInstance(model.movie_factors, np.memmap)
+            self.assertEqual(model.movie_factors.shape, (3, 4))
+
+            # The movies rated by the user are not recommended
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual([movie['id'] for movie in response.data], [self.movie3.id])
+            self.assertEqual(response.data[0]['title'], 'Movie 3')
+            self.client.cookies['session'] = self.admin_token.key
+            response = self.client.get(url, {'limit': 1})
+            self.assertEqual([movie['id'] for movie in response.data], [self.movie2.id])
+            response = self.client.get(url, {'limit': 0})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+            # A new model replaces the previous one in the running processes
+            Rating.objects.filter(user=self.admin, movie=self.movie3).delete()
+            call_command('train_recommendations', '--factors', '4', stdout=open(os.devnull, 'w'))
+            call_command('train_recommendations', '--factors', '4', stdout=open(os.devnull, 'w'))
+            self.assertIsNot(get_model(), model)
+            self.assertEqual(len(os.listdir(directory)), 3)
+            response = self.client.get(url)
+            self.assertEqual({movie['id'] for movie in response.data}, {self.movie2.id, self.movie3.id})
+
+    def test_top_charts(self):
+        """Tests to check the top charts ranked by the weighted rating."""
+        url = reverse('chart', kwargs={'chart': 'overall'})
+        with self.settings(CHART_MIN_RATINGS=2):
+            call_command('rebuild_charts', stdout=open(os.devnull, 'w'))
+            # The second movie has a single rating, not enough to enter the charts
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.data['count'], 1)
+            entry = response.data['results'][0]
+            self.assertEqual((entry['rank'], entry['id'], entry['rating_count']), (1, self.movie1.id, 2))
+            self.assertAlmostEqual(entry['weighted_rating'], (13 + 2 * 16 / 3) / 4)
+
+            # The charts follow the ratings
+            Rating.objects.create(user=self.user2, movie=self.movie2, rating=9)
+            Rating.objects.create(user=self.user2, movie=self.movie3, rating=10)
+            Rating.objects.create(user=self.admin, movie=self.movie3, rating=10)
+            response = self.client.get(url)
+            self.assertEqual([entry['id'] for entry in response.data['results']],
+                             [self.movie3.id, self.movie1.id, self.movie2.id])
+            response = self.client.get(url, {'page': 2, 'page_size': 1})
+            self.assertEqual(response.data['results'][0]['rank'], 2)
+            self.assertEqual(response.data['results'][0]['id'], self.movie1.id)
+
+            # The ratings of the movies with few ratings are pulled towards the mean
+            self.assertAlmostEqual(ChartEntry.objects.get(chart='overall', movie=self.movie3).weighted_rating,
+                                   (20 + 2 * 16 / 3) / 4)
+
+            # A vote of a movie that stays in the charts only updates the score of its entries
+            entries = set(ChartEntry.objects.filter(movie=self.movie1).values_list('pk', flat=True))
+            rating = Rating.objects.get(user=self.user2, movie=self.movie1)
+            rating.rating = 7
+            rating.save()
+            self.assertEqual(set(ChartEntry.objects.filter(movie=self.movie1).values_list('pk', flat=True)), entries)
+            self.assertAlmostEqual(ChartEntry.objects.get(chart='overall', movie=self.movie1).weighted_rating,
+                                   (15 + 2 * 16 / 3) / 4)
+
+            # The charts of the genres, the decades and the languages
+            url = reverse('chart', kwargs={'chart': 'genre'})
+            response = self.client.get(url, {'key': 'action'})
+            self.assertEqual([entry['id'] for entry in response.data['results']],
+                             [self.movie3.id, self.movie1.id])
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            url = reverse('chart', kwargs={'chart': 'decade'})
+            response = self.client.get(url, {'key': '2020s'})
+            self.assertEqual(response.data['count'], 3)
+            url = reverse('chart', kwargs={'chart': 'language'})
+            response = self.client.get(url, {'key': 'Spanish'})
+            self.assertEqual([entry['id'] for entry in response.data['results']], [self.movie2.id])
+            response = self.client.get(reverse('chart', kwargs={'chart': 'actor'}))
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+            # The movies leave the charts when they change
+            self.movie2.language = 'English'
+            self.movie2.save()
+            response = self.client.get(url, {'key': 'spanish'})
+            self.assertEqual(response.data['count'], 0)
+            self.movie3.genres.remove(Categories.objects.get(name='Action'))
+            response = self.client.get(reverse('chart', kwargs={'chart': 'genre'}), {'key': 'action'})
+            self.assertEqual([entry['id'] for entry in response.data['results']], [self.movie1.id])
+            Rating.objects.filter(user=self.admin, movie=self.movie3).delete()
+            self.assertFalse(ChartEntry.objects.filter(movie=self.movie3).exists())
+
+            # The charts of a renamed or deleted genre are revalidated
+            url = reverse('chart', kwargs={'chart': 'genre'})
+            etag = self.client.get(url, {'key': 'action'})['ETag']
+            genre = Categories.objects.get(name='Action')
+            genre.name = 'Adventure'
+            genre.save()
+            response = self.client.get(url, {'key': 'action'}, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.data['count'], 0)
+            response = self.client.get(url, {'key': 'adventure'})
+            self.assertEqual([entry['id'] for entry in response.data['results']], [self.movie1.id])
+            genre.delete()
+            response = self.client.get(url, {'key': 'adventure'}, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.data['count'], 0)
+
+    def test_rating_bulk(self):
+        """Tests to check the bulk creation and update of ratings"""
+        url = reverse('rating-bulk')
+        ratings = [
+            # Replaces the rating of the user
+            {'user': 'test@example.com', 'movie': self.movie1.id, 'rating': 2, 'comment': 'Worse'},
+            {'user': 'test2@example.com', 'movie': self.movie3.id, 'rating': 7},
+            {'user': 'admin@email.com', 'movie': self.movie3.id, 'rating': 4, 'comment': 'Meh'},
+            # Only the last rating of the user for the movie is kept
+            {'user': 'admin@email.com', 'movie': self.movie3.id, 'rating': 10, 'comment': 'Great'},
+            # Invalid ratings
+            {'user': 'test@example.com', 'movie': self.movie2.id, 'rating': 11},
+            {'user': 'nobody@example.com', 'movie': self.movie2.id, 'rating': 5},
+            {'user': 'test@example.com', 'movie': 0, 'rating': 5},
+            {'user': 'test@example.com', 'rating': 5},
+        ]
+
+        # Only admins can use it
+        response = self.client.post(url, json.dumps(ratings), content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.client.cookies['session'] = self.token1.key
+        response = self.client.post(url, json.dumps(ratings), content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self.client.cookies['session'] = self.admin_token.key
+        response = self.client.post(url, json.dumps({'rating': 5}), content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        # A single insert for all the ratings and an update of the aggregates
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, json.dumps(ratings), content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['imported'], 3)
+        self.assertEqual([error['index'] for error in response.json()['errors']], [5, 6, 7, 8])
+        rating_writes = [query for query in queries.captured_queries
+                         if query['sql'].startswith(('INSERT INTO "Filmaffinity_rating"',
+                                                     'UPDATE "Filmaffinity_rating"'))]
+        self.assertEqual(len(rating_writes), 1)
+
+        self.assertEqual(Rating.objects.count(), 5)
+        rating = Rating.objects.get(user=self.user1, movie=self.movie1)
+        self.assertEqual((rating.rating, rating.comment), (2, 'Worse'))
+        self.assertEqual(Rating.objects.get(user=self.admin, movie=self.movie3).rating, 10)
+
+        self.movie1.refresh_from_db()
+        self.assertEqual((self.movie1.rating_count, self.movie1.rating_sum), (2, 7))
+        self.movie3.refresh_from_db()
+        self.assertEqual((self.movie3.rating_count, self.movie3.rating_sum), (2, 17))
+        self.assertEqual(self.movie3.average_rating, 8.5)
+
+        # The command reads the ratings from a file
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'ratings.csv')
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write('user,movie,rating,comment\n')
+                f.write(f'test2@example.com,{self.movie2.id},1,"Bad, really bad"\n')
+            call_command('import_ratings', path, stdout=open(os.devnull, 'w'))
+        self.movie2.refresh_from_db()
+        self.assertEqual((self.movie2.rating_count, self.movie2.rating_sum), (2, 4))
+        self.assertEqual(Rating.objects.get(user=self.user2, movie=self.movie2).comment, 'Bad, really bad')
+
+
+class NormalizationTestCase(TestCase):
+    def test_people_lookup_key(self):
+        """Tests to check that the people are looked up by their normalized key"""
+        actor, created = Actors.get_or_create_normalized(name='maría-josé', surname="o'neill")
+        self.assertTrue(created)
+        self.assertEqual(str(actor), 'María José Oneill')
+        self.assertEqual(actor.lookup_key, 'María José|Oneill')
+
+        # The same person written in another way
+        same, created = Actors.get_or_create_normalized(name='MARÍA JOSÉ', surname='ONeill')
+        self.assertFalse(created)
+        self.assertEqual(same.pk, actor.pk)
+
+        # The key changes with the name
+        actor.surname = 'smith'
+        actor.save()
+        self.assertEqual(Actors.objects.get(pk=actor.pk).lookup_key, 'María José|Smith')
+
+        # The name and the surname are not mixed up
+        director = Directors.get_or_create_normalized(name='Ana', surname='Maria Lopez')[0]
+        other = Directors.get_or_create_normalized(name='Ana Maria', surname='Lopez')[0]
+        self.assertNotEqual(director.pk, other.pk)
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql',
+                     'The filters are substring matches, only PostgreSQL can index them')
+class MovieFilterIndexesTestCase(TestCase):
+    """
+    Checks with EXPLAIN that no filter of the movie list needs a full scan
+    of the movies, actors, directors or categories tables.
+    """
+    filters = [
+        {'title': 'Title 123'},
+        {'synopsis': 'synopsis 42'},
+        {'language': 'Language 7'},
+        {'genre': 'Genre 12'},
+        {'actor': 'Name 12'},
+        {'actor': 'Name 12 Surname 34'},
+        {'director': 'Name 12'},
+        {'director': 'Name 12 Surname 34'},
+        {'rating': '9'},
+        {'q': 'synopsis 42'},
+        {'title': 'Title 1', 'genre': 'Genre 1', 'actor': 'Name 1'},
+    ]
+    tables = ['Filmaffinity_movies', 'Filmaffinity_actors',
+              'Filmaffinity_directors', 'Filmaffinity_categories']
+
+    @classmethod
+    def setUpTestData(cls):
+        total = 3000
+        names = [(f'Name {i}', f'Surname {i}') for i in range(300)]
+        Actors.objects.bulk_create([Actors(name=name, surname=surname, lookup_key=person_key(name, surname))
+                                    for name, surname in names])
+        Directors.objects.bulk_create([Directors(name=name, surname=surname, lookup_key=person_key(name, surname))
+                                       for name, surname in names])
+        Categories.objects.bulk_create([Categories(name=f'Genre {i}') for i in range(50)])
+        actors = list(Actors.objects.values_list('pk', flat=True))
+        directors = list(Directors.objects.values_list('pk', flat=True))
+        genres = list(Categories.objects.values_list('pk', flat=True))
+
+        movies = Movies.objects.bulk_create([
+            Movies(title=f'Title {i}', synopsis=f'The synopsis {i}', language=f'Language {i % 40}',
+                   director_id=directors[i % len(directors)], duration=100,
+                   release_date='2021-01-01', rating_count=1, rating_sum=i % 10,
+                   average_rating=i % 10)
+            for i in range(total)
+        ])
+        Movies.actors.through.objects.bulk_create([
+            Movies.actors.through(movies_id=movie.pk, actors_id=actors[(i + j) % len(actors)])
+            for i, movie in enumerate(movies) for j in range(3)
+        ])
+        Movies.genres.through.objects.bulk_create([
+            Movies.genres.through(movies_id=movie.pk, categories_id=genres[i % len(genres)])
+            for i, movie in enumerate(movies)
+        ])
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def full_scans(self, plan):
+        """
+        Returns the tables of the plan that are filtered row by row while
+        being read entirely: sequential scans and index scans without an
+        index condition. Full reads without a filter are the joins of the
+        related rows, not filters of the list.
+        """
+        scans = []
+        if plan.get('Relation Name') in self.tables and 'Filter' in plan:
+            if plan['Node Type'] == 'Seq Scan' or (
+                    plan['Node Type'] in ('Index Scan', 'Index Only Scan') and 'Index Cond' not in plan):
+                scans.append(plan['Relation Name'])
+        for child in plan.get('Plans', []):
+            scans += self.full_scans(child)
+        return scans
+
+    def test_filters_use_indexes(self):
+        """Tests that every filter of the movie list can be answered with an index."""
+        factory = APIRequestFactory()
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            if cursor.fetchone() is None:
+                self.skipTest('The pg_trgm extension is not installed in the database')
+            # A sequential scan is only chosen now if no index can be used
+            cursor.execute('SET LOCAL enable_seqscan = off')
+
+        for params in self.filters:
+            view = MovieListCreateAPIView()
+            view.request = Request(factory.get(reverse('movie-list'), params))
+            view.format_kwarg = None
+            plan = view.get_queryset().explain(format='json')
+            self.assertEqual(self.full_scans(json.loads(plan)[0]['Plan']), [],
+                             f'Filter {params} scans the whole table:\n{plan}')
+
+    def test_typeahead_uses_indexes(self):
+        """Tests that the typeahead of the names is answered with an index."""
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+
+        for model, prefix in ((Actors, 'name 1'), (Actors, 'surname 2'), (Actors, 'name 12 surname 3'),
+                              (Directors, 'name 1'), (Categories, 'genre 1')):
+            for query, ordering in name_prefix_queries(model, prefix):
+                plan = model.objects.filter(query).order_by(*ordering)[:10].explain(format='json')
+                self.assertEqual(self.full_scans(json.loads(plan)[0]['Plan']), [],
+                                 f'The typeahead of {prefix} scans the whole table:\n{plan}')
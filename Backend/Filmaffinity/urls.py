@@ -5,6 +5,9 @@ urlpatterns = [
     # Movie endpoints
     path("movies/", views.MovieListCreateAPIView.as_view(), name="movie-list"),
     path("movies/<int:pk>/", views.MovieDetailAPIView.as_view(), name="movie-detail"),
+    path("movies/facets/", views.MovieFacetsAPIView.as_view(), name="movie-facets"),
+    path("movies/<int:pk>/similar/", views.SimilarMoviesAPIView.as_view(), name="movie-similar"),
+    path("charts/<str:chart>/", views.ChartAPIView.as_view(), name="chart"),
     # User endpoints
     path("users/", views.UserRegisterAPIView.as_view(), name="user-register"),
     path("users/login/", views.UserLoginAPIView.as_view(), name="user-login"),
@@ -13,9 +16,11 @@ urlpatterns = [
     path("users/check-session/", views.UserIsLoggedAPIView.as_view(), name="user-islogged"),
     path("users/check-admin/", views.UserIsAdminAPIView.as_view(), name="user-isadmin"),
     path("users/ratings/", views.UserReviewsListAPIView.as_view(), name="user-ratings"),
+    path("users/recommendations/", views.UserRecommendationsAPIView.as_view(), name="user-recommendations"),
     # Rating endpoints
     path("movies/<int:pk>/rating/", views.RatingAPIView.as_view(), name="rating-create"),
     path("movies/<int:pk>/rating/user-rating/", views.RatingUserMovieAPIView.as_view(), name="rating-user-movie"),
+    path("ratings/bulk/", views.RatingBulkAPIView.as_view(), name="rating-bulk"),
     # Other models endpoints
     path("actors/", views.ActorsListCreateAPIView.as_view(), name="actor-list"),
     path("directors/", views.DirectorListCreateAPIVIew.as_view(), name="director-list"),
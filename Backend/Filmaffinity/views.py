@@ -1,5 +1,8 @@
+import json
+
+from django.conf import settings
 from django.shortcuts import render
-from django.db.models import Q
+from django.http import StreamingHttpResponse
 
 # Create your views here.
 from rest_framework import generics, status
@@ -7,13 +10,13 @@ from rest_framework.response import Response
 from rest_framework.request import Request
 from rest_framework.exceptions import NotFound
 from rest_framework.authtoken.models import Token
-from rest_framework.settings import api_settings
 from rest_framework.exceptions import ValidationError
 from django.core.exceptions import ObjectDoesNotExist, PermissionDenied
+from django.db import transaction
 from django.db.utils import IntegrityError
-from django.db.models import Avg, F
+from django.db.models import F
 from drf_spectacular.utils import extend_schema, OpenApiResponse, extend_schema_view
-from .models import Movies, Rating, Actors, Directors, Categories
+from .models import Movies, Rating, Actors, Directors, Categories, ChartEntry, SimilarMovie
 from .serializers import (MoviesSerializer,
                           UsersSerializer,
                           LoginSerializer,
@@ -21,19 +24,39 @@ from .serializers import (MoviesSerializer,
                           UserRatingsSerializer,
                           ActorsSerializer,
                           DirectorsSerializer,
-                          CategoriesSerializer)
-from rest_framework.pagination import PageNumberPagination
+                          CategoriesSerializer,
+                          ChartEntrySerializer,
+                          RecommendedMovieSerializer,
+                          SimilarMovieSerializer)
+from .caching import (MOVIE_ALL_GROUP, MOVIE_LIST_GROUP, MOVIE_RATINGS_GROUP, ConditionalGetMixin,
+                      ResponseCacheMixin, get_ratings_version, refresh_movie_ratings)
+from .charts import chart_key
+from .filters import (FACET_LIMIT, MAX_FACET_LIMIT, MAX_TYPEAHEAD_LIMIT, MOVIE_FILTER_PARAMS,
+                      TYPEAHEAD_LIMIT, filter_movies, movie_facets, name_prefix_queries)
+from .importer import RatingImporter
+from .pagination import (KeysetPagination, MoviePageNumberPagination, OptionalPageNumberPagination,
+                         RatingCursorPagination)
+from .ratings import rating_distribution
+from .recommendations import MAX_RECOMMENDATIONS, RECOMMENDATIONS, get_model
+from .resolvers import resolve_genres, resolve_people
+
+def get_session_user(request):
+    """
+    Returns the user of the session cookie.
+    The user is resolved by the authentication class of the API,
+    so this function does not query the database.
+    """
+    if not request.user.is_authenticated:
+        raise PermissionDenied('No session active')
+    return request.user
+
 
 def is_admin(request):
     """
     By default users created as PlatformUsers are not staff.
     Therefore, we need to check if the user is staff to know if it is an admin.
     """
-    token = request.COOKIES.get('session')
-    if token is None or not Token.objects.filter(key=token).exists():
-        raise PermissionDenied('No session active')
-    user = Token.objects.get(key=token).user
-    return user.is_staff
+    return get_session_user(request).is_staff
 
 
 @extend_schema(
@@ -48,8 +71,7 @@ class UserIsLoggedAPIView(generics.GenericAPIView):
     This view checks if the user is logged in.
     """
     def get(self, request, *args, **kwargs):
-        token = request.COOKIES.get('session')
-        if token is None or not Token.objects.filter(key=token).exists():
+        if not request.user.is_authenticated:
             return Response(status=status.HTTP_401_UNAUTHORIZED,
                             data={'error': 'No session active'})
         return Response(status=status.HTTP_200_OK)
@@ -157,16 +179,7 @@ class UserInfoAPIView(generics.RetrieveUpdateDestroyAPIView):
         """
         Function to get the user from the token.
         """
-        # We get the user from the token
-        token = self.request.COOKIES.get('session')
-
-        # If the token does not exist, we raise an error
-        if token is None or not Token.objects.filter(key=token).exists():
-            raise PermissionDenied('No session active')
-
-        # We get the user from the token
-        user = Token.objects.get(key=token).user
-        return user
+        return get_session_user(self.request)
 
     @extend_schema(
         description='Get user information endpoint',
@@ -252,8 +265,8 @@ class UserLogoutAPIView(generics.DestroyAPIView):
                             data={'error': 'No session active'})
         response = Response(status=status.HTTP_204_NO_CONTENT)
         response.delete_cookie('session')
-        token = Token.objects.get(key=request.COOKIES['session'])
-        token.delete()
+        # Deleting the token also removes it from the authentication cache
+        Token.objects.filter(key=request.COOKIES['session']).delete()
         return response
 
 @extend_schema(
@@ -268,30 +281,23 @@ class UserReviewsListAPIView(generics.ListAPIView):
     This view returns the reviews of the user.
     """
     serializer_class = UserRatingsSerializer
+    pagination_class = RatingCursorPagination
 
     def get_object(self):
         """
         Function to get the user from the token.
         """
-        # We get the user from the token
-        token = self.request.COOKIES.get('session')
-
-        # If the token does not exist, we raise an error
-        if token is None or not Token.objects.filter(key=token).exists():
-            raise PermissionDenied('No session active')
-
-        # We get the user from the token
-        user = Token.objects.get(key=token).user
-        return user
+        return get_session_user(self.request)
 
-    def list(self, request, *args, **kwargs):
+    def get_queryset(self):
         """
-        This function returns the reviews of the user.
+        This function returns the reviews of the user, in pages.
+        The movie of each review is loaded in the same query,
+        only with the fields that are returned.
         """
         user = self.get_object()
-        ratings = user.ratings.all()
-        serializer = self.get_serializer(ratings, many=True)
-        return Response(serializer.data)
+        return user.ratings.select_related('movie').only(
+            'user', 'rating', 'comment', 'movie__title', 'movie__poster', 'movie__poster_variants')
 
     def handle_exception(self, exc):
         if isinstance(exc, PermissionDenied):
@@ -299,6 +305,56 @@ class UserReviewsListAPIView(generics.ListAPIView):
                             data={'error': 'No session active'})
         return super().handle_exception(exc)
 
+@extend_schema(
+    description='Recommendations for the user endpoint',
+    responses={
+        200: OpenApiResponse(description='Movies recommended for the user'),
+        400: OpenApiResponse(description='Invalid limit'),
+        401: OpenApiResponse(description='No session active'),
+    }
+)
+class UserRecommendationsAPIView(generics.ListAPIView):
+    """
+    This view returns the movies recommended for the user, the first
+    'limit' (20 by default) by the scores of the model trained by
+    train_recommendations, without the movies the user has rated.
+    The users that had no ratings when the model was trained, or
+    if there is no model yet, get the most rated movies.
+    """
+    serializer_class = RecommendedMovieSerializer
+    pagination_class = None
+
+    def list(self, request, *args, **kwargs):
+        user = get_session_user(request)
+        try:
+            limit = int(request.query_params.get('limit', RECOMMENDATIONS))
+        except ValueError:
+            raise ValidationError('Limit must be an integer')
+        if not 1 <= limit <= MAX_RECOMMENDATIONS:
+            raise ValidationError(f'Limit must be between 1 and {MAX_RECOMMENDATIONS}')
+
+        rated = user.ratings.values_list('movie_id', flat=True)
+        model = get_model()
+        recommended = model.recommend(user.pk, set(rated), limit) if model is not None else None
+        if recommended is None:
+            movies = Movies.objects.exclude(pk__in=rated).order_by('-rating_count', 'title')[:limit]
+        else:
+            movie_ids, _ = recommended
+            # The movies deleted since the model was trained are skipped
+            movies = Movies.objects.in_bulk(movie_ids.tolist())
+            movies = [movies[movie_id] for movie_id in movie_ids.tolist() if movie_id in movies]
+        return Response(self.get_serializer(movies, many=True).data)
+
+    def handle_exception(self, exc):
+        if isinstance(exc, PermissionDenied):
+            return Response(status=status.HTTP_401_UNAUTHORIZED,
+                            data={'error': 'No session active'})
+        if isinstance(exc, ValidationError):
+            return Response(status=status.HTTP_400_BAD_REQUEST,
+                            data={'error': str(exc)})
+        return super().handle_exception(exc)
+
+
 @extend_schema_view(
     list=extend_schema(
         description='List of movies endpoint',
@@ -316,17 +372,39 @@ class UserReviewsListAPIView(generics.ListAPIView):
         }
     )
 )
-class MovieListCreateAPIView(generics.ListCreateAPIView):
+class MovieListCreateAPIView(ConditionalGetMixin, ResponseCacheMixin, generics.ListCreateAPIView):
     """
     This view allows the creation of a movie and the list of movies.
     It consists of a filter to search for movies by title, director,
     genre, actor, rating, synopsis and language.
 
     The movies are returned with the average rating.
+    The responses have an ETag, so the clients can revalidate them,
+    and the pages are kept in the response cache until a movie changes.
     """
-    queryset = Movies.objects.all().order_by(F('title'))
+    # The related objects are loaded in bulk and the average rating is
+    # stored in the movie, so a page is built with a constant number of queries
+    queryset = Movies.objects.select_related('director').prefetch_related(
+        'actors', 'genres'
+    ).order_by(F('title'))
     serializer_class = MoviesSerializer
-    pagination_class = PageNumberPagination
+    pagination_class = MoviePageNumberPagination
+    # Params that return the same page when they are not sent
+    response_cache_defaults = {'page': '1', 'pagination': 'page'}
+
+    def get_response_cache_groups(self):
+        if 'rating' in self.request.query_params:
+            return [MOVIE_LIST_GROUP, MOVIE_RATINGS_GROUP]
+        return [MOVIE_LIST_GROUP]
+
+    def update_cached_data(self, data):
+        # The pages are kept when only the ratings change
+        refresh_movie_ratings(data['results'] if isinstance(data, dict) else data)
+        return data
+
+    def get_movie_ratings_version(self, request):
+        # The average rating of each movie is in the list
+        return get_ratings_version()
 
     def get_queryset(self):
         """
@@ -345,6 +423,8 @@ class MovieListCreateAPIView(generics.ListCreateAPIView):
         response = requests.get(url, params=movie_data)
 
         Inside the movie data we can add the following filters:
+        - q: full text search in the title, synopsis, director, actors and
+          genres. The results are ordered by relevance.
         - title
         - director
         - genre
@@ -353,32 +433,23 @@ class MovieListCreateAPIView(generics.ListCreateAPIView):
         - synopsis
         - language
         - page_size
+        - pagination: 'page' (default) to get numbered pages with the
+          total count, or 'cursor' to get the movies ordered by title (also
+          when searching with q) with opaque next and previous links.
+          Cursor pages do not count the movies and cost the same at any
+          depth of the catalog.
+        - cursor: position of the page when the pagination is 'cursor'.
         """
 
         # The queryset contais all the object Movies of the database
         queryset = super().get_queryset()
 
-        # Get the posible params of the request
-        title = self.request.query_params.get('title')
-        director = self.request.query_params.get('director')
-        genre = self.request.query_params.get('genre')
-        actor = self.request.query_params.get('actor')
-        rating = self.request.query_params.get('rating')
-        synopsis = self.request.query_params.get('synopsis')
-        release_date = self.request.query_params.get('release_date')
-        language = self.request.query_params.get('language')
-
         # Validate that the params are present in the request
         # We can not have different params than those allowed
-        allowed_params = {'title',
-                          'rating',
-                          'page',
-                          'director',
-                          'genre',
-                          'actor',
-                          'synopsis',
-                          'language',
-                          'page_size',}
+        allowed_params = MOVIE_FILTER_PARAMS | {'page',
+                                                'page_size',
+                                                'pagination',
+                                                'cursor',}
 
         request_params = set(self.request.query_params.keys())
         invalid_params = request_params - allowed_params
@@ -387,93 +458,12 @@ class MovieListCreateAPIView(generics.ListCreateAPIView):
         if invalid_params:
             raise ValidationError(f'Not Valid Params: {invalid_params}')
 
-        # Validate that the params are valid
-        try:
-            # The rating must be a number
-            if rating is not None:
-                rating = float(rating)
-
-                # The rating must be between 1 and 10
-                if rating < 1 or rating > 10:
-                    raise ValidationError('Rating must be between 1 and 10')
+        # The pagination must be one of the available modes
+        if self.request.query_params.get('pagination') not in (None, 'page', 'cursor'):
+            raise ValidationError('Pagination must be page or cursor')
 
-        except ValueError:
-            raise ValidationError('Rating must be a float')
-
-        # Filter the queryset with the params
-        if title is not None:
-            queryset = queryset.filter(title__icontains=title)
-
-        # Filter for the movies directed by the director
-        if director is not None:
-
-            director = director.split()
-
-            # Design the query to filter the movies that contain the director name
-            director_name_query = Q(director__name__icontains=director[0])
-        
-            # Check if the director has a name and a surname
-            if len(director) > 1:
-
-                # Design the query to filter the movies that contain the director surname
-                # concating all the words after the name
-                director_surname_query = Q(director__surname__icontains=' '.join(director[1:]))
-            
-            else:
-                # Check if the first word is the name or the surname
-                director_surname_query = Q(director__surname__icontains=director[0])
-
-            # Filter the queryset with the director name or surname
-            queryset = queryset.filter(director_name_query | director_surname_query).distinct()
-    
-
-        # Filter for the movies that contain the genre
-        if genre is not None:
-            queryset = queryset.filter(genres__name__icontains=genre).distinct()
-
-        # Filter for the movies that contain the actor
-        if actor is not None:
-            actor = actor.split()
-            
-            # Design the query to filter the movies that contain the actor name
-            actor_name_query = Q(actors__name__icontains=actor[0])
-
-            # Check if the actor has a name and a surname
-            if len(actor) > 1:
-                    
-                # Design the query to filter the movies that contain the actor surname
-                # concating all the words after the name
-                actor_surname_query = Q(actors__surname__icontains=' '.join(actor[1:]))
-            
-            else:
-                # Check if the first word is the name or the surname
-                actor_surname_query = Q(actors__surname__icontains=actor[0])
-            
-            # Filter the queryset with the actor name or surname
-            queryset = queryset.filter(actor_name_query | actor_surname_query).distinct()
-
-
-
-        # Filter for the movies that have a rating greater than the rating
-        if rating is not None:
-            # The mean of the ratings of the movie must be greater than the rating
-            # If the movie has no ratings, the mean is 0
-            queryset = queryset.annotate(avg_rating=Avg('ratings__rating')
-                                         ).filter(avg_rating__gte=rating)
-
-        # Filter for the movies that contain the synopsis
-        if synopsis is not None:
-            queryset = queryset.filter(synopsis__icontains=synopsis).distinct()
-
-        # Filter for the movies that have the release date
-        if release_date is not None:
-            queryset = queryset.filter(release_date__icontains=release_date)
-
-        # Filter for the movies that contain the language
-        if language is not None:
-            queryset = queryset.filter(language__icontains=language).distinct()
-
-        return queryset
+        # Filter the queryset with the params, the same filters of the facets
+        return filter_movies(queryset, self.request.query_params)
 
     def list(self, request, *args, **kwargs):
         """
@@ -481,14 +471,11 @@ class MovieListCreateAPIView(generics.ListCreateAPIView):
         """
         queryset = self.filter_queryset(self.get_queryset())
 
-        if request.query_params.get('page_size') is not None:
-            self.pagination_class.page_size = int(request.query_params.get('page_size'))
-            if self.pagination_class.page_size < 1:
-                raise ValueError('Page size must be greater than 0')
+        # First look for the pagination, the paginator reads the page size of this request
+        if request.query_params.get('pagination') == 'cursor':
+            paginator = KeysetPagination()
         else:
-            self.pagination_class.page_size = api_settings.PAGE_SIZE
-        # First look for the pagination
-        paginator = self.pagination_class()
+            paginator = self.pagination_class()
         page = paginator.paginate_queryset(queryset, request)
 
         if page is not None:
@@ -569,12 +556,9 @@ class MovieListCreateAPIView(generics.ListCreateAPIView):
     def enrich_movie(self, movie, movie_data):
         """
         This function returns the movie with the average rating.
+        The average rating, the director, the actors and the genres
+        are already loaded by the queryset, so no queries are made here.
         """
-        rating_avg = movie.ratings.aggregate(avg_rating=Avg('rating')).get('avg_rating')
-
-        # We add the rating to the movie
-        movie_data['average_rating'] = rating_avg
-
         # We change the director and actors to a string
         movie_data['title'] = str(movie.title)
         movie_data['director'] = str(movie.director)
@@ -584,14 +568,74 @@ class MovieListCreateAPIView(generics.ListCreateAPIView):
         return movie_data
 
 
-class MovieDetailAPIView(generics.RetrieveUpdateDestroyAPIView):
+@extend_schema(
+    description='Facets of the movie browser endpoint',
+    responses={
+        200: OpenApiResponse(description='Number of movies per genre, language, director and year'),
+        400: OpenApiResponse(description='Invalid params'),
+    }
+)
+class MovieFacetsAPIView(ConditionalGetMixin, ResponseCacheMixin, generics.ListAPIView):
+    """
+    This view returns the facets of the movie browser: the number of movies
+    that match the filters per genre, language, director and release year,
+    so the filters of the sidebar are built with a single request.
+
+    It accepts the same filters as the list of movies, and facet_limit,
+    the number of genres, languages and directors returned (50 by default).
+    """
+    queryset = Movies.objects.all()
+    # Params that return the same facets when they are not sent
+    response_cache_defaults = {'facet_limit': str(FACET_LIMIT)}
+
+    def get_response_cache_groups(self):
+        if 'rating' in self.request.query_params:
+            return [MOVIE_LIST_GROUP, MOVIE_RATINGS_GROUP]
+        return [MOVIE_LIST_GROUP]
+
+    def get_movie_ratings_version(self, request):
+        # The counts only depend on the ratings when they are filtered by rating
+        return get_ratings_version() if 'rating' in request.query_params else None
+
+    def list(self, request, *args, **kwargs):
+        invalid_params = set(request.query_params.keys()) - (MOVIE_FILTER_PARAMS | {'facet_limit'})
+        if invalid_params:
+            raise ValidationError(f'Not Valid Params: {invalid_params}')
+
+        try:
+            limit = int(request.query_params.get('facet_limit', FACET_LIMIT))
+        except ValueError:
+            raise ValidationError('Facet limit must be an integer')
+        if not 1 <= limit <= MAX_FACET_LIMIT:
+            raise ValidationError(f'Facet limit must be between 1 and {MAX_FACET_LIMIT}')
+
+        # The facets do not depend on the order of the movies
+        movies = filter_movies(self.get_queryset(), request.query_params, ranked=False)
+        return Response(movie_facets(movies, limit))
+
+    def handle_exception(self, exc):
+        if isinstance(exc, ValidationError):
+            return Response(status=status.HTTP_400_BAD_REQUEST,
+                            data={'error': str(exc)})
+        return super().handle_exception(exc)
+
+
+class MovieDetailAPIView(ConditionalGetMixin, ResponseCacheMixin, generics.RetrieveUpdateDestroyAPIView):
     """
     This view allows the update and deletion of a movie as well as
     just seing the movie with the average rating.
+    The movie is kept in the response cache until it changes.
     """
     queryset = Movies.objects.all()
     serializer_class = MoviesSerializer
 
+    def get_response_cache_groups(self):
+        return [MOVIE_ALL_GROUP, f"movies:detail:{self.kwargs.get('pk')}"]
+
+    def get_movie_ratings_version(self, request):
+        # A rating of another movie does not change this one
+        return get_ratings_version(self.kwargs.get('pk'))
+
     def get_object(self):
         """
         This function returns the movie with the id 'pk'.
@@ -601,18 +645,20 @@ class MovieDetailAPIView(generics.RetrieveUpdateDestroyAPIView):
 
     def retrieve(self, request, *args, **kwargs):
         """
-        This function returns the movie with the average rating.
+        This function returns the movie with the average rating
+        and the distribution of its ratings.
         """
         instance = self.get_object()
         serializer = self.get_serializer(instance)
-        rating_avg = instance.ratings.aggregate(avg_rating=Avg('rating')).get('avg_rating')
         data = serializer.data
-        data['average_rating'] = rating_avg
 
         # We change the director and actors to a string
         data['director'] = str(instance.director)
         data['actors'] = [str(actor) for actor in instance.actors.all()]
         data['genres'] = [str(genre) for genre in instance.genres.all()]
+
+        # The distribution of the ratings is read from the counters of the movie
+        data['rating_distribution'] = rating_distribution(instance)
         return Response(data)
 
     # Only admins can update
@@ -661,49 +707,195 @@ class MovieDetailAPIView(generics.RetrieveUpdateDestroyAPIView):
         return super().handle_exception(exc)
 
 
+@extend_schema(
+    description='Top charts endpoint',
+    responses={
+        200: OpenApiResponse(description='Movies of the chart ranked by their weighted rating'),
+        400: OpenApiResponse(description='Invalid key'),
+        404: OpenApiResponse(description='Chart does not exist'),
+    }
+)
+class ChartAPIView(ConditionalGetMixin, generics.ListAPIView):
+    """
+    This view returns a page of a top chart: overall, or of the genre,
+    decade or language in the 'key' param. The movies are ranked by their
+    weighted rating, which is stored in the entries of the chart, so the
+    page is read in order from an index instead of computing the ranking.
+    """
+    serializer_class = ChartEntrySerializer
+    pagination_class = MoviePageNumberPagination
+    catalog_scopes = ('movies', 'ratings', 'charts')
+
+    def get_movie_ratings_version(self, request):
+        return get_ratings_version()
+
+    def get_queryset(self):
+        chart = self.kwargs.get('chart')
+        if chart not in dict(ChartEntry.CHARTS):
+            raise NotFound('Chart does not exist')
+        key = chart_key(chart, self.request.query_params.get('key'))
+        return (ChartEntry.objects.filter(chart=chart, key=key)
+                .select_related('movie').order_by('-weighted_rating', 'movie_id'))
+
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(self.get_queryset())
+        data = self.get_serializer(page, many=True).data
+        # The position in the chart follows from the position in the page
+        for rank, entry in enumerate(data, start=self.paginator.page.start_index()):
+            entry['rank'] = rank
+        return self.get_paginated_response(data)
+
+    def handle_exception(self, exc):
+        if isinstance(exc, ValidationError):
+            return Response(status=status.HTTP_400_BAD_REQUEST,
+                            data={'error': str(exc)})
+        if isinstance(exc, NotFound):
+            return Response(status=status.HTTP_404_NOT_FOUND,
+                            data={'error': str(exc)})
+        return super().handle_exception(exc)
+
+
+@extend_schema(
+    description='Similar movies endpoint',
+    responses={
+        200: OpenApiResponse(description='Most similar movies by the ratings of the users'),
+        404: OpenApiResponse(description='Movie does not exist'),
+    }
+)
+class SimilarMoviesAPIView(ConditionalGetMixin, generics.ListAPIView):
+    """
+    This view returns the movies most similar to a movie, in order, read
+    in a single query from the lists computed by build_similar_movies.
+    A movie without enough ratings has no similar movies.
+    """
+    serializer_class = SimilarMovieSerializer
+    catalog_scopes = ('movies', 'ratings', 'similar')
+    pagination_class = None
+
+    def get_movie_ratings_version(self, request):
+        # The similar movies are returned with their average rating
+        return get_ratings_version()
+
+    def get_queryset(self):
+        return (SimilarMovie.objects.filter(movie_id=self.kwargs.get('pk'))
+                .select_related('similar').order_by('rank'))
+
+    def list(self, request, *args, **kwargs):
+        similar = list(self.get_queryset())
+        # Only check the movie when it has no similar movies
+        if not similar and not Movies.objects.filter(pk=self.kwargs.get('pk')).exists():
+            raise NotFound('Movie does not exist')
+        return Response(self.get_serializer(similar, many=True).data)
+
+    def handle_exception(self, exc):
+        if isinstance(exc, NotFound):
+            return Response(status=status.HTTP_404_NOT_FOUND,
+                            data={'error': 'Movie does not exist'})
+        return super().handle_exception(exc)
+
+
 class RatingAPIView(generics.ListCreateAPIView):
-    """Create a rating for a movie and list all the ratings of a movie."""
+    """
+    Create a rating for a movie and list all the ratings of a movie.
+
+    The ratings are returned in pages with next and previous cursors,
+    the size of the page can be changed with the 'page_size' param.
+    With the param 'export=ndjson' all the ratings are streamed instead,
+    one JSON object per line, as they are read from the database.
+    """
     serializer_class = RatingCreateListSerializer
-    pagination_class = None
+    pagination_class = RatingCursorPagination
 
     def get_queryset(self):
         """
         This method returns the list of ratings for a movie identified by 'pk'.
         """
         movie_id = self.kwargs.get('pk')
-        return Rating.objects.filter(movie=movie_id)
+        # The user is loaded in the same query to get its email
+        return Rating.objects.filter(movie=movie_id).select_related('user')
+
+    def list(self, request, *args, **kwargs):
+        """
+        This method returns a page of the ratings or streams all of them.
+        """
+        export = request.query_params.get('export')
+        if export is None:
+            return super().list(request, *args, **kwargs)
+        if export != 'ndjson':
+            raise ValidationError('Export format must be ndjson')
+
+        # The rows are read in chunks and written as they arrive,
+        # so the ratings are never all in memory at the same time
+        rows = Rating.objects.filter(movie=self.kwargs.get('pk')).order_by('id').values_list(
+            'id', 'rating', 'comment', 'user__email').iterator(chunk_size=2000)
+        lines = (json.dumps({'id': pk, 'rating': rating, 'comment': comment, 'user': email}) + '\n'
+                 for pk, rating, comment, email in rows)
+        return StreamingHttpResponse(lines, content_type='application/x-ndjson')
 
     def create(self, request, *args, **kwargs):
         """
         This method creates a rating for a movie.
+        The rating is inserted without checking anything first: the unique
+        constraint of the user and the movie rejects a second rating, and
+        the update of the aggregates of the movie finds out if it does not exist.
         """
         # We get the user from the token
-        token = request.COOKIES.get('session')
-        if token is None or not Token.objects.filter(key=token).exists():
-            raise PermissionDenied('You must be logged in to rate a movie')
+        user = get_session_user(request)
+        movie_id = self.kwargs.get('pk')
 
-        # We get the user from the token
-        user = Token.objects.get(key=token).user
+        serializer = self.get_serializer(data=request.data)
+        if not serializer.is_valid():
+            # A rating for a movie that does not exist is not found
+            if not Movies.objects.filter(pk=movie_id).exists():
+                raise NotFound('Movie does not exist')
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-        # We get the movie from the URL
-        movie_id = self.kwargs.get('pk')
-        try:
-            movie = Movies.objects.get(pk=movie_id)
-        except Movies.DoesNotExist:
-            raise NotFound('Movie does not exist')
+        # If the insert or the update of the movie fails, nothing is written
+        with transaction.atomic():
+            serializer.save(user=user, movie_id=movie_id)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-        # We check if the user has already rated the movie
-        if Rating.objects.filter(user=user, movie=movie).exists():
-            raise IntegrityError('You have already rated this movie')
+    def put(self, request, *args, **kwargs):
+        """
+        This method creates the rating of the user for the movie or replaces it
+        if the user has already rated the movie, so it can be safely repeated.
+        It returns 201 if the rating is created and 200 if it is replaced.
+        """
+        user = get_session_user(request)
+        movie_id = self.kwargs.get('pk')
 
-        # We create the rating
         serializer = self.get_serializer(data=request.data)
-        if serializer.is_valid():
-            serializer.save(user=user, movie=movie)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        else:
+        if not serializer.is_valid():
+            if not Movies.objects.filter(pk=movie_id).exists():
+                raise NotFound('Movie does not exist')
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+        data = {'rating': serializer.validated_data['rating'],
+                'comment': serializer.validated_data.get('comment', '')}
+        # If the rating is deleted between the insert and the update, we try again once
+        for _ in range(2):
+            try:
+                # We try to insert it first, which is the usual case
+                with transaction.atomic():
+                    rating = Rating.objects.create(user=user, movie_id=movie_id, **data)
+                return Response(self.get_serializer(rating).data, status=status.HTTP_201_CREATED)
+            except IntegrityError:
+                pass
+
+            # The user has already rated the movie, we lock the rating and replace it
+            with transaction.atomic():
+                rating = Rating.objects.select_for_update().filter(user=user, movie_id=movie_id).first()
+                if rating is not None:
+                    rating.rating = data['rating']
+                    rating.comment = data['comment']
+                    rating.save()
+                    return Response(self.get_serializer(rating).data)
+
+        # Other requests keep creating and deleting the rating, the client can repeat it
+        return Response(status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                        data={'error': 'The rating is being changed by another request, try again'},
+                        headers={'Retry-After': '1'})
+
     def handle_exception(self, exc):
         if isinstance(exc, PermissionDenied):
             return Response(status=status.HTTP_401_UNAUTHORIZED,
@@ -715,6 +907,9 @@ class RatingAPIView(generics.ListCreateAPIView):
             return Response(status=status.HTTP_409_CONFLICT,
                             data={'error': 'You have already rated this movie'})
         if isinstance(exc, NotFound):
+            return Response(status=status.HTTP_404_NOT_FOUND,
+                            data={'error': str(exc)})
+        if isinstance(exc, Movies.DoesNotExist):
             return Response(status=status.HTTP_404_NOT_FOUND,
                             data={'error': 'Movie does not exist'})
         return super().handle_exception(exc)
@@ -728,10 +923,7 @@ class RatingUserMovieAPIView(generics.RetrieveUpdateDestroyAPIView):
         This method returns the rating of the user for the movie.
         """
         movie_id = self.kwargs.get('pk')
-        token = self.request.COOKIES.get('session')
-        if token is None or not Token.objects.filter(key=token).exists():
-            raise PermissionDenied('No session active')
-        user = Token.objects.get(key=token).user
+        user = get_session_user(self.request)
         return Rating.objects.get(user=user, movie=movie_id)
 
     def update(self, request, *args, **kwargs):
@@ -764,13 +956,89 @@ class RatingUserMovieAPIView(generics.RetrieveUpdateDestroyAPIView):
         return super().handle_exception(exc)
 
 
-class ActorsListCreateAPIView(generics.ListCreateAPIView):
+@extend_schema(
+    description='Bulk ratings endpoint',
+    responses={
+       200: OpenApiResponse(description='Ratings created or updated, with the invalid ones.'),
+       400: OpenApiResponse(description='Invalid data.'),
+       401: OpenApiResponse(description='The user is not Admin of the platform or no session active.'),
+    }
+)
+class RatingBulkAPIView(generics.GenericAPIView):
+    """
+    Creates or updates a list of ratings at once. Only admins can use it.
+
+    Each rating has the email of the user, the id of the movie, the rating
+    and optionally a comment. If the user has already rated the movie,
+    the rating is replaced. The invalid ratings are skipped and returned
+    with their position in the list, starting at 1.
+    """
+
+    def post(self, request, *args, **kwargs):
+        if not is_admin(request):
+            raise PermissionDenied('Only admins can import ratings')
+
+        ratings = request.data
+        if not isinstance(ratings, list):
+            raise ValidationError('The ratings must be a list')
+        max_ratings = getattr(settings, 'MAX_BULK_RATINGS', 10000)
+        if len(ratings) > max_ratings:
+            raise ValidationError(f'At most {max_ratings} ratings can be sent at once')
+
+        importer = RatingImporter()
+        importer.import_ratings(ratings)
+        errors = [{'index': position, 'error': error} for position, error in sorted(importer.errors)]
+        return Response({'imported': importer.imported, 'errors': errors})
+
+    def handle_exception(self, exc):
+        if isinstance(exc, PermissionDenied):
+            return Response(status=status.HTTP_401_UNAUTHORIZED,
+                            data={'error': 'Only admins can import ratings.'})
+        if isinstance(exc, ValidationError):
+            return Response(status=status.HTTP_400_BAD_REQUEST,
+                            data={'error': str(exc)})
+        return super().handle_exception(exc)
+
+
+class NameListMixin:
+    """
+    Lists of actors, directors or categories ordered by name, in three modes:
+    - All of them, when no param is sent.
+    - In numbered pages, with the params page and page_size.
+    - Typeahead, with the params prefix and limit: the first 'limit' (10 by
+      default) whose name starts with the prefix, see name_prefix_queries.
+    """
+    pagination_class = OptionalPageNumberPagination
+
+    def list(self, request, *args, **kwargs):
+        prefix = request.query_params.get('prefix')
+        if prefix is None:
+            return super().list(request, *args, **kwargs)
+
+        try:
+            limit = int(request.query_params.get('limit', TYPEAHEAD_LIMIT))
+        except ValueError:
+            raise ValidationError('Limit must be an integer')
+        if not 1 <= limit <= MAX_TYPEAHEAD_LIMIT:
+            raise ValidationError(f'Limit must be between 1 and {MAX_TYPEAHEAD_LIMIT}')
+
+        names = {}
+        for query, ordering in name_prefix_queries(self.get_queryset().model, prefix):
+            for name in self.get_queryset().filter(query).order_by(*ordering)[:limit]:
+                names.setdefault(name.pk, name)
+            if len(names) >= limit:
+                break
+        return Response(self.get_serializer(list(names.values())[:limit], many=True).data)
+
+
+class ActorsListCreateAPIView(ConditionalGetMixin, NameListMixin, generics.ListCreateAPIView):
     """
     This view allows the creation of an actor and the list of actors.
     """
+    catalog_scopes = ('actors',)
     serializer_class = ActorsSerializer
-    pagination_class = None
-    queryset = Actors.objects.all()
+    # Same order as the index of the name and surname
+    queryset = Actors.objects.order_by('name', 'surname')
 
     def create(self, request, *args, **kwargs):
         """
@@ -795,13 +1063,14 @@ class ActorsListCreateAPIView(generics.ListCreateAPIView):
         return super().handle_exception(exc)
 
 
-class DirectorListCreateAPIVIew(generics.ListCreateAPIView):
+class DirectorListCreateAPIVIew(ConditionalGetMixin, NameListMixin, generics.ListCreateAPIView):
     """
     This view allows the creation of a director and the list of directors.
     """
+    catalog_scopes = ('directors',)
     serializer_class = DirectorsSerializer
-    pagination_class = None
-    queryset = Directors.objects.all()
+    # Same order as the index of the name and surname
+    queryset = Directors.objects.order_by('name', 'surname')
 
     def create(self, request, *args, **kwargs):
         """
@@ -826,13 +1095,13 @@ class DirectorListCreateAPIVIew(generics.ListCreateAPIView):
         return super().handle_exception(exc)
 
 
-class CategoriesListCreateAPIView(generics.ListCreateAPIView):
+class CategoriesListCreateAPIView(ConditionalGetMixin, NameListMixin, generics.ListCreateAPIView):
     """
     This view allows the creation of a category and the list of categories.
     """
+    catalog_scopes = ('categories',)
     serializer_class = CategoriesSerializer
-    pagination_class = None
-    queryset = Categories.objects.all()
+    queryset = Categories.objects.order_by('name')
 
     def create(self, request, *args, **kwargs):
         """
@@ -862,30 +1131,26 @@ class CategoriesListCreateAPIView(generics.ListCreateAPIView):
 def validate_actors(value, serializer):
     if not value:
         raise ValidationError("At least one actor is required")
-    
-    # If value[0] is not of type Actor, we check if it is a dict
-    # containing the name and surname of the actor and we get or create it
 
-    actors = []
+    # Each actor is a dict containing the name and surname of the actor
+    people = []
     for actor in value:
 
         # Check that it is a dictionary
         if not isinstance(actor, dict):
-            raise serializer.ValidationError("Actors must be a list of dictionaries")
+            raise ValidationError("Actors must be a list of dictionaries")
 
         name = actor.get('name')
         surname = actor.get('surname')
 
         # If name and surname are not none
         if name and surname:
-            actor, created = Actors.get_or_create_normalized(name=name, surname=surname)
-            actors.append(actor.pk)
+            people.append((name, surname))
         else:
             raise ValidationError("Name and surname are required")
-    return actors
 
-    # if not, we return the list of actors
-    return value
+    # We get or create all the actors at once
+    return resolve_people(Actors, people)
 
 def validate_director(value, serializer):
     if not value:
@@ -900,35 +1165,25 @@ def validate_director(value, serializer):
 
     # If name and surname are not none
     if name and surname:
-        director, created = Directors.get_or_create_normalized(name=name, surname=surname)
-        return director.pk
+        return resolve_people(Directors, [(name, surname)])[0]
     else:
         raise ValidationError("Name and surname are required")
 
-    # if not, we return the director
-    return value
-
 
 def validate_genres(value, serializer):
     if not value:
         raise ValidationError("At least one genre is required")
-    
-    # If value[0] is not of type Category, we check if it is a string
-    # containing the name of the category and we get or create it
-    genres = []
+
+    # Each genre is a string containing the name of the category
     for genre in value:
 
         # Check that it is a string
         if not isinstance(genre, str):
             raise ValidationError("Genres must be a list of strings")
 
-        # If name is not none
-        if genre:
-            genre, created = Categories.get_or_create_normalized(name=genre)
-            genres.append(genre.pk)
-        else:
+        # If name is none
+        if not genre:
             raise ValidationError("Name is required")
-    return genres
 
-    # if not, we return the list of genres
-    return value
\ No newline at end of file
+    # We get or create all the genres at once
+    return resolve_genres(value)
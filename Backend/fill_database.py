@@ -1,12 +1,16 @@
 import os
+import shutil
 import django
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Backend.settings')
 django.setup()
 
+from django.core.management import call_command
+
+from Filmaffinity.importer import MovieImporter, RatingImporter
 from Filmaffinity.models import Movies, Actors, Directors, Categories, PlatformUsers, Rating
-from Filmaffinity.serializers import MoviesSerializer, UsersSerializer, RatingSerializer
-from django.core.files import File
+from Filmaffinity.normalization import normalize
+from Filmaffinity.serializers import UsersSerializer
 
 
 # Get the directory of the current file (create_movies.py)
@@ -328,62 +332,21 @@ def create_users(user_data_list):
                   f"with ID: {user.id}")
 
 
-def add_movie(movie_data):
-    director_data = movie_data.pop('director')
-    director, created = Directors.get_or_create_normalized(**director_data)
-
-    actors_data = movie_data.pop('actors')
-    actor_ids = []
-    for actor_data in actors_data:
-        actor, created = Actors.get_or_create_normalized(**actor_data)
-        actor_ids.append(actor.id)
-
-    genres_data = movie_data.pop('genres')
-    genre_ids = []
-    for genre_name in genres_data:
-        genre, created = Categories.get_or_create_normalized(name=genre_name.strip().title())
-        genre_ids.append(genre.id)
-
-    poster_path = movie_data.pop('poster', None)
-    movie_data.update({'director': director.id, 'actors': actor_ids, 'genres': genre_ids})
-
-    serializer = MoviesSerializer(data=movie_data)
-    if serializer.is_valid():
-        movie = serializer.save()
-        if poster_path:
-            with open(poster_path, 'rb') as f:
-                movie.poster.save(os.path.basename(poster_path), File(f), save=True)
-        print(f"Movie '{movie.title}' added successfully with ID: {movie.id}")
-    else:
-        print(f"Failed to add movie '{movie_data.get('title')}': {serializer.errors}")
-
-
 def add_review():
-    for rating_data in ratings_data:
-        user_email = rating_data.pop('user_email')
-        movie_title = rating_data.pop('movie_title')
-
-        try:
-            user = PlatformUsers.objects.get(email=user_email)
-        except PlatformUsers.DoesNotExist:
-            print(f"User with email '{user_email}' not found.")
-            continue
-
-        try:
-            movie = Movies.objects.get(title=movie_title)
-        except Movies.DoesNotExist:
-            print(f"Movie with title '{movie_title}' not found.")
-            continue
+    # Las valoraciones se importan en bloque, ver el comando import_ratings
+    movie_ids = dict(Movies.objects.values_list('title', 'pk'))
+    ratings = [{'user': rating_data['user_email'],
+                'movie': movie_ids.get(normalize(rating_data['movie_title'])),
+                'rating': rating_data['rating'],
+                'comment': rating_data['comment']} for rating_data in ratings_data]
 
-        rating_data.update({'user': user.id, 'movie': movie.id})
-        rating_serializer = RatingSerializer(data=rating_data)
-        if rating_serializer.is_valid():
-            rating = rating_serializer.save()
-            print(f"Rating for movie '{movie.title}' by user '{user.email}' " +
-                  f"added successfully with ID: {rating.id}")
-        else:
-            print(f"Failed to add rating for movie '{movie_title}' " +
-                  f"by user '{user_email}': {rating_serializer.errors}")
+    importer = RatingImporter()
+    importer.import_ratings(ratings)
+    for position, error in sorted(importer.errors):
+        rating_data = ratings_data[position - 1]
+        print(f"Failed to add rating for movie '{rating_data['movie_title']}' " +
+              f"by user '{rating_data['user_email']}': {error}")
+    print(f"{importer.imported} ratings added successfully")
 
 
 # Ejecutar la adición de películas
@@ -404,23 +367,24 @@ if __name__ == "__main__":
     admin.set_password('Pass1234')
     admin.save()
 
-    # Borramos las imágenes en la carpeta de posters
-    posters_directory = os.path.join(current_directory, 'posters')
-
-    # Solo si la carpeta existe
-    if os.path.exists(posters_directory):
-        for file in os.listdir(posters_directory):
-            os.remove(os.path.join(posters_directory, file))
+    # Borramos los posters que ya no usa ninguna película. Los posters se
+    # guardan con el hash de su contenido, así que no se duplican al volver a cargarlos
+    call_command('gc_posters', min_age=0)
 
-    # Cargamos el poster por defecto a la carpeta de posters
-    default_poster_path = os.path.join(current_directory, '..', 'Posters_to_load', 'default.png')
-    with open(default_poster_path, 'rb') as f:
-        default_poster_path = os.path.join(posters_directory, 'default.png')
-        with open(default_poster_path, 'wb') as poster_file:
-            poster_file.write(f.read())
+    # Cargamos el poster por defecto a la carpeta de posters si no está
+    posters_directory = os.path.join(current_directory, 'posters')
+    default_poster_path = os.path.join(posters_directory, 'default.png')
+    if not os.path.exists(default_poster_path):
+        os.makedirs(posters_directory, exist_ok=True)
+        shutil.copyfile(os.path.join(current_directory, '..', 'Posters_to_load', 'default.png'),
+                        default_poster_path)
 
-    for movie in movie_list:
-        add_movie(movie)
+    # Las películas se importan en bloque, ver el comando import_movies
+    importer = MovieImporter()
+    importer.import_movies(movie_list)
+    for position, error in importer.errors:
+        print(f"Failed to add movie '{movie_list[position - 1].get('title')}': {error}")
+    print(f"{importer.imported} movies added successfully")
 
     create_users(user_data_list)
 